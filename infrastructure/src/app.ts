@@ -66,6 +66,9 @@ const sentinelTopicArn = (app.node.tryGetContext('sentinelTopicArn') as string)
 const sentinelApiUrl = (app.node.tryGetContext('sentinelApiUrl') as string) ?? 'https://earth-search.aws.element84.com/v1';
 const sentinelCollection = (app.node.tryGetContext('sentinelCollection') as string) ?? 'sentinel-2-c1-l2a';
 
+// additional spectral indices computed by the processor and served by the tiler (e.g. 'ndre,evi,savi'), none by default
+const spectralIndices = (app.node.tryGetContext('spectralIndices') as string) ?? '';
+
 // user VPC config
 const useExistingVpc = tryGetBooleanContext(app, 'useExistingVpc', false);
 
@@ -157,6 +160,7 @@ const deployPlatform = (callerEnvironment?: { accountId?: string; region?: strin
 		stacApiResourceArn: stacServerStack.stacApiResourceArn,
 		sentinelApiUrl,
 		sentinelCollection,
+		spectralIndices,
 		env: {
 			region: callerEnvironment?.region,
 			account: callerEnvironment?.accountId,
@@ -259,6 +263,7 @@ const deployPlatform = (callerEnvironment?: { accountId?: string; region?: strin
 		environment,
 		stacApiEndpoint: stacServerStack.stacApiEndpoint,
 		stacApiResourceArn: stacServerStack.stacApiResourceArn,
+		spectralIndices,
 		env: {
 			region: callerEnvironment?.region,
 			account: callerEnvironment?.accountId,
@@ -58,6 +58,7 @@ export interface EngineConstructProperties {
 	readonly stacApiResourceArn: string;
 	readonly sentinelApiUrl: string;
 	readonly sentinelCollection: string;
+	readonly spectralIndices: string;
 	readonly cognitoUserPoolId: string;
 	readonly cognitoClientId: string;
 	readonly policyStoreId: string;
@@ -174,6 +175,7 @@ export class EngineConstruct extends Construct {
 					STAC_API_ENDPOINT: props.stacApiEndpoint,
 					SENTINEL_API_URL: props.sentinelApiUrl,
 					SENTINEL_COLLECTION: props.sentinelCollection,
+					SPECTRAL_INDICES: props.spectralIndices,
 				},
 			}),
 			propagateTags: true,
@@ -287,6 +289,7 @@ export class EngineConstruct extends Construct {
 						STAC_API_ENDPOINT: props.stacApiEndpoint,
 						SENTINEL_API_URL: props.sentinelApiUrl,
 						SENTINEL_COLLECTION: props.sentinelCollection,
+						SPECTRAL_INDICES: props.spectralIndices,
 					},
 					id: defaultEngineId,
 					image: engineProcessorContainerAsset.imageUri,
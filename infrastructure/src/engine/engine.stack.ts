@@ -29,6 +29,7 @@ export type EngineStackProperties = StackProps & {
 	readonly stacApiResourceArn: string;
 	readonly sentinelApiUrl: string;
 	readonly sentinelCollection: string;
+	readonly spectralIndices: string;
 };
 
 export class EngineStack extends cdk.Stack {
@@ -69,6 +70,7 @@ export class EngineStack extends cdk.Stack {
 			stacApiResourceArn: props.stacApiResourceArn,
 			sentinelApiUrl: props.sentinelApiUrl,
 			sentinelCollection: props.sentinelCollection,
+			spectralIndices: props.spectralIndices,
 			cognitoClientId,
 			cognitoUserPoolId,
 			policyStoreId,
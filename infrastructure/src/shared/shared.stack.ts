@@ -12,7 +12,7 @@
  */
 
 import { Bus, S3 } from '@agie/cdk-common';
-import { Stack, StackProps } from 'aws-cdk-lib';
+import { Duration, Stack, StackProps } from 'aws-cdk-lib';
 import { IVpc } from 'aws-cdk-lib/aws-ec2';
 import { NagSuppressions } from 'cdk-nag';
 import type { Construct } from 'constructs';
@@ -22,6 +22,10 @@ import { AgieVpcConfig, Network } from './network.construct.js';
 import { VerifiedPermissions } from './verifiedPermissions.construct.js';
 import { VerifiedPermissionsIdentitySourceCreator } from './verifiedPermissionsIdentitySourceCreator.construct.js';
 
+// rendered tiles cached by the tiler in the shared bucket, they are only served while younger than the TTL
+export const tileCachePrefix = 'tile-cache';
+export const tileCacheTtl = Duration.minutes(5);
+
 export type SharedStackProperties = StackProps & {
 	environment: string;
 	administratorEmail: string;
@@ -55,6 +59,15 @@ export class SharedInfrastructureStack extends Stack {
 			bucketName,
 			cdkResourceNamePrefix: 'Shared',
 			deleteBucket: props.deleteBucket,
+			lifecycleRules: [
+				{
+					id: 'tile-cache',
+					prefix: `${tileCachePrefix}/`,
+					// expirations are in whole days, the expired tiles are left for at most a day past their TTL
+					expiration: Duration.days(Math.max(1, Math.ceil(tileCacheTtl.toDays({ integral: false })))),
+					noncurrentVersionExpiration: Duration.days(1),
+				},
+			],
 		});
 
 		this.bucketName = s3.bucketName;
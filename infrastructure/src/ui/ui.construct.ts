@@ -12,6 +12,7 @@
  */
 
 import { getLambdaArchitecture } from '@agie/cdk-common';
+import { RESULTS_EVENT_SOURCE, RESULTS_RESULT_UPDATED_EVENT } from '@agie/events';
 import { IdentityPool, UserPoolAuthenticationProvider } from '@aws-cdk/aws-cognito-identitypool-alpha';
 import * as cdk from 'aws-cdk-lib';
 import { Duration, Stack } from 'aws-cdk-lib';
@@ -20,17 +21,22 @@ import { CorsHttpMethod, HttpApi, HttpMethod } from 'aws-cdk-lib/aws-apigatewayv
 import { HttpUserPoolAuthorizer } from 'aws-cdk-lib/aws-apigatewayv2-authorizers';
 import { HttpLambdaIntegration } from 'aws-cdk-lib/aws-apigatewayv2-integrations';
 import { IUserPoolClient, UserPool, UserPoolClient } from 'aws-cdk-lib/aws-cognito';
-import { Effect, PolicyStatement } from 'aws-cdk-lib/aws-iam';
+import { EventBus, Rule } from 'aws-cdk-lib/aws-events';
+import { LambdaFunction } from 'aws-cdk-lib/aws-events-targets';
+import { AnyPrincipal, Effect, PolicyStatement } from 'aws-cdk-lib/aws-iam';
 import { Code, Function, Handler, Runtime, Tracing } from 'aws-cdk-lib/aws-lambda';
+import { SqsDestination } from 'aws-cdk-lib/aws-lambda-destinations';
 import { CfnMap } from 'aws-cdk-lib/aws-location';
 import { RetentionDays } from 'aws-cdk-lib/aws-logs';
 import { Bucket } from 'aws-cdk-lib/aws-s3';
+import { Queue } from 'aws-cdk-lib/aws-sqs';
 import { StringParameter } from 'aws-cdk-lib/aws-ssm';
 import { NagSuppressions } from 'cdk-nag';
 import { Construct } from 'constructs';
 import path from 'path';
 import { fileURLToPath } from 'url';
 import { userPoolClientIdParameter } from '../shared/cognito.construct.js';
+import { tileCachePrefix, tileCacheTtl } from '../shared/shared.stack.js';
 import { StaticSite } from './ui.staticSite.construct.js';
 
 const __filename = fileURLToPath(import.meta.url);
@@ -40,8 +46,10 @@ export interface UIConstructProperties {
 	environment: string;
 	cognitoUserPoolId: string;
 	bucketName: string;
+	eventBusName: string;
 	stacApiEndpoint: string;
 	stacApiResourceArn: string;
+	spectralIndices: string;
 }
 
 export const uiApiUrlParameter = (environment: string) => `/agie/${environment}/ui/apiUrl`;
@@ -82,6 +90,7 @@ export class UIModule extends Construct {
 			environment: {
 				ENVIRONMENT: props.environment,
 				STAC_URL: props.stacApiEndpoint,
+				SPECTRAL_INDICES: props.spectralIndices,
 				ROOT_PATH: '/prod',
 				GDAL_CACHEMAX: '200', // 200 mb
 				GDAL_DISABLE_READDIR_ON_OPEN: 'EMPTY_DIR',
@@ -92,6 +101,13 @@ export class UIModule extends Construct {
 				PYTHONWARNINGS: 'ignore',
 				VSI_CACHE: 'TRUE',
 				VSI_CACHE_SIZE: '5000000', // 5 MB (per file-handle)
+				TILE_CACHE_BUCKET: props.bucketName,
+				TILE_CACHE_PREFIX: tileCachePrefix,
+				TILE_CACHE_TTL: tileCacheTtl.toSeconds().toString(),
+				MOSAIC_INDEX_BUCKET: props.bucketName,
+				MOSAIC_INDEX_PREFIX: 'mosaic-index',
+				TILE_SEED_BUCKET: props.bucketName,
+				TILE_SEED_PREFIX: 'tile-seed',
 			},
 			architecture: getLambdaArchitecture(scope),
 		});
@@ -110,6 +126,110 @@ export class UIModule extends Construct {
 
 		const dataBucket = Bucket.fromBucketName(this, 'DataBucket', props.bucketName);
 		dataBucket.grantRead(apiLambda);
+		// shared tier of the rendered tile cache
+		dataBucket.grantPut(apiLambda, `${tileCachePrefix}/*`);
+
+		/**
+		 * Lambda (same image as the tiler) rebuilding the quadkey index of a region when one of its results is published,
+		 * then seeding the low zoom tile pyramid of the region
+		 */
+		const indexerLambda = new Function(this, 'TilerIndexerLambda', {
+			functionName: `${namePrefix}-tiler-indexer`,
+			description: `AGIE: UI Tiler mosaic indexer: ${props.environment}`,
+			runtime: Runtime.FROM_IMAGE,
+			tracing: Tracing.ACTIVE,
+			code: Code.fromAssetImage(path.join(__dirname, '../../../python/apps/tiler/lambda'), {
+				file: 'Dockerfile',
+				buildArgs: {
+					ENVIRONMENT: props.environment,
+				},
+				cmd: ['api.indexer.handler'],
+			}),
+			handler: Handler.FROM_IMAGE,
+			memorySize: 1769,
+			timeout: Duration.minutes(15),
+			logRetention: RetentionDays.ONE_WEEK,
+			environment: {
+				ENVIRONMENT: props.environment,
+				STAC_URL: props.stacApiEndpoint,
+				SPECTRAL_INDICES: props.spectralIndices,
+				MOSAIC_INDEX_BUCKET: props.bucketName,
+				MOSAIC_INDEX_PREFIX: 'mosaic-index',
+				// the processor inputs of a result, one per polygon, tell the indexer how many items to wait for
+				ENGINE_INPUT_BUCKET: props.bucketName,
+				TILE_SEED_BUCKET: props.bucketName,
+				TILE_SEED_PREFIX: 'tile-seed',
+				GDAL_CACHEMAX: '200', // 200 mb
+				GDAL_DISABLE_READDIR_ON_OPEN: 'EMPTY_DIR',
+				GDAL_INGESTED_BYTES_AT_OPEN: '32768', // get more bytes when opening the files.
+				GDAL_HTTP_MERGE_CONSECUTIVE_RANGES: 'YES',
+				GDAL_HTTP_MULTIPLEX: 'YES',
+				GDAL_HTTP_VERSION: '2',
+				PYTHONWARNINGS: 'ignore',
+				VSI_CACHE: 'TRUE',
+				VSI_CACHE_SIZE: '5000000', // 5 MB (per file-handle)
+			},
+			architecture: getLambdaArchitecture(scope),
+		});
+
+		indexerLambda.addToRolePolicy(
+			new PolicyStatement({
+				actions: ['execute-api:Invoke'],
+				effect: Effect.ALLOW,
+				resources: [props.stacApiResourceArn],
+			})
+		);
+		dataBucket.grantReadWrite(indexerLambda, 'mosaic-index/*');
+		// the seeded tiles are rendered out of the result assets
+		dataBucket.grantRead(indexerLambda);
+		dataBucket.grantPut(indexerLambda, 'tile-seed/*');
+
+		const eventBus = EventBus.fromEventBusName(this, 'EventBus', props.eventBusName);
+
+		const resultSucceededRule = new Rule(this, 'ResultSucceededRule', {
+			eventBus: eventBus,
+			eventPattern: {
+				detailType: [RESULTS_RESULT_UPDATED_EVENT],
+				source: [RESULTS_EVENT_SOURCE],
+				// Result>updated events are DomainEvents, the updated result is under `new`
+				detail: {
+					new: {
+						status: ['succeeded'],
+					},
+				},
+			},
+		});
+
+		const indexerDLQ = new Queue(this, 'TilerIndexerDLQ');
+
+		indexerDLQ.addToResourcePolicy(
+			new PolicyStatement({
+				sid: 'enforce-ssl',
+				effect: Effect.DENY,
+				principals: [new AnyPrincipal()],
+				actions: ['sqs:*'],
+				resources: [indexerDLQ.queueArn],
+				conditions: {
+					Bool: {
+						'aws:SecureTransport': 'false',
+					},
+				},
+			})
+		);
+
+		// an index whose result items are not all searchable yet fails the invocation, which is retried asynchronously
+		indexerLambda.configureAsyncInvoke({
+			retryAttempts: 2,
+			onFailure: new SqsDestination(indexerDLQ),
+		});
+
+		resultSucceededRule.addTarget(
+			new LambdaFunction(indexerLambda, {
+				deadLetterQueue: indexerDLQ,
+				maxEventAge: Duration.minutes(5),
+				retryAttempts: 2,
+			})
+		);
 
 		const userPool = UserPool.fromUserPoolId(this, 'UserPool', props.cognitoUserPoolId);
 
@@ -221,6 +341,52 @@ export class UIModule extends Construct {
 			true
 		);
 
+		NagSuppressions.addResourceSuppressions(
+			[indexerLambda],
+			[
+				{
+					id: 'AwsSolutions-IAM4',
+					appliesTo: ['Policy::arn:<AWS::Partition>:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole'],
+					reason: 'This policy is the one generated by CDK.',
+				},
+				{
+					id: 'AwsSolutions-IAM5',
+					appliesTo: ['Resource::*'],
+					reason: 'The resource condition in the IAM policy is generated by CDK, this only applies to xray:PutTelemetryRecords and xray:PutTraceSegments actions.',
+				},
+				{
+					id: 'AwsSolutions-L1',
+					reason: 'The Titiler package recommends a specific python version (3.11).',
+				},
+				{
+					id: 'AwsSolutions-IAM5',
+					appliesTo: [
+						'Resource::arn:<AWS::Partition>:s3:::<bucketNameParameter>/*',
+						'Resource::arn:<AWS::Partition>:s3:::<bucketNameParameter>/mosaic-index/*',
+						'Resource::arn:<AWS::Partition>:s3:::<bucketNameParameter>/tile-seed/*',
+						'Action::s3:GetObject*',
+						'Action::s3:GetBucket*',
+						'Action::s3:List*',
+						'Action::s3:DeleteObject*',
+						'Action::s3:Abort*',
+					],
+					reason: 'The indexer reads the result assets, and writes the indexes and seeded tiles under their prefixes.',
+				},
+			],
+			true
+		);
+
+		NagSuppressions.addResourceSuppressions(
+			[indexerDLQ],
+			[
+				{
+					id: 'AwsSolutions-SQS3',
+					reason: 'This is the dead letter queue.',
+				},
+			],
+			true
+		);
+
 		NagSuppressions.addResourceSuppressions(
 			[httpApi],
 			[
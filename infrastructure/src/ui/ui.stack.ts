@@ -11,7 +11,7 @@
  *  and limitations under the License.
  */
 
-import { bucketNameParameter } from '@agie/cdk-common';
+import { bucketNameParameter, eventBusNameParameter } from '@agie/cdk-common';
 import { CfnOutput, Stack, StackProps } from 'aws-cdk-lib';
 import { StringParameter } from 'aws-cdk-lib/aws-ssm';
 import { NagSuppressions } from 'cdk-nag';
@@ -23,6 +23,7 @@ export type UIStackProperties = StackProps & {
 	environment: string;
 	stacApiEndpoint: string;
 	stacApiResourceArn: string;
+	spectralIndices: string;
 };
 
 export class UIApiStack extends Stack {
@@ -42,12 +43,19 @@ export class UIApiStack extends Stack {
 			simpleName: false,
 		}).stringValue;
 
+		const eventBusName = StringParameter.fromStringParameterAttributes(this, 'eventBusName', {
+			parameterName: eventBusNameParameter(props.environment),
+			simpleName: false,
+		}).stringValue;
+
 		const uiModule = new UIModule(this, 'UIModule', {
 			environment: props.environment,
 			cognitoUserPoolId,
 			bucketName,
+			eventBusName,
 			stacApiEndpoint: props.stacApiEndpoint,
-			stacApiResourceArn: props.stacApiResourceArn
+			stacApiResourceArn: props.stacApiResourceArn,
+			spectralIndices: props.spectralIndices,
 		});
 
 		NagSuppressions.addResourceSuppressionsByPath(
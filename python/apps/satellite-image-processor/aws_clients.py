@@ -0,0 +1,43 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+import threading
+from typing import Any, Dict
+
+import boto3
+from botocore.config import Config
+
+_lock = threading.Lock()
+_session: boto3.session.Session = None
+_clients: Dict[str, Any] = {}
+
+
+def get_session() -> boto3.session.Session:
+	"""
+	Returns the process wide boto3 session, its credentials are refreshed by botocore when they near expiry.
+	"""
+	global _session
+	with _lock:
+		if _session is None:
+			_session = boto3.session.Session()
+		return _session
+
+
+def get_client(service_name: str) -> Any:
+	"""
+	Returns a process wide client for the service. boto3 clients are thread safe, so one client (and its connection
+	pool) is shared by every task of a long-lived worker instead of being created for each call.
+	"""
+	session = get_session()
+	with _lock:
+		if service_name not in _clients:
+			_clients[service_name] = session.client(service_name, config=Config(max_pool_connections=50))
+		return _clients[service_name]
@@ -0,0 +1,144 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+import json
+import os
+from logging import Logger
+from typing import Optional, List, Dict, Any
+
+import fsspec
+import numpy as np
+import xarray as xr
+from numpy import ndarray
+from pystac import Item
+from xarray import Dataset
+
+from logger_utils import get_logger
+
+# Root of the stage checkpoints, either an S3 url (e.g. s3://<output bucket>/checkpoints) or a local directory
+CHECKPOINT_ROOT = os.getenv("CHECKPOINT_ROOT")
+
+logger: Logger = get_logger()
+
+
+class CheckpointStage:
+	LOADED = "loaded"
+	COMPUTED = "computed"
+	UPLOADED = "uploaded"
+
+	order = [LOADED, COMPUTED, UPLOADED]
+
+
+class CheckpointStore:
+	"""
+	Persists the intermediates of a processor job per result and polygon, so a job which is interrupted (e.g. Spot
+	capacity being reclaimed) resumes from its last completed stage when retried instead of starting over.
+	"""
+
+	def __init__(self, root: str, result_id: str, polygon_id: str):
+		self.fs, root_path = fsspec.core.url_to_fs(root)
+		self.path = "{}/{}/{}".format(root_path.rstrip("/"), result_id, polygon_id)
+		self._manifest: Optional[Dict[str, Any]] = None
+
+	@staticmethod
+	def for_request(result_id: str, polygon_id: str) -> Optional['CheckpointStore']:
+		if CHECKPOINT_ROOT is None:
+			return None
+		return CheckpointStore(CHECKPOINT_ROOT, result_id, polygon_id)
+
+	@property
+	def manifest(self) -> Dict[str, Any]:
+		if self._manifest is None:
+			manifest_path = self._file('manifest.json')
+			if self.fs.exists(manifest_path):
+				with self.fs.open(manifest_path, 'r') as f:
+					self._manifest = json.load(f)
+			else:
+				self._manifest = {}
+		return self._manifest
+
+	def last_completed_stage(self) -> Optional[str]:
+		return self.manifest.get('stage')
+
+	def has_completed(self, stage: str) -> bool:
+		last_stage = self.last_completed_stage()
+		return last_stage is not None and CheckpointStage.order.index(last_stage) >= CheckpointStage.order.index(stage)
+
+	def save_loaded(self, stac_assets: Dataset, previous_ndvi_raster: Optional[ndarray], stac_items: List[Item], bounding_box: ndarray):
+		self._save_dataset(CheckpointStage.LOADED, stac_assets)
+		if previous_ndvi_raster is not None:
+			with self.fs.open(self._file('previous_ndvi.npy'), 'wb') as f:
+				np.save(f, previous_ndvi_raster)
+		self._save_manifest(CheckpointStage.LOADED, {
+			'stac_items': [item.to_dict() for item in stac_items],
+			'bounding_box': bounding_box.tolist(),
+			'has_previous_ndvi': previous_ndvi_raster is not None,
+			'crs': stac_assets.rio.crs.to_wkt() if stac_assets.rio.crs is not None else None,
+		})
+
+	def save_computed(self, stac_assets: Dataset):
+		self._save_dataset(CheckpointStage.COMPUTED, stac_assets)
+		self._save_manifest(CheckpointStage.COMPUTED)
+
+	def save_uploaded(self, **details: Any):
+		self._save_manifest(CheckpointStage.UPLOADED, details)
+		# the datasets are no longer needed once the assets are in the output bucket
+		for stage in (CheckpointStage.LOADED, CheckpointStage.COMPUTED):
+			if self.fs.exists(self._file('{}.zarr'.format(stage))):
+				self.fs.rm(self._file('{}.zarr'.format(stage)), recursive=True)
+
+	def load_dataset(self, stage: str, lazy: bool = False) -> Dataset:
+		"""
+		Returns the dataset of the stage, lazy (chunked as stored) when the caller streams it (e.g. to the spill store)
+		instead of holding the whole cube in memory.
+		"""
+		stac_assets = xr.open_zarr(self.fs.get_mapper(self._file('{}.zarr'.format(stage))), decode_coords='all')
+		if not lazy:
+			stac_assets = stac_assets.load()
+		# the zarr encoding of the checkpoint must not leak into the outputs written from this dataset
+		for variable in stac_assets.variables.values():
+			variable.encoding = {}
+		if self.manifest.get('crs') is not None:
+			stac_assets = stac_assets.rio.write_crs(self.manifest['crs'])
+		return stac_assets
+
+	def load_previous_ndvi_raster(self) -> Optional[ndarray]:
+		if not self.manifest.get('has_previous_ndvi'):
+			return None
+		with self.fs.open(self._file('previous_ndvi.npy'), 'rb') as f:
+			return np.load(f)
+
+	def load_stac_items(self) -> List[Item]:
+		return [Item.from_dict(item) for item in self.manifest['stac_items']]
+
+	def load_bounding_box(self) -> ndarray:
+		return np.array(self.manifest['bounding_box'])
+
+	def load_summary(self) -> Optional[Dict[str, Any]]:
+		return self.manifest.get('summary')
+
+	def clear(self):
+		if self.fs.exists(self.path):
+			self.fs.rm(self.path, recursive=True)
+
+	def _save_dataset(self, stage: str, stac_assets: Dataset):
+		stac_assets.to_zarr(self.fs.get_mapper(self._file('{}.zarr'.format(stage))), mode='w', consolidated=True)
+
+	def _save_manifest(self, stage: str, details: Optional[Dict[str, Any]] = None):
+		manifest = {**self.manifest, **(details or {}), 'stage': stage}
+		# the manifest is written last, a stage only counts as completed once its data is fully persisted
+		with self.fs.open(self._file('manifest.json'), 'w') as f:
+			json.dump(manifest, f)
+		self._manifest = manifest
+		logger.info("Checkpoint {} saved to {}".format(stage, self.path))
+
+	def _file(self, name: str) -> str:
+		return "{}/{}".format(self.path, name)
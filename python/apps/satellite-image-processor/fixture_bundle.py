@@ -0,0 +1,156 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+import hashlib
+import json
+import os
+from logging import Logger
+from typing import List, Optional, Dict, Any
+
+import numpy as np
+import rasterio
+from numpy import ndarray
+from pystac import Item
+from rasterio.warp import transform_bounds
+from rasterio.windows import Window, from_bounds
+
+from logger_utils import get_logger
+from scene_preprocessor import ScenePreprocessor
+from processors.spectral_index_engine import SpectralIndexEngine
+from stac_catalog_processor import STACCatalogProcessor, EngineRequest
+
+# When enabled, start_task records every input of the run into a fixture bundle uploaded under captures/ in the output bucket
+CAPTURE_BUNDLE = os.getenv("CAPTURE_BUNDLE", "false").lower() == "true"
+
+logger: Logger = get_logger()
+
+
+class FixtureBundle:
+	"""
+	Everything a processor run reads from the network: the input JSON, the Earth Search responses, the windows of the
+	COGs which are read and the previous result raster. A bundle replays the full pipeline offline and deterministically.
+
+	Layout:
+		input.json             engine request input
+		stac_items.json        items returned by the Earth Search search (FeatureCollection)
+		previous_ndvi.npy      previous result raster (when the request has one)
+		cogs/<hash>.tif        windows of the Sentinel COGs covering the area of interest, at native resolution
+	"""
+
+	capture_band_ids = ("red", "green", "blue", "nir08", "scl")
+
+	def __init__(self, path: str):
+		self.path = path
+		os.makedirs(os.path.join(self.path, 'cogs'), exist_ok=True)
+
+	def save_input(self, data: Dict[str, Any]):
+		self._save_json('input.json', data)
+
+	def load_input(self) -> Dict[str, Any]:
+		return self._load_json('input.json')
+
+	def save_stac_items(self, stac_items: List[Item], bounding_box: ndarray):
+		bands = self.capture_band_ids + tuple(band for band in SpectralIndexEngine.enabled().required_bands if band not in self.capture_band_ids)
+		features = []
+		for item in stac_items:
+			feature = item.to_dict()
+			# the assets are rewritten to point at the captured windows (relative to the bundle)
+			feature['assets'] = {band: self._capture_asset(item, band, bounding_box) for band in bands if band in item.assets}
+			features.append(feature)
+		self._save_json('stac_items.json', {"type": "FeatureCollection", "features": features})
+
+	def load_stac_items(self) -> List[Item]:
+		items = []
+		for feature in self._load_json('stac_items.json')['features']:
+			for asset in feature['assets'].values():
+				asset['href'] = os.path.join(self.path, asset['href'])
+			items.append(Item.from_dict(feature))
+		return items
+
+	def save_previous_ndvi_raster(self, previous_ndvi_raster: Optional[ndarray]):
+		if previous_ndvi_raster is not None:
+			np.save(os.path.join(self.path, 'previous_ndvi.npy'), previous_ndvi_raster)
+
+	def load_previous_ndvi_raster(self) -> Optional[ndarray]:
+		previous_path = os.path.join(self.path, 'previous_ndvi.npy')
+		return np.load(previous_path) if os.path.exists(previous_path) else None
+
+	def _capture_asset(self, item: Item, band: str, bounding_box: ndarray) -> Dict[str, Any]:
+		asset = item.assets[band].to_dict()
+		href = item.assets[band].get_absolute_href()
+		relative_path = os.path.join('cogs', "{}.tif".format(hashlib.sha1(href.encode()).hexdigest()))
+
+		with rasterio.open(href) as src:
+			bounds = transform_bounds('epsg:4326', src.crs, *bounding_box.tolist())
+			window = from_bounds(*bounds, transform=src.transform).round_offsets().round_lengths()
+			# a few pixels of margin so the replayed reads are not affected by resampling at the edges
+			window = Window(window.col_off - 2, window.row_off - 2, window.width + 4, window.height + 4)
+			window = window.intersection(Window(0, 0, src.width, src.height))
+			profile = src.profile.copy()
+			profile.update(driver='GTiff', width=window.width, height=window.height, transform=src.window_transform(window), tiled=False)
+			profile.pop('blockxsize', None)
+			profile.pop('blockysize', None)
+			with rasterio.open(os.path.join(self.path, relative_path), 'w', **profile) as dst:
+				dst.write(src.read(window=window))
+
+		asset['href'] = relative_path
+		asset['proj:shape'] = [window.height, window.width]
+		asset['proj:transform'] = list(profile['transform'])[:6]
+		logger.info("Captured window {} of {}".format(window, href))
+		return asset
+
+	def _save_json(self, name: str, content: Dict[str, Any]):
+		with open(os.path.join(self.path, name), 'w') as f:
+			json.dump(content, f)
+
+	def _load_json(self, name: str) -> Dict[str, Any]:
+		with open(os.path.join(self.path, name), 'r') as f:
+			return json.load(f)
+
+
+class CapturingSTACCatalogProcessor(STACCatalogProcessor):
+	"""
+	Records the Earth Search responses, the COG windows and the previous result raster while running as usual.
+	"""
+
+	def __init__(self, request: EngineRequest, bundle: FixtureBundle):
+		self.bundle = bundle
+		super().__init__(request)
+
+	def _load_stac_items(self, start_date_time: str, end_date_time: str, bounding_box: list[float], max_items: Optional[int] = 10) -> List[Item]:
+		stac_items = STACCatalogProcessor._load_stac_items(start_date_time, end_date_time, bounding_box, max_items)
+		self.bundle.save_stac_items(stac_items, self.bounding_box)
+		return stac_items
+
+	def _load_previous_ndvi_raster(self) -> Optional[ndarray]:
+		previous_ndvi_raster = super()._load_previous_ndvi_raster()
+		self.bundle.save_previous_ndvi_raster(previous_ndvi_raster)
+		return previous_ndvi_raster
+
+
+class ReplaySTACCatalogProcessor(STACCatalogProcessor):
+	"""
+	Serves the Earth Search responses, the COGs and the previous result raster from a bundle, without any network access.
+	"""
+
+	def __init__(self, request: EngineRequest, bundle: FixtureBundle):
+		self.bundle = bundle
+		super().__init__(request)
+
+	def _load_stac_items(self, start_date_time: str, end_date_time: str, bounding_box: list[float], max_items: Optional[int] = 10) -> List[Item]:
+		return self.bundle.load_stac_items()
+
+	def _scene_preprocessor(self) -> Optional[ScenePreprocessor]:
+		# the scene cache lives in S3, the captured raw bands are processed instead
+		return None
+
+	def _load_previous_ndvi_raster(self) -> Optional[ndarray]:
+		return self.bundle.load_previous_ndvi_raster()
@@ -12,34 +12,85 @@
 import argparse
 import json
 import os
+import shutil
+import tempfile
+import time
+from dataclasses import replace
 from datetime import datetime
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Tuple
 
-import boto3
+from pystac import Item
+from xarray import Dataset
 
+from aws_clients import get_client
+from checkpoint_store import CheckpointStage, CheckpointStore
+from fixture_bundle import CAPTURE_BUNDLE, CapturingSTACCatalogProcessor, FixtureBundle
 from logger_utils import get_logger
+from processors.base_processors import AbstractProcessor
+from processors.checkpoint_processor import CheckpointProcessor
 from processors.cloud_gap_fill_processor import CloudGapFillProcessor
 from processors.cloud_removal_processor import CloudRemovalProcessor
 from processors.metadata_utils import MetadataUtils
 from processors.nitrogen_processor import NitrogenProcessor
+from processors.spectral_index_engine import SpectralIndexEngine
+from processors.spectral_index_processor import SpectralIndexProcessor
+from processors.spill_processor import SpillProcessor
 from processors.tif_image_processor import TifImageProcessor
 from processors.ndvi_change_processor import NdviChangeProcessor
 from processors.ndvi_raw_processor import NdviRawProcessor
+from processors.zarr_cube_processor import ZarrCubeProcessor
+from spill_store import SpillStore
 from stac_catalog_processor import STACCatalogProcessor, EngineRequest
 
 logger = get_logger(__name__)
 
+# Optional Zarr analysis cube output, either one store per polygon or one store per region (one group per polygon)
+ZARR_CUBE_OUTPUT = os.getenv("ZARR_CUBE_OUTPUT")
+
 
 def publish_event(event: Dict[str, Any]):
     # Create an EventBridge client
-    eventbridge = boto3.client("events")
+    eventbridge = get_client("events")
     # Publish the event to EventBridge
     response = eventbridge.put_events(Entries=[event])
     print(response)
 
 
+def polygon_metadata_created_event(
+    request: EngineRequest,
+    event_bus_name: str,
+    aws_batch_job_id: str,
+    summary: Optional[Dict[str, Any]],
+) -> Dict[str, Any]:
+    """Returns the completion event of the polygon, its detail is the polygonProcessingDetails of the events library."""
+    detail = {
+        "groupId": request.group_id,
+        "groupName": request.group_name,
+        "polygonId": request.polygon_id,
+        "polygonName": request.polygon_name,
+        "regionId": request.region_id,
+        "regionName": request.region_name,
+        "resultId": request.result_id,
+        "jobId": aws_batch_job_id,
+        "engineOutputLocation": f"{request.output_prefix}/metadata.json",
+        "createdAt": datetime.now().isoformat(),
+        "startDateTime": request.start_date_time,
+        "endDateTime": request.end_date_time,
+    }
+    # checkpoints written before the summary existed have none to publish
+    if summary is not None:
+        detail["summary"] = summary
+
+    return {
+        "EventBusName": event_bus_name,
+        "Source": "com.aws.agie.executor",
+        "DetailType": "com.aws.agie.executor>PolygonMetadata>created",
+        "Detail": json.dumps(detail),
+    }
+
+
 def get_input_json(bucket_name, file_key):
-    s3 = boto3.client("s3")
+    s3 = get_client("s3")
     try:
         response = s3.get_object(Bucket=bucket_name, Key=file_key)
         json_data = response["Body"].read().decode("utf-8")
@@ -50,6 +101,258 @@ def get_input_json(bucket_name, file_key):
         print(f"Error: {e}")
 
 
+def get_sentinel_links(stac_items: List[Item]) -> List[Dict[str, Any]]:
+    # generate the 'derived_from' sentinel metadata
+    sentinel_link = []
+    for item in stac_items:
+        for link in item.links:
+            if link.rel == "self":
+                sentinel_link.append(
+                    {
+                        "rel": "derived_from",
+                        "href": link.href,
+                        "type": link.media_type,
+                    }
+                )
+    return sentinel_link
+
+
+def get_zarr_cube_location(
+    output_bucket: str, request: EngineRequest
+) -> Tuple[str, Optional[str]]:
+    cube_prefix = "s3://{}/analysis-cubes/{}".format(output_bucket, request.region_id)
+    if ZARR_CUBE_OUTPUT == "region":
+        return "{}.zarr".format(cube_prefix), request.polygon_id
+    return "{}/{}.zarr".format(cube_prefix, request.polygon_id), None
+
+
+def generate_time_series_outputs(
+    processor: STACCatalogProcessor,
+    stac_assets: Dataset,
+    series_dir: str,
+    output_bucket: str,
+    request: EngineRequest,
+    upload: bool = True,
+) -> Dict[str, Any]:
+    """
+    Generates the metadata of every per date output set written by the TifImageProcessor, uploads the
+    series and returns the stack assets to be referenced by the result metadata.
+    """
+    series_prefix = "{}/series".format(request.output_prefix)
+    dates = MetadataUtils.time_series_dates(stac_assets)
+    for index, date in enumerate(dates):
+        date_items = processor.items_for_solar_day(
+            stac_assets["time"].values[index].astype("datetime64[ms]").item()
+        )
+        MetadataUtils.generate_metadata(
+            get_sentinel_links(date_items),
+            processor.bounding_box,
+            MetadataUtils.time_series_slice(
+                stac_assets, index, TifImageProcessor.band_ids
+            ),
+            os.path.join(series_dir, date),
+            output_bucket,
+            replace(request, output_prefix="{}/{}".format(series_prefix, date)),
+        )
+
+    if upload:
+        MetadataUtils.upload_assets(output_bucket, series_prefix, series_dir)
+    return MetadataUtils.generate_stack_assets(
+        series_dir, output_bucket, series_prefix, dates
+    )
+
+
+def process_assets(
+    processor: STACCatalogProcessor,
+    request: EngineRequest,
+    output_bucket: str,
+    time_series: bool,
+    checkpoint_store: Optional[CheckpointStore],
+    work_dir: str,
+    upload: bool = True,
+) -> Dict[str, Any]:
+    """
+    Loads, computes, writes and uploads the assets of the request. With a checkpoint store, each stage is persisted
+    once completed and a retried job resumes after the last completed stage. Without upload, the outputs are only
+    written to the work directory (used when replaying a fixture bundle).
+
+    Returns the summary of the result to be published with the completion event.
+    """
+    spill_store = SpillStore.for_job()
+    try:
+        return _process_assets(
+            processor,
+            request,
+            output_bucket,
+            time_series,
+            checkpoint_store,
+            spill_store,
+            work_dir,
+            upload,
+        )
+    finally:
+        if spill_store is not None:
+            spill_store.close()
+
+
+def _process_assets(
+    processor: STACCatalogProcessor,
+    request: EngineRequest,
+    output_bucket: str,
+    time_series: bool,
+    checkpoint_store: Optional[CheckpointStore],
+    spill_store: Optional[SpillStore],
+    work_dir: str,
+    upload: bool,
+) -> Dict[str, Any]:
+    timings = {}
+    step_start = time.perf_counter()
+    resume_stage = (
+        checkpoint_store.last_completed_stage() if checkpoint_store is not None else None
+    )
+    if resume_stage is not None:
+        logger.info(f"Resuming from checkpoint stage {resume_stage}")
+        processor.stac_items = checkpoint_store.load_stac_items()
+        processor.bounding_box = checkpoint_store.load_bounding_box()
+        previous_ndvi_raster = checkpoint_store.load_previous_ndvi_raster()
+        # in spill mode, the checkpoint is streamed chunk by chunk into the spill files
+        stac_assets = checkpoint_store.load_dataset(
+            resume_stage, lazy=spill_store is not None
+        )
+        if spill_store is not None:
+            stac_assets = spill_store.spill(stac_assets)
+    else:
+        # Load the bands from the satellite images
+        if time_series:
+            stac_assets, previous_ndvi_raster = processor.load_stac_time_series(
+                spill_store
+            )
+        else:
+            stac_assets, previous_ndvi_raster = processor.load_stac_datasets(
+                spill_store
+            )
+        if checkpoint_store is not None:
+            checkpoint_store.save_loaded(
+                stac_assets,
+                previous_ndvi_raster,
+                processor.stac_items,
+                processor.bounding_box,
+            )
+    timings["load"] = time.perf_counter() - step_start
+
+    temp_dir = "{}/{}".format(work_dir, "output")
+    series_dir = "{}/{}".format(work_dir, "series_output")
+
+    cloud_removal_processor = CloudRemovalProcessor(previous_ndvi_raster, time_series)
+    ndvi_raw_processor = NdviRawProcessor(previous_ndvi_raster, time_series)
+    spectral_index_engine = SpectralIndexEngine.enabled()
+    cloud_gap_fill_processor = CloudGapFillProcessor(previous_ndvi_raster, time_series)
+    ndvi_change_processor = NdviChangeProcessor(previous_ndvi_raster, time_series)
+    tif_image_processor = TifImageProcessor(temp_dir, previous_ndvi_raster, time_series, series_dir)
+
+    def chain(last: AbstractProcessor, next_processor: AbstractProcessor) -> AbstractProcessor:
+        # in spill mode, the layers added by each processor are moved to disk before the next one runs
+        if spill_store is not None:
+            last = last.set_next(
+                SpillProcessor(spill_store, previous_ndvi_raster, time_series)
+            )
+        return last.set_next(next_processor)
+
+    last_processor = chain(cloud_removal_processor, ndvi_raw_processor)
+    # the additional spectral indices are all evaluated by a single processor over the shared bands
+    if spectral_index_engine.indices:
+        last_processor = chain(
+            last_processor,
+            SpectralIndexProcessor(spectral_index_engine, previous_ndvi_raster, time_series),
+        )
+    last_processor = chain(
+        chain(last_processor, cloud_gap_fill_processor), ndvi_change_processor
+    )
+
+    if checkpoint_store is not None:
+        last_processor = chain(
+            last_processor,
+            CheckpointProcessor(checkpoint_store, previous_ndvi_raster, time_series),
+        )
+    last_processor = chain(last_processor, tif_image_processor)
+
+    zarr_cube_processor = None
+    # the cube is written straight to the output bucket, a replay (without upload) must stay offline
+    if upload and ZARR_CUBE_OUTPUT in ("polygon", "region"):
+        zarr_cube_processor = ZarrCubeProcessor(
+            *get_zarr_cube_location(output_bucket, request),
+            previous_ndvi_raster,
+            time_series,
+        )
+        last_processor = last_processor.set_next(zarr_cube_processor)
+
+    # only run the nitrogen processor if we have the yield target
+    if (
+        request.state is not None
+        and request.state.attributes is not None
+        and request.state.attributes.get("estimatedYield") is not None
+    ):
+        estimated_yield = float(request.state.attributes["estimatedYield"])
+        nitrogen_processor = NitrogenProcessor(
+            temp_dir, estimated_yield, request.coordinates, previous_ndvi_raster
+        )
+        last_processor.set_next(nitrogen_processor)
+
+    step_start = time.perf_counter()
+    if resume_stage == CheckpointStage.COMPUTED:
+        # the layers are already computed, only the output processors are left to run
+        stac_assets = tif_image_processor.process(stac_assets)
+    else:
+        stac_assets = cloud_removal_processor.process(stac_assets)
+    timings["process"] = time.perf_counter() - step_start
+
+    step_start = time.perf_counter()
+    extra_assets = {}
+    if zarr_cube_processor is not None:
+        extra_assets["analysis_cube"] = zarr_cube_processor.generate_asset()
+
+    result_items = processor.stac_items
+    if time_series:
+        extra_assets.update(
+            generate_time_series_outputs(
+                processor, stac_assets, series_dir, output_bucket, request, upload
+            )
+        )
+        # the result itself describes the latest date of the series
+        result_items = processor.items_for_solar_day(
+            stac_assets["time"].values[-1].astype("datetime64[ms]").item()
+        )
+        stac_assets = MetadataUtils.time_series_slice(
+            stac_assets, -1, TifImageProcessor.band_ids
+        )
+
+    metadata = MetadataUtils.generate_metadata(
+        get_sentinel_links(result_items),
+        processor.bounding_box,
+        stac_assets,
+        temp_dir,
+        output_bucket,
+        request,
+        extra_assets,
+    )
+    timings["metadata"] = time.perf_counter() - step_start
+
+    if upload:
+        step_start = time.perf_counter()
+        MetadataUtils.upload_assets(output_bucket, request.output_prefix, temp_dir)
+        timings["upload"] = time.perf_counter() - step_start
+
+    summary = MetadataUtils.generate_event_summary(
+        metadata, [item.id for item in result_items], timings
+    )
+
+    if checkpoint_store is not None:
+        # the summary is kept so a job retried after the upload still publishes it
+        checkpoint_store.save_uploaded(summary=summary)
+
+    return summary
+
+
 def start_task(
     input_filename: str,
     input_prefix: str,
@@ -57,98 +360,68 @@ def start_task(
     output_bucket: str,
     event_bus_name: str,
     aws_batch_job_id: str,
+    work_dir: Optional[str] = None,
 ):
     logger.info(f"Starting Stac Catalog Processor Job")
+    bundle = None
     try:
         data = get_input_json(
             output_bucket,
             "{}/{}/{}".format(input_prefix, job_array_index, input_filename),
         )
         request = EngineRequest.from_dict(data)
-        processor = STACCatalogProcessor(request)
-        # Load the bands from the satellite images
-        stac_assets, previous_ndvi_raster = processor.load_stac_datasets()
-
-        temp_dir = "{}/{}".format(os.getcwd(), "output")
-
-        cloud_removal_processor = CloudRemovalProcessor(previous_ndvi_raster)
-        ndvi_raw_processor = NdviRawProcessor(previous_ndvi_raster)
-        cloud_gap_fill_processor = CloudGapFillProcessor(previous_ndvi_raster)
-        ndvi_change_processor = NdviChangeProcessor(previous_ndvi_raster)
-        tif_image_processor = TifImageProcessor(temp_dir, previous_ndvi_raster)
-        last_processor = (
-            cloud_removal_processor.set_next(ndvi_raw_processor)
-            .set_next(cloud_gap_fill_processor)
-            .set_next(ndvi_change_processor)
-            .set_next(tif_image_processor)
-        )
-
-        # only run the nitrogen processor if we have the yield target
-        if (
-            request.state is not None
-            and request.state.attributes is not None
-            and request.state.attributes.get("estimatedYield") is not None
-        ):
-            estimated_yield = float(request.state.attributes["estimatedYield"])
-            nitrogen_processor = NitrogenProcessor(
-                temp_dir, estimated_yield, request.coordinates, previous_ndvi_raster
-            )
-            last_processor.set_next(nitrogen_processor)
-
-        stac_assets = cloud_removal_processor.process(stac_assets)
-
-        # generate the 'derived_from' sentinel metadata
-        sentinel_link = []
-        for item in processor.stac_items:
-            for link in item.links:
-                if link.rel == "self":
-                    sentinel_link.append(
-                        {
-                            "rel": "derived_from",
-                            "href": link.href,
-                            "type": link.media_type,
-                        }
-                    )
-
-        MetadataUtils.generate_metadata(
-            sentinel_link,
-            processor.bounding_box,
-            stac_assets,
-            temp_dir,
-            output_bucket,
-            request,
+        if CAPTURE_BUNDLE:
+            bundle = FixtureBundle(tempfile.mkdtemp(prefix="capture_"))
+            bundle.save_input(data)
+            processor = CapturingSTACCatalogProcessor(request, bundle)
+        else:
+            processor = STACCatalogProcessor(request)
+        time_series = request.is_time_series
+        checkpoint_store = CheckpointStore.for_request(
+            request.result_id, request.polygon_id
         )
 
-        MetadataUtils.upload_assets(output_bucket, request.output_prefix, temp_dir)
+        if checkpoint_store is not None and checkpoint_store.has_completed(
+            CheckpointStage.UPLOADED
+        ):
+            logger.info("Assets already uploaded, resuming from publishing the event")
+            summary = checkpoint_store.load_summary()
+        else:
+            summary = process_assets(
+                processor,
+                request,
+                output_bucket,
+                time_series,
+                checkpoint_store,
+                work_dir or os.getcwd(),
+            )
 
         publish_event(
-            {
-                "EventBusName": event_bus_name,
-                "Source": "com.aws.agie.executor",
-                "DetailType": "com.aws.agie.executor>PolygonMetadata>created",
-                "Detail": json.dumps(
-                    {
-                        "groupId": request.group_id,
-                        "groupName": request.group_name,
-                        "polygonId": request.polygon_id,
-                        "polygonName": request.polygon_name,
-                        "regionId": request.region_id,
-                        "regionName": request.region_name,
-                        "resultId": request.result_id,
-                        "jobId": aws_batch_job_id,
-                        "engineOutputLocation": f"{request.output_prefix}/metadata.json",
-                        "createdAt": datetime.now().isoformat(),
-                        "startDateTime": request.start_date_time,
-                        "endDateTime": request.end_date_time,
-                    }
-                ),
-            }
+            polygon_metadata_created_event(
+                request, event_bus_name, aws_batch_job_id, summary
+            )
         )
 
+        if checkpoint_store is not None:
+            checkpoint_store.clear()
+
     except Exception as ex:
         logger.error("Processor failed.", exc_info=True)
         raise ex
 
+    finally:
+        # the bundle is kept for failed runs too, they are usually the ones worth replaying
+        if bundle is not None:
+            capture_prefix = "captures/{}/{}".format(request.result_id, request.polygon_id)
+            try:
+                MetadataUtils.upload_assets(output_bucket, capture_prefix, bundle.path)
+                logger.info(f"Fixture bundle uploaded to s3://{output_bucket}/{capture_prefix}")
+            except Exception:
+                # a failed upload must not mask the outcome of the run itself
+                logger.warning("Fixture bundle upload failed.", exc_info=True)
+            finally:
+                shutil.rmtree(bundle.path, ignore_errors=True)
+
 
 def main(parser):
     args = parser.parse_args()
@@ -23,8 +23,10 @@ class Processor(ABC):
 	  It also declares a method for executing a request.
 	  """
 
-	def __init__(self, previous_tif_raster: np.ndarray):
+	def __init__(self, previous_tif_raster: np.ndarray, time_series: bool = False):
 		self.previous_tif_raster = previous_tif_raster
+		# when set, the Dataset carries one slice per solar day along the time dimension (oldest first)
+		self.time_series = time_series
 		super().__init__()
 
 	@abstractmethod
@@ -0,0 +1,30 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+import numpy as np
+from xarray import Dataset
+
+from checkpoint_store import CheckpointStore
+from processors.base_processors import AbstractProcessor
+
+
+class CheckpointProcessor(AbstractProcessor):
+	"""
+	Persists the computed layers before the output processors run, so a retried job can skip the computation.
+	"""
+
+	def __init__(self, checkpoint_store: CheckpointStore, previous_tif_raster: np.ndarray, time_series: bool = False):
+		self.checkpoint_store = checkpoint_store
+		super().__init__(previous_tif_raster, time_series)
+
+	def process(self, stac_assets: Dataset) -> Dataset:
+		self.checkpoint_store.save_computed(stac_assets)
+		return super().process(stac_assets)
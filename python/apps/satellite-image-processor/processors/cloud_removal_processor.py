@@ -20,5 +20,7 @@ class CloudRemovalProcessor(AbstractProcessor):
 		if stac_assets.get('scl') is None:
 			raise ValueError('scl value is missing from Dataset')
 
-		stac_assets['scl_surface'] = XarrayUtils.remove_cloud(stac_assets[['scl']])
+		# the scene stage may already have provided the layer
+		if stac_assets.get('scl_surface') is None:
+			stac_assets['scl_surface'] = XarrayUtils.remove_cloud(stac_assets[['scl']])
 		return super().process(stac_assets)
@@ -13,20 +13,73 @@ import hashlib
 import json
 import os
 import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logging import Logger
 from typing import List, Dict, Any, Set, Tuple, Optional
-import boto3
+import dask
+import dask.array
+import fsspec
 import numpy as np
+import xarray as xr
+import zarr
+from numcodecs import Blosc
 from xarray import DataArray, Dataset
+from zarr.errors import GroupNotFoundError
 
 # This import is required to extend DataArray functionality with rioxarray
 import rioxarray
 
+from aws_clients import get_client
+from logger_utils import get_logger
 from stac_catalog_processor import EngineRequest
 import geopandas as gpd
+import rasterio
+import rasterio.shutil
 import shapely.geometry as geom
+from matplotlib import colormaps
+from PIL import Image
+
+# `float` writes the ndvi family as floats, `scaled_int16` stores them as scaled integers (value = stored * scale + offset)
+OUTPUT_ENCODING = os.getenv("OUTPUT_ENCODING", "float")
+
+SCALED_INT16_BAND_IDS = ['ndvi', 'ndvi_raw', 'ndvi_change']
+SCALED_INT16_ENCODING = {
+	"data_type": "int16",
+	"nodata": -32768,
+	"scale": 0.0001,
+	"offset": 0.0,
+}
+
+
+# Compression of the output COGs, up to OUTPUT_WRITE_THREADS of them are encoded and written at the same time and the
+# cores are shared between them (GDAL NUM_THREADS), so the job never runs more compression threads than cores
+OUTPUT_COMPRESSION = os.getenv("OUTPUT_COMPRESSION", "DEFLATE")
+OUTPUT_WRITE_THREADS = int(os.getenv("OUTPUT_WRITE_THREADS", str(os.cpu_count() or 1)))
+COG_WRITE_OPTIONS = {
+	"driver": "COG",
+	"compress": OUTPUT_COMPRESSION,
+	"num_threads": str(max(1, (os.cpu_count() or 1) // max(1, OUTPUT_WRITE_THREADS))),
+	**({"predictor": "YES"} if OUTPUT_COMPRESSION.upper() in ("DEFLATE", "LZW", "ZSTD") else {}),
+}
+
+# Quicklooks written next to the band tifs, `png` or `webp`, with the longest side at most THUMBNAIL_SIZE pixels
+THUMBNAIL_FORMAT = os.getenv("THUMBNAIL_FORMAT", "png")
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "256"))
+THUMBNAIL_BAND_IDS = ['ndvi', 'ndvi_change']
+
+# Version of the summary published in the completion event detail, to be increased on breaking changes
+EVENT_SUMMARY_VERSION = 1
+# Maximum size (in bytes) of the summary, well below the 256KB EventBridge entry limit
+EVENT_SUMMARY_MAX_SIZE = int(os.getenv("EVENT_SUMMARY_MAX_SIZE", "16384"))
+
+
+logger: Logger = get_logger()
 
 
 class MetadataUtils:
+	visual_band_ids = ['red', 'green', 'blue']
 
 	@staticmethod
 	def generate_tif_files(stac_asset: Dataset, temp_dir: str, band_ids: List[str]):
@@ -37,10 +90,274 @@ class MetadataUtils:
 
 		os.makedirs(clipped_path_parent)
 
+		start = time.perf_counter()
+		# GDAL releases the GIL while encoding and writing, so the bands are written in parallel
+		with ThreadPoolExecutor(max_workers=OUTPUT_WRITE_THREADS) as executor:
+			writes = [
+				executor.submit(MetadataUtils.write_band, stac_asset[band], band, os.path.join(clipped_path_parent, "{}.tif".format(band)))
+				for band in band_ids if stac_asset.get(band) is not None
+			]
+			if all(band in band_ids and stac_asset.get(band) is not None for band in MetadataUtils.visual_band_ids):
+				writes.append(executor.submit(MetadataUtils.generate_visual_file, stac_asset, clipped_path_parent))
+			# raises the first write error, if any
+			for write in writes:
+				write.result()
+		MetadataUtils.log_write_throughput(clipped_path_parent, time.perf_counter() - start)
+
+		MetadataUtils.generate_thumbnail_files(stac_asset, temp_dir, band_ids)
+
+	@staticmethod
+	def is_scaled_band(band: str) -> bool:
+		return OUTPUT_ENCODING == "scaled_int16" and band in SCALED_INT16_BAND_IDS
+
+	@staticmethod
+	def write_band(band_array: DataArray, band: str, tif_file_path: str):
+		# written as COGs so the headers of all the IFDs come first and the tiler can ingest them with a single range request
+		if not MetadataUtils.is_scaled_band(band):
+			MetadataUtils.write_cog(band_array, tif_file_path)
+			return
+
+		scale = SCALED_INT16_ENCODING["scale"]
+		offset = SCALED_INT16_ENCODING["offset"]
+		nodata = SCALED_INT16_ENCODING["nodata"]
+		# nodata is kept out of the valid range so no value can be mistaken for it once rounded
+		scaled = np.clip(np.round((band_array - offset) / scale), nodata + 1, np.iinfo(np.int16).max)
+		encoded = xr.where(band_array.isnull(), nodata, scaled).astype('int16')
+		# xr.where drops the attributes, the band descriptions (long_name) included
+		encoded.attrs = {name: value for name, value in band_array.attrs.items() if name not in ('_FillValue', 'nodata')}
+		encoded = encoded.rio.write_crs(band_array.rio.crs).rio.write_transform(band_array.rio.transform())
+		encoded.rio.write_nodata(nodata, inplace=True)
+		# record the scaling in the tif so GDAL based readers unscale the values as well (rioxarray writes these
+		# attributes as the band scales/offsets, updating the COG afterwards would break its layout)
+		encoded.attrs['scale_factor'] = scale
+		encoded.attrs['add_offset'] = offset
+		MetadataUtils.write_cog(encoded, tif_file_path)
+
+	@staticmethod
+	def generate_visual_file(stac_asset: Dataset, clipped_path_parent: str):
+		# a single pixel interleaved, tiled COG lets the tiler read all three rgb bands with one dataset open
+		# (the COG driver interleaves multi band images by pixel)
+		visual = stac_asset[MetadataUtils.visual_band_ids].to_array(dim='band')
+		if 'time' in visual.dims:
+			visual = visual.isel(time=0, drop=True)
+		MetadataUtils.write_cog(visual, os.path.join(clipped_path_parent, "visual.tif"), blocksize=512)
+
+	@staticmethod
+	def write_cog(data_array: DataArray, tif_file_path: str, **options):
+		if data_array.chunks is None:
+			data_array.rio.to_raster(tif_file_path, **COG_WRITE_OPTIONS, **options)
+			return
+
+		# the COG driver buffers the whole raster before writing it, lazy (spilled) arrays are instead streamed block
+		# by block into a tiled GTiff, which GDAL then copies into the COG layout
+		staging_path = "{}.staging.tif".format(tif_file_path)
+		try:
+			data_array.rio.to_raster(staging_path, driver="GTiff", tiled=True, blockxsize=512, blockysize=512, bigtiff="IF_SAFER",
+									 lock=threading.Lock())
+			rasterio.shutil.copy(staging_path, tif_file_path, **COG_WRITE_OPTIONS, **options)
+		finally:
+			if os.path.exists(staging_path):
+				os.remove(staging_path)
+
+	@staticmethod
+	def log_write_throughput(path_parent: str, elapsed_seconds: float):
+		file_sizes = [os.path.getsize(os.path.join(path_parent, file)) for file in os.listdir(path_parent)]
+		written_mb = sum(file_sizes) / (1024 * 1024)
+		logger.info("Wrote {} tif files ({:.1f} MB) in {:.2f}s, {:.1f} MB/s with {} write threads".format(
+			len(file_sizes), written_mb, elapsed_seconds, written_mb / max(elapsed_seconds, 1e-6), OUTPUT_WRITE_THREADS))
+
+	@staticmethod
+	def generate_thumbnail_files(stac_asset: Dataset, temp_dir: str, band_ids: List[str]):
+		"""
+		Renders the rgb and ndvi quicklooks from the arrays already in memory, so previews need no raster reads on the
+		tiler. Pixels without data are transparent.
+		"""
+		thumbnail_path_parent = os.path.join(temp_dir, 'thumbnails')
+
+		if os.path.exists(thumbnail_path_parent):
+			shutil.rmtree(thumbnail_path_parent)
+
+		os.makedirs(thumbnail_path_parent)
+
+		if all(band in band_ids and stac_asset.get(band) is not None for band in MetadataUtils.visual_band_ids):
+			rgb = np.stack([MetadataUtils._thumbnail_values(stac_asset[band]) for band in MetadataUtils.visual_band_ids], axis=-1)
+			valid = np.isfinite(rgb).all(axis=-1) & (rgb > 0).any(axis=-1)
+			# surface reflectance (scaled by 10000) stretched over 0 - 0.3 with a gamma, close to the tiler rendering
+			pixels = np.clip(rgb / 3000, 0, 1) ** (1 / 2.2) * 255
+			MetadataUtils._write_thumbnail(pixels, valid, os.path.join(thumbnail_path_parent, "rgb.{}".format(THUMBNAIL_FORMAT)))
+
+		for band in THUMBNAIL_BAND_IDS:
+			if band in band_ids and stac_asset.get(band) is not None:
+				values = MetadataUtils._thumbnail_values(stac_asset[band])
+				# same colormap and range as the tiler
+				pixels = colormaps['RdYlGn'](np.clip((values + 1) / 2, 0, 1))[..., :3] * 255
+				MetadataUtils._write_thumbnail(pixels, np.isfinite(values), os.path.join(thumbnail_path_parent, "{}.{}".format(band, THUMBNAIL_FORMAT)))
+
+	@staticmethod
+	def _thumbnail_values(band_array: DataArray) -> np.ndarray:
+		if 'time' in band_array.dims:
+			band_array = band_array.isel(time=0)
+		if band_array.chunks is not None:
+			# only a decimated copy of the lazy (spilled) bands is read, the thumbnail is far smaller anyway
+			step = max(1, max(band_array.shape) // (THUMBNAIL_SIZE * 4))
+			band_array = band_array[..., ::step, ::step]
+		return band_array.values.astype('float64')
+
+	@staticmethod
+	def _write_thumbnail(pixels: np.ndarray, valid: np.ndarray, file_path: str):
+		rgba = np.dstack([np.nan_to_num(pixels), valid * 255]).astype('uint8')
+		image = Image.fromarray(rgba, mode='RGBA')
+		# only ever shrinks the image, the aspect ratio is kept
+		image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.Resampling.LANCZOS)
+		image.save(file_path, format=THUMBNAIL_FORMAT.upper())
+
+	@staticmethod
+	def generate_time_series_tif_files(stac_assets: Dataset, series_dir: str, band_ids: List[str], stack_band_ids: List[str]):
+		"""
+		Writes one set of band tif files per date under `<series_dir>/<date>/images` and one multi-band tif per stack band
+		(one band per date, described by its date) under `<series_dir>/stack/images`.
+		"""
+		if os.path.exists(series_dir):
+			shutil.rmtree(series_dir)
+
+		dates = MetadataUtils.time_series_dates(stac_assets)
+		for index, date in enumerate(dates):
+			date_assets = MetadataUtils.time_series_slice(stac_assets, index, band_ids)
+			MetadataUtils.generate_tif_files(date_assets, os.path.join(series_dir, date), band_ids)
+
+		stack_path_parent = os.path.join(series_dir, 'stack', 'images')
+		os.makedirs(stack_path_parent)
+		for band in stack_band_ids:
+			if stac_assets.get(band) is not None:
+				band_stack = stac_assets[band].copy()
+				band_stack.attrs['long_name'] = tuple(dates)
+				MetadataUtils.write_band(band_stack, band, os.path.join(stack_path_parent, "{}.tif".format(band)))
+
+	@staticmethod
+	def time_series_slice(stac_assets: Dataset, index: int, band_ids: List[str]) -> Dataset:
+		date_assets = stac_assets.isel(time=slice(index, index + 1 if index != -1 else None))
+		# bands that could not be derived for this date (e.g. ndvi_change of the first date without a previous result) are dropped
+		empty_bands = [band for band in band_ids if date_assets.get(band) is not None and bool(date_assets[band].isnull().all())]
+		return date_assets.drop_vars(empty_bands)
+
+	@staticmethod
+	def time_series_dates(stac_assets: Dataset) -> List[str]:
+		return [str(np.datetime_as_string(timestamp, unit='D')) for timestamp in stac_assets['time'].values]
+
+	@staticmethod
+	def generate_stack_assets(series_dir: str, bucket_name: str, key_prefix: str, dates: List[str]) -> Dict[str, Any]:
+		stack_assets = {}
+		stack_path_parent = os.path.join(series_dir, 'stack', 'images')
+		for file in sorted(os.listdir(stack_path_parent)):
+			file_path = os.path.join(stack_path_parent, file)
+			band = file.replace('.tif', "")
+			stack_assets["{}_stack".format(band)] = {
+				# Semgrep issue https://sg.run/oYz6
+				# Ignore reason: The bucket name and s3 key are not being specified by user
+				# nosemgrep
+				"href": "s3://{}/{}/stack/images/{}".format(bucket_name, key_prefix, file),
+				"type": "image/tiff; application=geotiff",
+				"title": "{} stack".format(band),
+				"description": "One band per date, in date order: {}".format(", ".join(dates)),
+				"file:checksum": MetadataUtils.calculate_checksum(file_path),
+				"file:size": os.path.getsize(file_path),
+				"roles": [
+					"data"
+				]
+			}
+			header_size = MetadataUtils.calculate_header_size(file_path)
+			if header_size is not None:
+				stack_assets["{}_stack".format(band)]["file:header_size"] = header_size
+		return stack_assets
+
+	@staticmethod
+	def append_zarr_cube(stac_assets: Dataset, store_url: str, group: Optional[str], band_ids: List[str]):
+		"""
+		Appends the bands along time to the Zarr store (created on first use), every variable is chunked per date and
+		compressed. A store of its own (no group) has its metadata consolidated so readers open the cube with a single
+		request. The groups of a region store are written by concurrent jobs, each one rewriting the consolidated view of
+		the whole store from a listing of it, so a job finishing at the same time as another can leave that view without
+		the group of the other: the groups themselves are written and opened unconsolidated, and the view of the store
+		is only kept for browsing it.
+		"""
+		cube = MetadataUtils._to_cube_dataset(stac_assets, band_ids)
+		store = fsspec.get_mapper(store_url)
+		consolidated = group is None
+
+		try:
+			existing = xr.open_zarr(store, group=group, consolidated=consolidated)
+		except (FileNotFoundError, KeyError, GroupNotFoundError):
+			existing = None
+
+		if existing is None:
+			encoding = {
+				band: {
+					"compressor": Blosc(cname="zstd", clevel=5, shuffle=Blosc.BITSHUFFLE),
+					"chunks": (1, min(cube.sizes['y'], 512), min(cube.sizes['x'], 512)),
+				}
+				for band in band_ids
+			}
+			cube.to_zarr(store, group=group, mode='w', encoding=encoding, consolidated=consolidated)
+		else:
+			# the dates are appended pixel for pixel, a grid of the same size but shifted or in another crs would
+			# silently misplace them
+			if not (
+				np.array_equal(existing['x'].values, cube['x'].values)
+				and np.array_equal(existing['y'].values, cube['y'].values)
+				and existing.attrs.get('crs') == cube.attrs.get('crs')
+			):
+				raise ValueError('Grid of {} no longer matches the polygon, the cube cannot be appended to'.format(store_url))
+
+			# a retried job must not append the same dates twice
+			cube = cube.sel(time=~np.isin(cube['time'].values, existing['time'].values))
+			if cube.sizes['time'] == 0:
+				return
+			cube.to_zarr(store, group=group, append_dim='time', consolidated=consolidated)
+
+		if not consolidated:
+			zarr.consolidate_metadata(store)
+
+	@staticmethod
+	def _to_cube_dataset(stac_assets: Dataset, band_ids: List[str]) -> Dataset:
+		cube = Dataset(coords={coord: stac_assets[coord] for coord in ('time', 'y', 'x') if coord in stac_assets.coords})
+		template = stac_assets[band_ids[0]]
 		for band in band_ids:
-			if stac_asset.get(band) is not None:
-				tif_file_path = os.path.join(clipped_path_parent, "{}.tif".format(band))
-				stac_asset[band].rio.to_raster(tif_file_path)
+			if stac_assets.get(band) is not None:
+				band_array = stac_assets[band]
+			else:
+				# all appends must carry the same variables, bands missing from this run (e.g. ndvi_change) are stored as NaN
+				band_array = xr.full_like(template, np.nan, dtype='float32')
+			if np.issubdtype(band_array.dtype, np.floating):
+				band_array = band_array.astype('float32')
+			cube[band] = band_array.drop_vars('spatial_ref', errors='ignore')
+
+		if stac_assets.rio.crs is not None:
+			cube.attrs['crs'] = stac_assets.rio.crs.to_string()
+			cube.attrs['transform'] = list(stac_assets.rio.transform())[:6]
+		return cube
+
+	@staticmethod
+	def generate_zarr_asset(store_url: str, group: Optional[str]) -> Dict[str, Any]:
+		asset = {
+			# Semgrep issue https://sg.run/oYz6
+			# Ignore reason: The bucket name and s3 key are not being specified by user
+			# nosemgrep
+			"href": store_url,
+			"type": "application/vnd+zarr",
+			"title": "analysis cube",
+			"roles": [
+				"data"
+			],
+			"xarray:open_kwargs": {
+				"engine": "zarr",
+				"consolidated": True
+			}
+		}
+		if group is not None:
+			# the groups of a region store are not consolidated (see append_zarr_cube)
+			asset["xarray:open_kwargs"]["group"] = group
+			asset["xarray:open_kwargs"]["consolidated"] = False
+		return asset
 
 	@staticmethod
 	def calculate_checksum(file_path: str, algorithm='md5') -> int:
@@ -55,7 +372,7 @@ class MetadataUtils:
 
 	@staticmethod
 	def generate_metadata(sentinel_links: List[Dict[str, Any]], bounding_box: np.ndarray, stac_assets: Dataset, temp_dir: str, bucket_name: str,
-						  request: EngineRequest):
+						  request: EngineRequest, extra_assets: Optional[Dict[str, Any]] = None):
 
 		coordinates = request.coordinates
 
@@ -103,6 +420,21 @@ class MetadataUtils:
 						]
 					}
 
+					header_size = MetadataUtils.calculate_header_size(file_path)
+					if header_size is not None:
+						metadata["assets"][band]["file:header_size"] = header_size
+
+					if band == 'visual':
+						metadata["assets"][band]["roles"] = ["visual"]
+						metadata["assets"][band]["title"] = "rgb"
+						band_arrays = [stac_assets[visual_band] for visual_band in MetadataUtils.visual_band_ids]
+					else:
+						band_arrays = [stac_assets[band]] if stac_assets.get(band) is not None else []
+
+					# with statistics for every band the tiler can rescale without reading the statistics from the file
+					if len(band_arrays) > 0:
+						metadata["assets"][band]["raster:bands"] = [MetadataUtils.generate_raster_band(band_array, band) for band_array in band_arrays]
+
 					# generate the histogram for the NDVI band
 					if band == 'ndvi' and stac_assets.get('ndvi') is not None:
 						# This is the valid range of NDVI
@@ -110,6 +442,23 @@ class MetadataUtils:
 								0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1]
 						metadata["assets"][band]['raster:band'] = [MetadataUtils.generate_histogram(stac_assets[band], bins, (-1, 1), area_acres)]
 
+				# generate metadata for the quicklooks
+				elif os.path.basename(root) == 'thumbnails':
+					name = os.path.splitext(file)[0]
+					metadata["assets"]["{}_thumbnail".format(name)] = {
+						# Semgrep issue https://sg.run/oYz6
+						# Ignore reason: The bucket name and s3 key are not being specified by user
+						# nosemgrep
+						"href": "s3://{}/{}".format(bucket_name, s3_key),
+						"type": "image/{}".format(THUMBNAIL_FORMAT),
+						"title": "{} thumbnail".format(name),
+						"file:checksum": MetadataUtils.calculate_checksum(file_path),
+						"file:size": os.path.getsize(file_path),
+						"roles": [
+							"thumbnail"
+						]
+					}
+
 				# generate metadata for nitrogen recommendation
 				elif file == 'nitrogen.json':
 					metadata["assets"]['nitrogen_metadata'] = {
@@ -125,14 +474,69 @@ class MetadataUtils:
 						]
 					}
 
+		# assets which are not written into temp_dir (e.g. the time series stack) are appended as is
+		if extra_assets is not None:
+			metadata["assets"].update(extra_assets)
+
 		with open("{}/metadata.json".format(temp_dir), "w") as file:
 			# Write content to the file
 			file.write(json.dumps(metadata))
 
+		return metadata
+
+	@staticmethod
+	def generate_event_summary(metadata: Dict[str, Any], scene_ids: List[str], timings: Dict[str, float]) -> Dict[str, Any]:
+		"""
+		Returns the summary of the metadata published with the completion event, built from the statistics already in
+		the metadata. The optional sections are dropped (largest first) when the summary exceeds EVENT_SUMMARY_MAX_SIZE.
+		"""
+		summary = {
+			"version": EVENT_SUMMARY_VERSION,
+			"areaSize": metadata["properties"]["area_size"],
+			"areaUnitOfMeasure": metadata["properties"]["area_unit_of_measure"],
+			"sceneIds": scene_ids,
+			"bands": {},
+			"timings": {step: round(seconds, 3) for step, seconds in timings.items()},
+		}
+
+		for band, asset in metadata["assets"].items():
+			raster_bands = asset.get("raster:bands") or []
+			# multi band assets (e.g. visual) are left out, their statistics are not meaningful on their own
+			if len(raster_bands) == 1 and raster_bands[0].get("statistics") is not None:
+				statistics = raster_bands[0]["statistics"]
+				summary["bands"][band] = {
+					"minimum": statistics["minimum"],
+					"maximum": statistics["maximum"],
+					"mean": statistics["mean"],
+					"stddev": statistics["stddev"],
+					"validPercent": statistics["valid_percent"],
+				}
+
+		ndvi_histograms = (metadata["assets"].get("ndvi") or {}).get("raster:band")
+		if ndvi_histograms:
+			histogram = ndvi_histograms[0]["histogram"][0]
+			summary["ndviHistogram"] = {
+				"buckets": histogram["buckets"],
+				"bucketCount": [float(count) for count in histogram["bucket_count"]],
+			}
+
+		optional_sections = sorted(
+			(section for section in ("ndviHistogram", "sceneIds", "bands") if section in summary),
+			key=lambda section: len(json.dumps(summary[section])),
+			reverse=True,
+		)
+		for section in optional_sections:
+			if len(json.dumps(summary)) <= EVENT_SUMMARY_MAX_SIZE:
+				break
+			summary.pop(section)
+			summary["truncated"] = True
+
+		return summary
+
 	@staticmethod
 	def upload_assets(bucket_name: str, key_prefix: str, temp_dir: str):
 		# Create an S3 client
-		s3 = boto3.client('s3')
+		s3 = get_client('s3')
 		for root, dirs, files in os.walk(temp_dir):
 			for file in files:
 				# Construct the full file path
@@ -185,29 +589,84 @@ class MetadataUtils:
 		with open(nitrogen_file_path, "w") as file:
 			file.write(json.dumps(nitrogen_metadata))
 
+	@staticmethod
+	def calculate_header_size(file_path: str) -> Optional[int]:
+		"""
+		Returns the number of bytes before the first image block of the tif, i.e. the size of the header and of all
+		the IFDs (including the overviews ones) of a COG.
+		"""
+		with rasterio.open(file_path) as src:
+			overview_count = len(src.overviews(1))
+
+		block_offsets = []
+		for overview_level in [None] + list(range(overview_count)):
+			open_options = {} if overview_level is None else {"overview_level": overview_level}
+			with rasterio.open(file_path, **open_options) as src:
+				for band_index in src.indexes:
+					block_offset = src.get_tag_item('BLOCK_OFFSET_0_0', 'TIFF', bidx=band_index)
+					if block_offset:
+						block_offsets.append(int(block_offset))
+
+		return min(block_offsets) if len(block_offsets) > 0 else None
+
+	@staticmethod
+	def generate_raster_band(band_array: DataArray, band: str) -> Dict[str, Any]:
+		"""
+		Returns the raster extension band object of the band with its statistics, the statistics are in the unscaled
+		(physical) values for the scaled bands.
+		"""
+		nodata = np.asarray(band_array.rio.nodata).item() if band_array.rio.nodata is not None else None
+		valid = band_array.notnull()
+		if nodata is not None and not np.isnan(nodata):
+			valid &= band_array != nodata
+		valid_values = band_array.where(valid).astype('float64')
+		# reduced in a single pass, chunk by chunk for the lazy (spilled) bands
+		valid_count, minimum, maximum, mean, stddev = dask.compute(
+			valid.sum(), valid_values.min(), valid_values.max(), valid_values.mean(), valid_values.std())
+
+		if MetadataUtils.is_scaled_band(band):
+			raster_band = dict(SCALED_INT16_ENCODING)
+		else:
+			raster_band = {"data_type": str(band_array.dtype)}
+			if nodata is not None:
+				raster_band["nodata"] = "nan" if np.isnan(nodata) else nodata
+
+		if int(valid_count) > 0:
+			raster_band["statistics"] = {
+				"minimum": float(minimum),
+				"maximum": float(maximum),
+				"mean": float(mean),
+				"stddev": float(stddev),
+				"valid_percent": float(int(valid_count) / band_array.size * 100),
+			}
+		return raster_band
+
 	@staticmethod
 	def generate_histogram(stac_asset_band: DataArray, bins: List[float], range: tuple[float, float], area_acres: float) -> Dict[str, Any]:
 		stac_band_array = stac_asset_band.data.flatten()
 		filtered_band_array = stac_band_array[~np.isnan(stac_band_array)]
 		[band_min, band_max] = range
-		counts, _ = np.histogram(filtered_band_array, bins, range)
+		histogram = dask.array.histogram if isinstance(stac_band_array, dask.array.Array) else np.histogram
+		(counts, _), count, mean, stddev = dask.compute(
+			histogram(filtered_band_array, bins, range), (~np.isnan(stac_band_array)).sum(), filtered_band_array.mean(), filtered_band_array.std())
+		count = int(count)
 		statistic = {
 			"nodata": 0,
 			"data_type": "uint8",
 			"histogram": [
 				{
-					"count": len(filtered_band_array),
+					"count": count,
 					"min": band_min,
 					"max": band_max,
 					"buckets": bins,
-					"bucket_count": [(c / len(filtered_band_array) * area_acres) for c in counts.tolist()],
+					"bucket_count": [(c / count * area_acres) for c in counts.tolist()],
 				}
 			],
 			"statistics": {
 				"minimum": band_min,
 				"maximum": band_max,
-				"mean": filtered_band_array.mean(),
-				"stddev": filtered_band_array.std(),
+				"mean": mean,
+				"stddev": stddev,
 			}
 		}
 		return statistic
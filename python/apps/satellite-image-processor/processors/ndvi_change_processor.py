@@ -23,7 +23,9 @@ class NdviChangeProcessor(AbstractProcessor):
 
 		print(self.previous_tif_raster)
 
-		if self.previous_tif_raster is not None:
+		if self.time_series:
+			stac_assets['ndvi_change'] = XarrayUtils.calculate_ndvi_change_series(stac_assets['ndvi'], self.previous_tif_raster)
+		elif self.previous_tif_raster is not None:
 			stac_assets['ndvi_change'] = XarrayUtils.calculate_ndvi_change(stac_assets['ndvi'], self.previous_tif_raster)
 
 		return super().process(stac_assets)
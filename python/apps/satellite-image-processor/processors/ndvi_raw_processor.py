@@ -19,5 +19,7 @@ from processors.xarray_utils import XarrayUtils
 
 class NdviRawProcessor(AbstractProcessor):
 	def process(self, stac_assets: Dataset) -> Dataset:
-		stac_assets['ndvi_raw'] = XarrayUtils.calculate_ndvi(stac_assets)
+		# the scene stage may already have provided the layer
+		if stac_assets.get('ndvi_raw') is None:
+			stac_assets['ndvi_raw'] = XarrayUtils.calculate_ndvi(stac_assets)
 		return super().process(stac_assets)
@@ -0,0 +1,116 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+import dask.array
+import numexpr as ne
+import numpy as np
+import xarray as xr
+from xarray import Dataset
+
+# This import is required to extend DataArray functionality with rioxarray
+import rioxarray
+
+# Comma separated list of the spectral indices to compute on top of NDVI, e.g. "ndre,evi,savi". The tiler reads the same
+# variable to serve each of them as an image type
+SPECTRAL_INDICES = [index.strip() for index in os.getenv("SPECTRAL_INDICES", "").split(",") if index.strip()]
+
+
+@dataclass
+class SpectralIndex:
+	"""
+	A spectral index declared as a numexpr expression over the Sentinel band names (digital numbers, 0 - 10000).
+	"""
+	name: str
+	expression: str
+	bands: Tuple[str, ...]
+	_compiled: ne.NumExpr = field(init=False, repr=False, default=None)
+
+	def compile(self) -> ne.NumExpr:
+		# the expression is compiled once and reused for every evaluation (numexpr spells float32 as `float`)
+		if self._compiled is None:
+			self._compiled = ne.NumExpr(self.expression, signature=[(band, float) for band in self.bands])
+		return self._compiled
+
+
+INDEX_REGISTRY: Dict[str, SpectralIndex] = {}
+
+
+def register_index(index: SpectralIndex):
+	INDEX_REGISTRY[index.name] = index
+
+
+register_index(SpectralIndex("ndre", "(nir08 - rededge1) / (nir08 + rededge1)", ("nir08", "rededge1")))
+# EVI and SAVI constants are expressed for digital numbers (reflectance * 10000)
+register_index(SpectralIndex("evi", "2.5 * (nir08 - red) / (nir08 + 6.0 * red - 7.5 * blue + 10000.0)", ("nir08", "red", "blue")))
+register_index(SpectralIndex("savi", "1.5 * (nir08 - red) / (nir08 + red + 5000.0)", ("nir08", "red")))
+
+
+class SpectralIndexEngine:
+	"""
+	Evaluates a set of spectral indices in one pass, every band is converted once and shared by all the indices,
+	and each compiled expression is evaluated by the multi-threaded numexpr virtual machine.
+	"""
+
+	def __init__(self, index_names: List[str]):
+		unknown = [name for name in index_names if name not in INDEX_REGISTRY]
+		if unknown:
+			raise ValueError('Unknown spectral indices: {}'.format(', '.join(unknown)))
+		self.indices = [INDEX_REGISTRY[name] for name in index_names]
+
+	@staticmethod
+	def enabled() -> 'SpectralIndexEngine':
+		return SpectralIndexEngine(SPECTRAL_INDICES)
+
+	@property
+	def index_names(self) -> List[str]:
+		return [index.name for index in self.indices]
+
+	@property
+	def required_bands(self) -> List[str]:
+		bands = []
+		for index in self.indices:
+			bands.extend(band for band in index.bands if band not in bands)
+		return bands
+
+	def evaluate(self, stac_assets: Dataset) -> Dict[str, xr.DataArray]:
+		if not self.indices:
+			return {}
+
+		template = stac_assets[self.required_bands[0]]
+		ne.set_num_threads(os.cpu_count() or 1)
+
+		if isinstance(template.data, dask.array.Array):
+			# spilled bands are evaluated chunk by chunk, all the indices of a chunk in the same pass
+			bands = [stac_assets[band].data.rechunk(template.data.chunks) for band in self.required_bands]
+			stacked = dask.array.map_blocks(self._evaluate_block, *bands, new_axis=0,
+											chunks=((len(self.indices),),) + template.data.chunks, dtype=np.float32)
+		else:
+			stacked = self._evaluate_block(*[stac_assets[band].values for band in self.required_bands])
+
+		return {
+			index.name: xr.DataArray(stacked[position], coords=template.coords, dims=template.dims).rio.write_nodata(np.nan)
+			for position, index in enumerate(self.indices)
+		}
+
+	def _evaluate_block(self, *bands: np.ndarray) -> np.ndarray:
+		band_values = {band: values.astype(np.float32) for band, values in zip(self.required_bands, bands)}
+		# pixels clipped out of the polygon (nodata 0 on every band) have no index value
+		nodata = np.logical_and.reduce([band_values[band] == 0 for band in self.required_bands])
+
+		results = np.empty((len(self.indices),) + nodata.shape, dtype=np.float32)
+		for position, index in enumerate(self.indices):
+			results[position] = index.compile()(*[band_values[band] for band in index.bands])
+			results[position][nodata] = np.nan
+		return results
@@ -0,0 +1,31 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+import numpy as np
+from xarray import Dataset
+
+from processors.base_processors import AbstractProcessor
+from processors.spectral_index_engine import SpectralIndexEngine
+
+
+class SpectralIndexProcessor(AbstractProcessor):
+	def __init__(self, engine: SpectralIndexEngine, previous_tif_raster: np.ndarray, time_series: bool = False):
+		self.engine = engine
+		super().__init__(previous_tif_raster, time_series)
+
+	def process(self, stac_assets: Dataset) -> Dataset:
+		missing_bands = [band for band in self.engine.required_bands if stac_assets.get(band) is None]
+		if missing_bands:
+			raise ValueError('Dataset is missing bands {}'.format(', '.join(missing_bands)))
+
+		for name, index in self.engine.evaluate(stac_assets).items():
+			stac_assets[name] = index
+		return super().process(stac_assets)
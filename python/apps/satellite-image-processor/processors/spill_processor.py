@@ -0,0 +1,30 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+import numpy as np
+from xarray import Dataset
+
+from processors.base_processors import AbstractProcessor
+from spill_store import SpillStore
+
+
+class SpillProcessor(AbstractProcessor):
+	"""
+	Spills the layers added by the previous processor to memory-mapped files before the next one runs, so at most one
+	derived layer at a time is held in anonymous memory.
+	"""
+
+	def __init__(self, spill_store: SpillStore, previous_tif_raster: np.ndarray, time_series: bool = False):
+		self.spill_store = spill_store
+		super().__init__(previous_tif_raster, time_series)
+
+	def process(self, stac_assets: Dataset) -> Dataset:
+		return super().process(self.spill_store.spill(stac_assets))
@@ -9,17 +9,30 @@
 #   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
 #   and limitations under the License.
 
+from typing import Optional
+
 import numpy as np
 from processors.base_processors import AbstractProcessor
 from processors.metadata_utils import MetadataUtils
+from processors.spectral_index_engine import SpectralIndexEngine
 from xarray import Dataset
 
 
 class TifImageProcessor(AbstractProcessor):
-	def __init__(self, temp_dir: str, previous_tif_raster: np.ndarray):
+	band_ids = ['red', 'green', 'blue', 'scl', 'nir08', 'ndvi', 'ndvi_raw', 'scl_surface', 'ndvi_change'] + SpectralIndexEngine.enabled().index_names
+
+	stack_band_ids = ['ndvi', 'ndvi_raw', 'ndvi_change']
+
+	def __init__(self, temp_dir: str, previous_tif_raster: np.ndarray, time_series: bool = False, series_dir: Optional[str] = None):
 		self.temp_dir = temp_dir
-		super().__init__(previous_tif_raster)
+		self.series_dir = series_dir
+		super().__init__(previous_tif_raster, time_series)
 
 	def process(self, stac_assets: Dataset) -> Dataset:
-		MetadataUtils.generate_tif_files(stac_assets, self.temp_dir, ['red', 'green', 'blue', 'scl', 'nir08', 'ndvi', 'ndvi_raw', 'scl_surface', 'ndvi_change'])
+		if self.time_series:
+			MetadataUtils.generate_time_series_tif_files(stac_assets, self.series_dir, self.band_ids, self.stack_band_ids)
+			# the latest date is also written as the regular output of the result
+			MetadataUtils.generate_tif_files(MetadataUtils.time_series_slice(stac_assets, -1, self.band_ids), self.temp_dir, self.band_ids)
+		else:
+			MetadataUtils.generate_tif_files(stac_assets, self.temp_dir, self.band_ids)
 		return super().process(stac_assets)
@@ -25,12 +25,37 @@ class XarrayUtils:
 	def calculate_ndvi_change(current_ndvi: DataArray, previous_ndvi: np.ndarray) -> DataArray:
 		return current_ndvi - previous_ndvi
 
+	@staticmethod
+	def calculate_ndvi_change_series(ndvi_series: DataArray, previous_ndvi: Optional[np.ndarray]) -> DataArray:
+		# each date is compared against the date before it, the first date against the previous result (if any)
+		ndvi_change = ndvi_series - ndvi_series.shift(time=1)
+		if previous_ndvi is not None:
+			ndvi_change[0] = ndvi_series[0] - previous_ndvi[0]
+		return ndvi_change
+
 	@staticmethod
 	def calculate_ndvi(stac_asset: Dataset) -> DataArray:
 		red = stac_asset["red"].astype("float")
 		nir = stac_asset["nir08"].astype("float")
 		return (nir - red) / (nir + red)
 
+	@staticmethod
+	def upsample_by_index(coarse: DataArray, fine: Dataset) -> DataArray:
+		"""
+		Maps a coarser band onto the grid of `fine` by looking up, for every fine pixel centre, the index of the coarse
+		pixel containing it. This is a plain gather (no interpolation), so classification bands such as scl keep their values.
+		The gather is lazy (dask), the fine resolution copy is computed chunk by chunk by whatever consumes it.
+		"""
+		if coarse.chunks is None:
+			coarse = coarse.chunk()
+		coarse_x_res, coarse_y_res = coarse.rio.resolution()
+		x_origin = coarse['x'].values[0] - coarse_x_res / 2
+		y_origin = coarse['y'].values[0] - coarse_y_res / 2
+		x_index = np.clip(np.floor((fine['x'].values - x_origin) / coarse_x_res).astype(int), 0, coarse.sizes['x'] - 1)
+		y_index = np.clip(np.floor((fine['y'].values - y_origin) / coarse_y_res).astype(int), 0, coarse.sizes['y'] - 1)
+		upsampled = coarse.isel(x=xr.DataArray(x_index, dims='x'), y=xr.DataArray(y_index, dims='y'))
+		return upsampled.assign_coords(x=fine['x'], y=fine['y'])
+
 	@staticmethod
 	def remove_cloud(scl_asset: Dataset) -> DataArray:
 		# https://custom-scripts.sentinel-hub.com/custom-scripts/sentinel-2/scene-classification/
@@ -53,8 +78,8 @@ class XarrayUtils:
 
 	@staticmethod
 	def fill_cloud_gap(scl_surface: DataArray, current_ndvi: DataArray, previous_ndvi: Optional[np.ndarray]) -> DataArray:
-		scl_surface_array = scl_surface.values.flatten()
-		has_cloud_gap = len(scl_surface_array[~np.isnan(scl_surface_array) & (scl_surface_array == 0)]) > 0
+		# reduced chunk by chunk when the layer is lazy (NaN never equals 0)
+		has_cloud_gap = bool((scl_surface == 0).any())
 
 		cloud_gap_filled_ndvi: DataArray = current_ndvi.copy()
 
@@ -63,3 +88,13 @@ class XarrayUtils:
 			cloud_gap_filled_ndvi = xr.where(scl_surface == 0, current_ndvi * percentage_diff, current_ndvi)
 
 		return cloud_gap_filled_ndvi
+
+	@staticmethod
+	def fill_cloud_gap_series(scl_surface: DataArray, current_ndvi: DataArray, previous_ndvi: Optional[np.ndarray]) -> DataArray:
+		# the gap of each date is filled relative to the (already filled) date before it, so this walks the time axis in order
+		filled_slices = []
+		for index in range(current_ndvi.sizes['time']):
+			filled_slice = XarrayUtils.fill_cloud_gap(scl_surface[index:index + 1], current_ndvi[index:index + 1], previous_ndvi)
+			filled_slices.append(filled_slice)
+			previous_ndvi = filled_slice.values
+		return xr.concat(filled_slices, dim='time')
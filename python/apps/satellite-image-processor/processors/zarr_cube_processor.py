@@ -0,0 +1,40 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+from typing import Optional, Dict, Any
+
+import numpy as np
+from xarray import Dataset
+
+from processors.base_processors import AbstractProcessor
+from processors.metadata_utils import MetadataUtils
+from processors.spectral_index_engine import SpectralIndexEngine
+
+
+class ZarrCubeProcessor(AbstractProcessor):
+	"""
+	Appends the bands of the run to a chunked, compressed Zarr analysis cube so readers can slice time x space
+	without opening the individual tif files.
+	"""
+
+	band_ids = ['red', 'green', 'blue', 'scl', 'nir08', 'ndvi', 'ndvi_raw', 'scl_surface', 'ndvi_change'] + SpectralIndexEngine.enabled().index_names
+
+	def __init__(self, store_url: str, group: Optional[str], previous_tif_raster: np.ndarray, time_series: bool = False):
+		self.store_url = store_url
+		self.group = group
+		super().__init__(previous_tif_raster, time_series)
+
+	def process(self, stac_assets: Dataset) -> Dataset:
+		MetadataUtils.append_zarr_cube(stac_assets, self.store_url, self.group, self.band_ids)
+		return super().process(stac_assets)
+
+	def generate_asset(self) -> Dict[str, Any]:
+		return MetadataUtils.generate_zarr_asset(self.store_url, self.group)
@@ -0,0 +1,71 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+import argparse
+import cProfile
+import os
+import pstats
+import time
+
+from fixture_bundle import FixtureBundle, ReplaySTACCatalogProcessor
+from initial_process import process_assets
+from logger_utils import get_logger
+from stac_catalog_processor import EngineRequest
+
+logger = get_logger(__name__)
+
+
+def replay(bundle_path: str, work_dir: str, profile_path: str = None):
+    """
+    Runs the full processor pipeline against a fixture bundle (captured with CAPTURE_BUNDLE=true) without any network
+    access, the outputs are written to the work directory and nothing is uploaded or published.
+    """
+    bundle = FixtureBundle(bundle_path)
+    request = EngineRequest.from_dict(bundle.load_input())
+    processor = ReplaySTACCatalogProcessor(request, bundle)
+
+    profiler = cProfile.Profile() if profile_path else None
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+
+    process_assets(
+        processor,
+        request,
+        "replay",
+        request.is_time_series,
+        None,
+        work_dir,
+        upload=False,
+    )
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(profile_path)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(30)
+    logger.info(
+        f"Replay of {bundle_path} completed in {time.perf_counter() - start:.2f}s, outputs in {work_dir}"
+    )
+
+
+def main(parser):
+    args = parser.parse_args()
+    work_dir = os.path.abspath(args.work_dir)
+    os.makedirs(work_dir, exist_ok=True)
+    replay(os.path.abspath(args.bundle), work_dir, args.profile)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-b", "--bundle", type=str, required=True)
+    parser.add_argument("-w", "--work-dir", type=str, default="replay_output")
+    parser.add_argument("-p", "--profile", type=str, default=None)
+    main(parser)
@@ -0,0 +1,128 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+import os
+import tempfile
+import threading
+from logging import Logger
+from typing import Optional
+
+import rasterio.shutil
+import rioxarray
+from botocore.exceptions import ClientError
+from odc.stac import stac_load
+from pyproj import CRS
+from pystac import Item
+from pystac.extensions.projection import ProjectionExtension
+from rasterio.enums import Resampling
+from xarray import Dataset
+
+from aws_clients import get_client
+from logger_utils import get_logger
+from processors.xarray_utils import XarrayUtils
+
+# When set, the polygon independent layers are computed once per Sentinel item and cached in this bucket
+SCENE_CACHE_BUCKET = os.getenv("SCENE_CACHE_BUCKET")
+SCENE_CACHE_PREFIX = os.getenv("SCENE_CACHE_PREFIX", "scene-cache")
+
+logger: Logger = get_logger()
+
+
+class ScenePreprocessor:
+	"""
+	Produces (and caches) a scene level COG holding the `scl`, `scl_surface`, `ndvi_raw` and `nir08` layers of a Sentinel
+	item. These only depend on the scene, so every polygon of every region overlapping the scene clips them from the
+	cached product instead of reading the raw red/nir08/scl bands and recomputing them.
+	"""
+
+	scene_band_ids = ['scl', 'scl_surface', 'ndvi_raw', 'nir08']
+	# bumped whenever the bands of the product change, products of the previous layout are never read
+	scene_version = 2
+
+	def __init__(self, bucket: str = SCENE_CACHE_BUCKET, prefix: str = SCENE_CACHE_PREFIX):
+		self.bucket = bucket
+		self.prefix = prefix
+		self.s3 = get_client('s3')
+
+	@staticmethod
+	def is_enabled() -> bool:
+		return SCENE_CACHE_BUCKET is not None
+
+	def scene_key(self, item: Item) -> str:
+		return "{}/{}/{}/scene-v{}.tif".format(self.prefix, item.collection_id, item.id, self.scene_version)
+
+	def get_scene_href(self, item: Item) -> str:
+		"""
+		Returns the href of the cached scene product, generating it first when this is the first polygon to need it.
+
+		Two jobs may both find the product missing and generate it, the upload is not conditional. Both products are
+		computed from the same item and are identical, and an S3 put is atomic, so readers see either of them whole.
+		"""
+		key = self.scene_key(item)
+		if not self._exists(key):
+			logger.info("Generating scene product for {}".format(item.id))
+			self._generate(item, key)
+		return "s3://{}/{}".format(self.bucket, key)
+
+	def load_scene_layers(self, item: Item, like: Dataset) -> Dataset:
+		"""
+		Reads the cached scene layers on the grid of `like` (the clipped raw bands of the same item), only the
+		COG blocks intersecting the area of interest are fetched.
+		"""
+		scene = rioxarray.open_rasterio(self.get_scene_href(item), band_as_variable=True, mask_and_scale=False)
+		scene = scene.rename({"band_{}".format(index + 1): band for index, band in enumerate(self.scene_band_ids)})
+		scene = scene.rio.clip_box(*like.rio.bounds(), crs=like.rio.crs)
+		scene = scene.rio.reproject_match(like, resampling=Resampling.nearest)
+		scene = scene.expand_dims(time=like['time'].values)
+		scene['scl'] = scene['scl'].astype('uint8')
+		# published with the same type and nodata as the raw band
+		scene['nir08'] = scene['nir08'].astype('uint16')
+		scene['nir08'].attrs['nodata'] = 0
+		return scene
+
+	def _exists(self, key: str) -> bool:
+		try:
+			self.s3.head_object(Bucket=self.bucket, Key=key)
+			return True
+		except ClientError as e:
+			if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+				return False
+			raise e
+
+	def _generate(self, item: Item, key: str):
+		output_crs = CRS.from_epsg(ProjectionExtension.ext(item).epsg)
+		raw_scene = stac_load(
+			items=[item],
+			bands=("red", "nir08", "scl"),
+			output_crs=output_crs,
+			resolution=10,
+			groupby="solarday",
+			chunks={"x": 2048, "y": 2048},
+		).isel(time=0)
+
+		scene = Dataset({
+			'scl': raw_scene['scl'].astype('float32'),
+			'scl_surface': XarrayUtils.remove_cloud(raw_scene[['scl']]).astype('float32'),
+			'ndvi_raw': XarrayUtils.calculate_ndvi(raw_scene).astype('float32'),
+			'nir08': raw_scene['nir08'].astype('float32'),
+		}).to_array(dim='band').rio.write_crs(output_crs)
+
+		with tempfile.TemporaryDirectory() as scratch_dir:
+			tiled_path = os.path.join(scratch_dir, 'scene_tiled.tif')
+			cog_path = os.path.join(scratch_dir, 'scene.tif')
+			# the scene is written chunk by chunk, then converted into a COG so polygons can range read it
+			scene.rio.to_raster(tiled_path, tiled=True, blockxsize=512, blockysize=512, lock=threading.Lock(), windowed=True)
+			rasterio.shutil.copy(tiled_path, cog_path, driver='COG', compress='DEFLATE', predictor=3, blocksize=512, num_threads='ALL_CPUS')
+			self.s3.upload_file(cog_path, self.bucket, key)
+
+
+def get_scene_preprocessor() -> Optional[ScenePreprocessor]:
+	return ScenePreprocessor() if ScenePreprocessor.is_enabled() else None
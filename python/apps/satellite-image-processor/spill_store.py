@@ -0,0 +1,111 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+import os
+import shutil
+import tempfile
+from logging import Logger
+from typing import Any, List, Optional, Set
+
+import dask.array
+import numpy as np
+from rioxarray.merge import merge_datasets
+from xarray import Dataset
+
+from logger_utils import get_logger
+
+# When set (e.g. the scratch volume of the Batch job), the loaded bands and derived layers are backed by memory-mapped
+# files in this directory instead of anonymous memory
+SPILL_DIR = os.getenv("SPILL_DIR")
+# Chunk size of the lazy views over the spilled files, the derived layers are computed and written chunk by chunk
+SPILL_CHUNK_SIZE = int(os.getenv("SPILL_CHUNK_SIZE", "2048"))
+
+logger: Logger = get_logger()
+
+
+class SpillStore:
+	"""
+	Moves the data variables of a Dataset into memory-mapped files, so their pages can be written back to disk and
+	evicted under memory pressure instead of the job being OOM killed on region sized areas of interest.
+	"""
+
+	def __init__(self, root: str):
+		os.makedirs(root, exist_ok=True)
+		self.path = tempfile.mkdtemp(prefix="spill_", dir=root)
+		# dask names of the views over the spilled files
+		self._spilled: Set[str] = set()
+
+	@staticmethod
+	def for_job() -> Optional['SpillStore']:
+		if SPILL_DIR is None:
+			return None
+		return SpillStore(SPILL_DIR)
+
+	def spill(self, stac_assets: Dataset) -> Dataset:
+		"""
+		Replaces every data variable which is not spilled yet by a lazy (dask) view over a memory-mapped copy. Lazy
+		variables are computed chunk by chunk straight into their files, all of them in one pass so the layers derived
+		from the same inputs share the reads, and are never fully held in memory. The processors that follow only build
+		lazy graphs over the views, which the next spill streams to disk in turn.
+		"""
+		pending = {name: variable for name, variable in stac_assets.data_vars.items() if not self._is_spilled(variable.data)}
+		memmaps = {name: self._create_memmap(variable.data) for name, variable in pending.items()}
+
+		lazy = [name for name, variable in pending.items() if isinstance(variable.data, dask.array.Array)]
+		if lazy:
+			dask.array.store([pending[name].data for name in lazy], [memmaps[name] for name in lazy], lock=False)
+		for name, variable in pending.items():
+			if name not in lazy:
+				memmaps[name][...] = variable.data
+			memmaps[name].flush()
+			view = dask.array.from_array(memmaps[name], chunks=self._chunks(memmaps[name]), lock=False)
+			self._spilled.add(view.name)
+			stac_assets[name] = variable.copy(data=view)
+		return stac_assets
+
+	def merge(self, datasets: List[Dataset]) -> Dataset:
+		"""
+		Lazy equivalent of rioxarray merge_datasets (method "first") for datasets loaded on the same grid, every pixel is
+		taken from the first dataset that has a valid value for it. The time slice of the first dataset is kept.
+		"""
+		if any(dataset.rio.shape != datasets[0].rio.shape or dataset.rio.transform() != datasets[0].rio.transform() for dataset in datasets):
+			logger.warning("Spilled datasets are not on the same grid, merging them in memory")
+			return merge_datasets(datasets)
+
+		merged = datasets[0]
+		for dataset in datasets[1:]:
+			merged_vars = {}
+			for name, variable in merged.data_vars.items():
+				if name not in dataset:
+					continue
+				nodata = variable.rio.nodata
+				missing = variable.data == nodata if nodata is not None and not np.isnan(nodata) else dask.array.isnan(variable.data)
+				merged_vars[name] = variable.copy(data=dask.array.where(missing, dataset[name].data, variable.data))
+			merged = merged.assign(merged_vars)
+		return merged
+
+	def close(self):
+		# mappings still referenced stay valid once their file is unlinked, the space is released with the last one
+		shutil.rmtree(self.path, ignore_errors=True)
+
+	def _create_memmap(self, data: Any) -> np.memmap:
+		fd, file_path = tempfile.mkstemp(suffix=".dat", dir=self.path)
+		os.close(fd)
+		logger.debug("Spilling {} bytes to {}".format(data.nbytes, file_path))
+		return np.memmap(file_path, dtype=data.dtype, mode="w+", shape=data.shape)
+
+	@staticmethod
+	def _chunks(data: np.ndarray) -> tuple:
+		# the leading (time) dimensions are chunked per slice, the spatial ones by blocks
+		return tuple(1 if axis < data.ndim - 2 else SPILL_CHUNK_SIZE for axis in range(data.ndim))
+
+	def _is_spilled(self, data: Any) -> bool:
+		return isinstance(data, dask.array.Array) and data.name in self._spilled
@@ -12,13 +12,14 @@
 import os
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
+from functools import lru_cache
 from io import BytesIO
 from logging import Logger
 from typing import List, Optional, Dict
 from urllib.parse import urlparse
 
-import boto3
 import geopandas as gpd
+import numpy as np
 import rasterio
 import requests
 import shapely.geometry as geom
@@ -36,11 +37,27 @@ from shapely.geometry import shape
 from xarray import Dataset
 import rioxarray
 
+from aws_clients import get_client, get_session
 from logger_utils import get_logger
+from processors.spectral_index_engine import SpectralIndexEngine
+from processors.xarray_utils import XarrayUtils
+from scene_preprocessor import ScenePreprocessor, get_scene_preprocessor
+from spill_store import SpillStore, SPILL_CHUNK_SIZE
 
 STAC_URL = os.getenv("SENTINEL_API_URL")
 STAC_COLLECTION = os.getenv("SENTINEL_COLLECTION")
 
+# Output grid resolution in meters, coarser values (e.g. 20 or 60) reduce the load for very large regions
+LOAD_RESOLUTION = float(os.getenv("LOAD_RESOLUTION", "10"))
+# When enabled, each band is read at its native resolution and coarser bands are mapped onto the output grid by index
+NATIVE_RESOLUTION_LOADING = os.getenv("NATIVE_RESOLUTION_LOADING", "false").lower() == "true"
+
+# Native Sentinel-2 L2A band resolutions in meters
+BAND_RESOLUTIONS = {
+	"red": 10, "green": 10, "blue": 10, "nir": 10,
+	"nir08": 20, "rededge1": 20, "rededge2": 20, "rededge3": 20, "swir16": 20, "swir22": 20, "scl": 20,
+}
+
 logger: Logger = get_logger()
 
 
@@ -80,6 +97,11 @@ class EngineRequest(DataClassJsonMixin):
 	result_id: str = field(metadata=config(field_name="resultId"), default=None)
 	state: Optional[State] = field(metadata=config(field_name="state"), default=None)
 	latest_result_id: Optional[str] = field(metadata=config(field_name="latestResultId"), default=None)
+	time_series: Optional[bool] = field(metadata=config(field_name="timeSeries"), default=None)
+
+	@property
+	def is_time_series(self) -> bool:
+		return self.time_series is True
 
 
 class STACCatalogProcessor:
@@ -95,10 +117,16 @@ class STACCatalogProcessor:
 		self.bounding_box: Optional[ndarray] = None
 
 	@staticmethod
-	def _load_stac_items(start_date_time: str, end_date_time: str, bounding_box: list[float]) -> List[Item]:
+	@lru_cache(maxsize=None)
+	def _open_catalog(stac_url: str) -> Client:
+		# the catalog (and its HTTP session) is reused across requests of a long-lived worker
+		return Client.open(stac_url)
+
+	@staticmethod
+	def _load_stac_items(start_date_time: str, end_date_time: str, bounding_box: list[float], max_items: Optional[int] = 10) -> List[Item]:
 		time_filter = "{}/{}".format(start_date_time, end_date_time)
 
-		stac_catalog = Client.open(STAC_URL)
+		stac_catalog = STACCatalogProcessor._open_catalog(STAC_URL)
 
 		stac_query = stac_catalog.search(
 			bbox=bounding_box,
@@ -107,7 +135,7 @@ class STACCatalogProcessor:
 			},
 			collections=[STAC_COLLECTION],
 			sortby='-properties.datetime',
-			max_items=10
+			max_items=max_items
 		)
 
 		stac_items = list(stac_query.items())
@@ -139,7 +167,7 @@ class STACCatalogProcessor:
 
 		response_data = stac_api_response.json()
 
-		s3 = boto3.client('s3')
+		s3 = get_client('s3')
 		try:
 			bucket, key = response_data['assets']['ndvi']["href"].replace("s3://", "").split("/", 1)
 			s3_get_response = s3.get_object(Bucket=bucket, Key=key)
@@ -148,13 +176,19 @@ class STACCatalogProcessor:
 			with rasterio.open(BytesIO(object_content)) as src:
 				# Access the image data and metadata
 				raster_data = src.read()
+				# results written with the scaled integer encoding are converted back to ndvi values
+				if np.issubdtype(raster_data.dtype, np.integer):
+					raster_data = raster_data.astype('float64')
+					if src.nodata is not None:
+						raster_data[raster_data == src.nodata] = np.nan
+					raster_data = raster_data * np.array(src.scales)[:, None, None] + np.array(src.offsets)[:, None, None]
 				return raster_data
 		except s3.exceptions.NoSuchKey as e:
 			print(f"Error: {e}")
 
 	@staticmethod
 	def get_api_auth(endpoint: str, region: str) -> AWSRequestsAuth:
-		credentials = boto3.Session().get_credentials()
+		credentials = get_session().get_credentials()
 		parsed_url = urlparse(endpoint)
 		host = parsed_url.hostname
 		auth = AWSRequestsAuth(
@@ -168,7 +202,8 @@ class STACCatalogProcessor:
 		return auth
 
 	@staticmethod
-	def _filter_stac_assets(result_stac_items: List[Item], polygon_list: List[Polygon], bbox: ndarray) -> Optional[Dataset]:
+	def _filter_stac_assets(result_stac_items: List[Item], polygon_list: List[Polygon], bbox: ndarray,
+							scene_preprocessor: Optional[ScenePreprocessor] = None, spill_store: Optional[SpillStore] = None) -> Optional[Dataset]:
 
 		# Stac item that we will load as Xarray Dataset
 		stac_items = []
@@ -187,14 +222,23 @@ class STACCatalogProcessor:
 		# We iterate and combine all the stac item list (from the latest) to ensure it covers the input area of interest
 		for item in result_stac_items:
 			stac_items.append(item)
-			stac_asset = stac_load(
-				items=[item],
-				bands=("red", "green", "blue", "nir08", "scl"),  # <-- filter on just the bands we need
-				bbox=bbox.tolist(),  # <-- filters based on overall polygon boundaries
-				output_crs=output_crs,
-				resolution=10,
-				groupby="solarday"
+			# with the scene stage, nir08/scl/scl_surface/ndvi_raw are clipped from the cached scene product instead of raw bands
+			bands = ("red", "green", "blue") if scene_preprocessor is not None else ("red", "green", "blue", "nir08", "scl")
+			scene_bands = scene_preprocessor.scene_band_ids if scene_preprocessor is not None else []
+			# plus whatever the enabled spectral indices need, unless the scene product already carries it
+			bands += tuple(
+				band for band in SpectralIndexEngine.enabled().required_bands if band not in bands and band not in scene_bands
 			)
+			if spill_store is not None:
+				# loaded lazily so the bands are read straight into their memory-mapped files
+				stac_asset = STACCatalogProcessor._load_bands([item], bands, bbox, output_crs, chunks={"x": SPILL_CHUNK_SIZE, "y": SPILL_CHUNK_SIZE})
+			else:
+				stac_asset = STACCatalogProcessor._load_bands([item], bands, bbox, output_crs)
+			if scene_preprocessor is not None:
+				stac_asset = stac_asset.merge(scene_preprocessor.load_scene_layers(item, stac_asset))
+			if spill_store is not None:
+				# every item is on disk before the next one is loaded
+				stac_asset = spill_store.spill(stac_asset)
 			stac_assets.append(stac_asset)
 
 			# Combined the multiple stac_items polygon
@@ -208,14 +252,99 @@ class STACCatalogProcessor:
 			if combined_polygon.contains(aoi_bbox_polygon):
 				break
 
-		# Merge all the loaded stac assets
-		merged_dataset = merge_datasets(stac_assets)
+		if spill_store is not None:
+			# merged and clipped lazily over the spilled items, the clipped bands are then streamed to disk chunk by chunk
+			clipped_dataset = spill_store.merge(stac_assets).rio.clip(polygon_list, crs='epsg:4326')
+		else:
+			# Merge all the loaded stac assets
+			merged_dataset = merge_datasets(stac_assets)
+
+			# clipped the stac asset to the input polygon
+			clipped_dataset = merged_dataset.rio.clip(polygon_list, crs='epsg:4326')
 
-		# clipped the stac asset to the input polygon
-		clipped_dataset = merged_dataset.rio.clip(polygon_list, crs='epsg:4326')
+		if scene_preprocessor is not None:
+			# the float scene layer is NaN outside the polygon, where the layer computed from the clipped scl is 0
+			clipped_dataset['scl_surface'] = clipped_dataset['scl_surface'].fillna(0).astype('uint8')
+
+		if spill_store is not None:
+			clipped_dataset = spill_store.spill(clipped_dataset)
 		return clipped_dataset
 
-	def load_stac_datasets(self) -> [Dataset, Dataset]:
+	@staticmethod
+	def _load_bands(items: List[Item], bands: tuple, bbox: ndarray, output_crs: CRS, **kwargs) -> Dataset:
+		if NATIVE_RESOLUTION_LOADING:
+			return STACCatalogProcessor._load_native_bands(items, bands, bbox, output_crs, **kwargs)
+
+		return stac_load(
+			items=items,
+			bands=bands,  # <-- filter on just the bands we need
+			bbox=bbox.tolist(),  # <-- filters based on overall polygon boundaries
+			output_crs=output_crs,
+			resolution=LOAD_RESOLUTION,
+			groupby="solarday",
+			resampling=STACCatalogProcessor._resampling(bands, LOAD_RESOLUTION),
+			**kwargs
+		)
+
+	@staticmethod
+	def _resampling(bands: tuple, resolution: float) -> Dict[str, str]:
+		# only matters for the bands read coarser than their native resolution, classes must not be averaged
+		return {
+			band: ("mode" if band == "scl" else "average") if resolution > BAND_RESOLUTIONS.get(band, 10) else "nearest"
+			for band in bands
+		}
+
+	@staticmethod
+	def _load_native_bands(items: List[Item], bands: tuple, bbox: ndarray, output_crs: CRS, **kwargs) -> Dataset:
+		# bands are grouped per native resolution so the reads involve no resampling
+		band_groups: Dict[float, List[str]] = {}
+		for band in bands:
+			band_groups.setdefault(max(BAND_RESOLUTIONS.get(band, 10), LOAD_RESOLUTION), []).append(band)
+
+		resolutions = sorted(band_groups)
+		# the finest group defines the output grid
+		output_dataset = stac_load(
+			items=items, bands=band_groups[resolutions[0]], bbox=bbox.tolist(), output_crs=output_crs, resolution=resolutions[0],
+			groupby="solarday", resampling=STACCatalogProcessor._resampling(tuple(band_groups[resolutions[0]]), resolutions[0]), **kwargs
+		)
+
+		# coarser groups are loaded lazily and mapped onto the output grid by pixel index, so the output resolution copy
+		# of a coarse band is only ever computed chunk by chunk by the processors consuming it
+		coarse_kwargs = {**kwargs, "chunks": kwargs.get("chunks", {"x": 1024, "y": 1024})}
+		for resolution in resolutions[1:]:
+			coarse_dataset = stac_load(
+				items=items, bands=band_groups[resolution], bbox=bbox.tolist(), output_crs=output_crs, resolution=resolution,
+				groupby="solarday", resampling=STACCatalogProcessor._resampling(tuple(band_groups[resolution]), resolution), **coarse_kwargs
+			)
+			for band in coarse_dataset.data_vars:
+				output_dataset[band] = XarrayUtils.upsample_by_index(coarse_dataset[band], output_dataset)
+		return output_dataset
+
+	@staticmethod
+	def _load_stac_cube(result_stac_items: List[Item], polygon_list: List[Polygon], bbox: ndarray, spill_store: Optional[SpillStore] = None) -> Dataset:
+		# default to CRS from the latest Item, all solar days are loaded onto the same grid
+		result_stac_items.sort(key=lambda x: x.properties['datetime'], reverse=True)
+		sentinel_epsg = ProjectionExtension.ext(result_stac_items[0]).epsg
+		output_crs = CRS.from_epsg(sentinel_epsg)
+
+		# A single load for the whole date range, each solar day becomes one lazily loaded chunk along time
+		stac_cube = STACCatalogProcessor._load_bands(
+			result_stac_items,
+			("red", "green", "blue", "nir08", "scl") + tuple(
+				band for band in SpectralIndexEngine.enabled().required_bands if band not in ("red", "green", "blue", "nir08", "scl")),
+			bbox,
+			output_crs,
+			chunks={"time": 1, "x": 2048, "y": 2048},
+		).sortby("time")
+
+		# clipped the stac cube to the input polygon, computing it reads every solar day in parallel (one task per time chunk)
+		clipped_cube = stac_cube.rio.clip(polygon_list, crs='epsg:4326')
+		if spill_store is not None:
+			# computed chunk by chunk into memory-mapped files instead of memory
+			return spill_store.spill(clipped_cube)
+		return clipped_cube.compute()
+
+	def _load_polygons(self):
 		for coord in self.request.coordinates:
 			for test in coord:
 				self.polygon_list.append(geom.Polygon(test))
@@ -224,10 +353,44 @@ class STACCatalogProcessor:
 		# Store the bounding box
 		self.bounding_box = polygon_series.total_bounds
 
+	def load_stac_time_series(self, spill_store: Optional[SpillStore] = None) -> [Dataset, Dataset]:
+		"""
+		Runs a single search over the request date range and returns every solar day as one time chunked cube
+		(oldest first), together with the previous result raster which seeds the first date.
+		"""
+		self._load_polygons()
+
+		self.stac_items = self._load_stac_items(self.request.start_date_time, self.request.end_date_time, self.bounding_box, max_items=None)
+
+		stac_cube = self._load_stac_cube(self.stac_items, self.polygon_list, self.bounding_box, spill_store)
+
+		return stac_cube, self._load_previous_ndvi_raster()
+
+	def load_stac_datasets(self, spill_store: Optional[SpillStore] = None) -> [Dataset, Dataset]:
+		self._load_polygons()
+
 		self.stac_items = self._load_stac_items(self.request.start_date_time, self.request.end_date_time, self.bounding_box)
 
-		stac_assets = self._filter_stac_assets(self.stac_items, self.polygon_list, self.bounding_box)
+		stac_assets = self._filter_stac_assets(self.stac_items, self.polygon_list, self.bounding_box, self._scene_preprocessor(), spill_store)
+
+		return stac_assets, self._load_previous_ndvi_raster()
+
+	def items_for_solar_day(self, timestamp: datetime) -> List[Item]:
+		"""
+		Returns the Sentinel items which were grouped into the solar day of the given time slice.
+		"""
+		solar_day = self._solar_day(timestamp)
+		return [item for item in self.stac_items if self._solar_day(item.datetime) == solar_day]
+
+	def _solar_day(self, timestamp: datetime) -> str:
+		# Same approximation as odc-stac solarday grouping, the local day at the centre longitude of the area of interest
+		longitude = (self.bounding_box[0] + self.bounding_box[2]) / 2
+		return (timestamp.replace(tzinfo=None) + timedelta(hours=longitude / 15)).date().isoformat()
+
+	def _scene_preprocessor(self) -> Optional[ScenePreprocessor]:
+		return get_scene_preprocessor()
 
+	def _load_previous_ndvi_raster(self) -> Optional[ndarray]:
 		previous_ndvi_raster = None
 		if self.request.latest_result_id is not None:
 			try:
@@ -235,4 +398,4 @@ class STACCatalogProcessor:
 			except Exception as e:
 				print(f"Error: {e}")
 
-		return stac_assets, previous_ndvi_raster
+		return previous_ndvi_raster
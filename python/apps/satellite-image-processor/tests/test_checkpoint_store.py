@@ -0,0 +1,81 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+from datetime import datetime
+
+import dask.array
+import numpy as np
+import rioxarray  # noqa: F401 registers the rio accessor
+import xarray as xr
+from pystac import Item
+
+from checkpoint_store import CheckpointStage, CheckpointStore
+
+
+def stac_assets() -> xr.Dataset:
+	red = xr.DataArray(
+		np.arange(1, 17, dtype="uint16").reshape(4, 4),
+		dims=("y", "x"),
+		coords={"y": 40 - 5 - np.arange(4) * 10, "x": 5 + np.arange(4) * 10},
+	)
+	return xr.Dataset({"red": red}).rio.write_crs("epsg:32631")
+
+
+def stac_item() -> Item:
+	return Item("S2B_31TCJ_20240101_0_L2A", {"type": "Point", "coordinates": [1.0, 45.0]}, [1.0, 45.0, 1.0, 45.0], datetime(2024, 1, 1), {})
+
+
+def test_a_retried_job_resumes_from_the_loaded_stage(tmp_path):
+	previous_ndvi = np.full((4, 4), 0.5, dtype="float32")
+	CheckpointStore(str(tmp_path), "result", "polygon").save_loaded(stac_assets(), previous_ndvi, [stac_item()], np.array([0, 0, 40, 40]))
+
+	# a new store, as the retried job creates it
+	store = CheckpointStore(str(tmp_path), "result", "polygon")
+	assert store.last_completed_stage() == CheckpointStage.LOADED
+	assert store.has_completed(CheckpointStage.LOADED)
+	assert not store.has_completed(CheckpointStage.COMPUTED)
+
+	dataset = store.load_dataset(CheckpointStage.LOADED)
+	np.testing.assert_array_equal(dataset["red"].values, stac_assets()["red"].values)
+	assert dataset.rio.crs.to_epsg() == 32631
+	# the zarr chunks and compressor are dropped, only the grid mapping of the crs is kept
+	assert dataset["red"].encoding == {"grid_mapping": "spatial_ref"}
+	np.testing.assert_array_equal(store.load_previous_ndvi_raster(), previous_ndvi)
+	assert [item.id for item in store.load_stac_items()] == ["S2B_31TCJ_20240101_0_L2A"]
+	np.testing.assert_array_equal(store.load_bounding_box(), [0, 0, 40, 40])
+
+
+def test_the_datasets_are_removed_once_uploaded(tmp_path):
+	store = CheckpointStore(str(tmp_path), "result", "polygon")
+	store.save_loaded(stac_assets(), None, [stac_item()], np.array([0, 0, 40, 40]))
+	store.save_computed(stac_assets())
+	store.save_uploaded(summary={"ndvi": {"mean": 0.5}})
+
+	store = CheckpointStore(str(tmp_path), "result", "polygon")
+	assert store.has_completed(CheckpointStage.COMPUTED)
+	assert store.load_summary() == {"ndvi": {"mean": 0.5}}
+	assert store.load_previous_ndvi_raster() is None
+	assert not list((tmp_path / "result" / "polygon").glob("*.zarr"))
+
+	store.clear()
+	assert not (tmp_path / "result" / "polygon").exists()
+
+
+def test_datasets_are_loaded_lazily_on_request(tmp_path):
+	store = CheckpointStore(str(tmp_path), "result", "polygon")
+	store.save_loaded(stac_assets(), None, [stac_item()], np.array([0, 0, 40, 40]))
+
+	dataset = store.load_dataset(CheckpointStage.LOADED, lazy=True)
+
+	assert isinstance(dataset["red"].data, dask.array.Array)
+	assert dataset.rio.crs.to_epsg() == 32631
+	np.testing.assert_array_equal(dataset["red"].values, stac_assets()["red"].values)
+	assert not isinstance(store.load_dataset(CheckpointStage.LOADED)["red"].data, dask.array.Array)
@@ -0,0 +1,62 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+import rasterio
+from pystac import Asset, Item
+from rasterio.transform import from_origin
+
+from fixture_bundle import FixtureBundle, ReplaySTACCatalogProcessor
+from scene_preprocessor import ScenePreprocessor
+from stac_catalog_processor import EngineRequest
+
+
+def sentinel_item(tmp_path) -> Item:
+	# 100 x 100 pixels of 10 m in UTM 31N, covering roughly 3.0 - 3.013 E / 45.0 - 45.01 N
+	cog_path = str(tmp_path / "red.tif")
+	values = np.arange(100 * 100, dtype="uint16").reshape(100, 100)
+	with rasterio.open(cog_path, "w", driver="GTiff", width=100, height=100, count=1, dtype="uint16", crs="epsg:32631",
+					   transform=from_origin(500000, 4984000, 10, 10)) as dst:
+		dst.write(values, 1)
+
+	item = Item("S2A_31TEJ_20240601_0_L2A", None, None, datetime(2024, 6, 1, tzinfo=timezone.utc), {"proj:epsg": 32631})
+	item.add_asset("red", Asset(cog_path, media_type="image/tiff; application=geotiff"))
+	return item
+
+
+def test_bundle_replays_the_captured_inputs(tmp_path):
+	bundle = FixtureBundle(str(tmp_path / "bundle"))
+	bundle.save_input({"startDateTime": "2024-06-01", "endDateTime": "2024-06-02"})
+	bundle.save_previous_ndvi_raster(np.ones((2, 2), dtype="float32"))
+	bundle.save_stac_items([sentinel_item(tmp_path)], np.array([3.001, 45.001, 3.005, 45.005]))
+
+	replayed = FixtureBundle(bundle.path)
+	assert replayed.load_input() == {"startDateTime": "2024-06-01", "endDateTime": "2024-06-02"}
+	np.testing.assert_array_equal(replayed.load_previous_ndvi_raster(), np.ones((2, 2)))
+
+	[item] = replayed.load_stac_items()
+	href = item.assets["red"].href
+	# only the window covering the area of interest is captured, and it is served from the bundle
+	assert href.startswith(os.path.join(bundle.path, "cogs"))
+	with rasterio.open(href) as src:
+		assert src.width < 100 and src.height < 100
+		assert list(item.assets["red"].extra_fields["proj:shape"]) == [src.height, src.width]
+
+
+def test_replay_runs_without_the_scene_cache(tmp_path, monkeypatch):
+	monkeypatch.setattr(ScenePreprocessor, "is_enabled", staticmethod(lambda: True))
+	bundle = FixtureBundle(str(tmp_path / "bundle"))
+	processor = ReplaySTACCatalogProcessor(EngineRequest("2024-06-01", "2024-06-02"), bundle)
+
+	assert processor._scene_preprocessor() is None
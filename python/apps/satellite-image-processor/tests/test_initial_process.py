@@ -0,0 +1,82 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+import json
+
+import numpy as np
+import xarray as xr
+
+from initial_process import polygon_metadata_created_event
+from processors.metadata_utils import MetadataUtils
+from stac_catalog_processor import EngineRequest
+
+# fields of polygonProcessingDetails, polygonProcessingSummary and polygonProcessingBandStatistics
+# (typescript/packages/libraries/events/src/results/models.ts) the results module reads the event with
+DETAIL_FIELDS = {
+	"createdAt", "jobId", "polygonId", "polygonName", "groupId", "groupName", "regionId", "regionName", "resultId",
+	"startDateTime", "endDateTime", "engineOutputLocation", "summary",
+}
+SUMMARY_FIELDS = {"version", "areaSize", "areaUnitOfMeasure", "sceneIds", "bands", "ndviHistogram", "timings", "truncated"}
+BAND_STATISTICS_FIELDS = {"minimum", "maximum", "mean", "stddev", "validPercent"}
+
+
+def engine_request() -> EngineRequest:
+	return EngineRequest.from_dict({
+		"startDateTime": "2024-06-01T00:00:00Z",
+		"endDateTime": "2024-06-08T00:00:00Z",
+		"groupId": "01j0groupid",
+		"groupName": "grower",
+		"regionId": "01j0regionid",
+		"regionName": "farm",
+		"polygonId": "01j0polygonid",
+		"polygonName": "field",
+		"resultId": "01j0resultid",
+		"outputPrefix": "01j0regionid/01j0resultid/01j0polygonid",
+	})
+
+
+def event_summary():
+	statistics = {"minimum": -0.2, "maximum": 0.9, "mean": 0.4, "stddev": 0.1, "valid_percent": 97.5}
+	ndvi = xr.DataArray(np.array([[0.1, 0.5], [np.nan, 0.8]], dtype="float32"))
+	metadata = {
+		"properties": {"area_size": 12.5, "area_unit_of_measure": "acres"},
+		"assets": {
+			"ndvi": {
+				"raster:bands": [{"data_type": "float32", "statistics": statistics}],
+				"raster:band": [MetadataUtils.generate_histogram(ndvi, [-1, 0, 0.5, 1], (-1, 1), 12.5)],
+			},
+		},
+	}
+	return MetadataUtils.generate_event_summary(metadata, ["S2A_31TEJ_20240601_0_L2A"], {"load": 1.0})
+
+
+def test_polygon_metadata_created_event_matches_the_results_contract():
+	event = polygon_metadata_created_event(engine_request(), "agie-bus", "job-1", event_summary())
+
+	assert event["Source"] == "com.aws.agie.executor"
+	assert event["DetailType"] == "com.aws.agie.executor>PolygonMetadata>created"
+	detail = json.loads(event["Detail"])
+	assert set(detail) == DETAIL_FIELDS
+	assert detail["engineOutputLocation"] == "01j0regionid/01j0resultid/01j0polygonid/metadata.json"
+	assert detail["jobId"] == "job-1"
+
+	summary = detail["summary"]
+	assert set(summary) <= SUMMARY_FIELDS
+	assert set(summary["bands"]["ndvi"]) == BAND_STATISTICS_FIELDS
+	assert set(summary["ndviHistogram"]) == {"buckets", "bucketCount"}
+	assert len(summary["ndviHistogram"]["buckets"]) == len(summary["ndviHistogram"]["bucketCount"]) + 1
+
+
+def test_polygon_metadata_created_event_without_summary():
+	# checkpoints written before the summary existed resume without one
+	event = polygon_metadata_created_event(engine_request(), "agie-bus", "job-1", None)
+
+	assert set(json.loads(event["Detail"])) == DETAIL_FIELDS - {"summary"}
@@ -0,0 +1,109 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+import json
+
+import numpy as np
+import pytest
+import rasterio
+import rioxarray  # noqa: F401 registers the rio accessor
+import xarray as xr
+
+from processors import metadata_utils
+from processors.metadata_utils import EVENT_SUMMARY_MAX_SIZE, MetadataUtils
+
+
+def metadata(band_count: int):
+	statistics = {"minimum": -0.2, "maximum": 0.9, "mean": 0.4, "stddev": 0.1, "valid_percent": 97.5}
+	return {
+		"properties": {"area_size": 12.5, "area_unit_of_measure": "acres"},
+		"assets": {
+			"band{}".format(index): {"raster:bands": [{"data_type": "float32", "statistics": statistics}]}
+			for index in range(band_count)
+		},
+	}
+
+
+def test_event_summary_is_complete_when_it_fits():
+	summary = MetadataUtils.generate_event_summary(metadata(3), ["S2A_31TEJ_20240601_0_L2A"], {"load": 1.23456})
+
+	assert sorted(summary["bands"]) == ["band0", "band1", "band2"]
+	assert summary["sceneIds"] == ["S2A_31TEJ_20240601_0_L2A"]
+	assert summary["timings"] == {"load": 1.235}
+	assert "truncated" not in summary
+
+
+def test_event_summary_drops_the_largest_sections_first():
+	scene_ids = ["S2A_31TEJ_20240601_{}_L2A".format(index) for index in range(EVENT_SUMMARY_MAX_SIZE // 10)]
+	summary = MetadataUtils.generate_event_summary(metadata(3), scene_ids, {"load": 1.0})
+
+	assert len(json.dumps(summary)) <= EVENT_SUMMARY_MAX_SIZE
+	assert summary["truncated"] is True
+	assert "sceneIds" not in summary
+	# the band statistics are far smaller, they are kept
+	assert sorted(summary["bands"]) == ["band0", "band1", "band2"]
+
+
+def test_event_summary_stays_under_the_maximum_size():
+	scene_ids = ["S2A_31TEJ_20240601_{}_L2A".format(index) for index in range(EVENT_SUMMARY_MAX_SIZE // 10)]
+	summary = MetadataUtils.generate_event_summary(metadata(EVENT_SUMMARY_MAX_SIZE // 50), scene_ids, {"load": 1.0})
+
+	assert len(json.dumps(summary)) <= EVENT_SUMMARY_MAX_SIZE
+	assert "sceneIds" not in summary and "bands" not in summary
+
+
+def test_scaled_stack_keeps_the_band_descriptions(tmp_path, monkeypatch):
+	monkeypatch.setattr(metadata_utils, "OUTPUT_ENCODING", "scaled_int16")
+	stack = xr.DataArray(
+		np.array([[[0.1, np.nan], [0.5, 0.2]], [[0.3, 0.4], [np.nan, -0.1]]], dtype="float32"),
+		dims=("time", "y", "x"),
+		coords={"y": [15.0, 5.0], "x": [5.0, 15.0]},
+	).rio.write_crs("epsg:32631").rio.write_nodata(np.nan)
+	stack.attrs["long_name"] = ("2024-06-01", "2024-06-11")
+
+	MetadataUtils.write_band(stack, "ndvi", str(tmp_path / "ndvi.tif"))
+
+	with rasterio.open(tmp_path / "ndvi.tif") as dataset:
+		assert dataset.descriptions == ("2024-06-01", "2024-06-11")
+		assert dataset.dtypes == ("int16", "int16")
+		np.testing.assert_array_equal(dataset.read(1), [[1000, -32768], [5000, 2000]])
+
+
+def cube_assets(day: str, x_origin: float = 5) -> xr.Dataset:
+	ndvi = xr.DataArray(
+		np.full((1, 2, 3), 0.5, dtype="float32"),
+		dims=("time", "y", "x"),
+		coords={"time": [np.datetime64(day, "ns")], "y": [35.0, 25.0], "x": x_origin + np.arange(3) * 10},
+	)
+	return xr.Dataset({"ndvi": ndvi}).rio.write_crs("epsg:32631")
+
+
+def test_region_cube_groups_are_readable_on_their_own(tmp_path):
+	store_url = str(tmp_path / "region.zarr")
+	MetadataUtils.append_zarr_cube(cube_assets("2024-06-01"), store_url, "polygon1", ["ndvi"])
+	MetadataUtils.append_zarr_cube(cube_assets("2024-06-01"), store_url, "polygon2", ["ndvi"])
+	MetadataUtils.append_zarr_cube(cube_assets("2024-06-06"), store_url, "polygon1", ["ndvi"])
+	# a retried job does not append its date twice
+	MetadataUtils.append_zarr_cube(cube_assets("2024-06-06"), store_url, "polygon1", ["ndvi"])
+
+	open_kwargs = MetadataUtils.generate_zarr_asset(store_url, "polygon1")["xarray:open_kwargs"]
+	assert open_kwargs == {"engine": "zarr", "consolidated": False, "group": "polygon1"}
+	assert xr.open_zarr(store_url, group="polygon1", consolidated=False).sizes["time"] == 2
+	# the consolidated view of the store lists the groups written so far
+	assert xr.open_zarr(store_url, group="polygon2", consolidated=True).sizes["time"] == 1
+
+
+def test_cube_is_not_appended_on_a_shifted_grid(tmp_path):
+	store_url = str(tmp_path / "polygon.zarr")
+	MetadataUtils.append_zarr_cube(cube_assets("2024-06-01"), store_url, None, ["ndvi"])
+
+	with pytest.raises(ValueError, match="no longer matches"):
+		MetadataUtils.append_zarr_cube(cube_assets("2024-06-06", x_origin=15), store_url, None, ["ndvi"])
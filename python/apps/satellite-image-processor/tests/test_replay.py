@@ -0,0 +1,58 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+import numpy as np
+import xarray as xr
+
+import initial_process
+import replay
+from fixture_bundle import FixtureBundle, ReplaySTACCatalogProcessor
+from processors.metadata_utils import MetadataUtils
+
+
+class PassThroughProcessor:
+	def __init__(self, *args, **kwargs):
+		pass
+
+	def set_next(self, processor):
+		return processor
+
+	def process(self, stac_assets):
+		return stac_assets
+
+
+def test_replay_does_not_write_the_zarr_cube(tmp_path, monkeypatch):
+	monkeypatch.setattr(initial_process, "ZARR_CUBE_OUTPUT", "polygon")
+	bundle = FixtureBundle(str(tmp_path / "bundle"))
+	bundle.save_input({"startDateTime": "2024-06-01", "endDateTime": "2024-06-02", "outputPrefix": "prefix"})
+
+	def load_stac_datasets(self, spill_store=None):
+		self.stac_items = []
+		return xr.Dataset({"ndvi": (("y", "x"), np.ones((2, 2), dtype="float32"))}), None
+
+	extra_assets = {}
+
+	def generate_metadata(sentinel_links, bounding_box, stac_assets, temp_dir, output_bucket, request, assets):
+		extra_assets.update(assets)
+		return {"properties": {"area_size": 1.0, "area_unit_of_measure": "acres"}, "assets": {}}
+
+	def append_zarr_cube(*args):
+		raise AssertionError("the zarr cube must not be written by a replay")
+
+	monkeypatch.setattr(ReplaySTACCatalogProcessor, "load_stac_datasets", load_stac_datasets)
+	# the layers themselves are covered by the processor tests, only the outputs of the chain matter here
+	monkeypatch.setattr(initial_process, "CloudRemovalProcessor", PassThroughProcessor)
+	monkeypatch.setattr(MetadataUtils, "generate_metadata", staticmethod(generate_metadata))
+	monkeypatch.setattr(MetadataUtils, "append_zarr_cube", staticmethod(append_zarr_cube))
+
+	replay.replay(bundle.path, str(tmp_path / "work"))
+
+	assert "analysis_cube" not in extra_assets
@@ -0,0 +1,54 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from processors.spectral_index_engine import SpectralIndexEngine
+
+
+def bands() -> xr.Dataset:
+	# the first pixel is outside the polygon (0 on every band)
+	return xr.Dataset({
+		"nir08": (("y", "x"), np.array([[0, 3000], [4000, 5000]], dtype="uint16")),
+		"rededge1": (("y", "x"), np.array([[0, 1000], [2000, 1000]], dtype="uint16")),
+		"red": (("y", "x"), np.array([[0, 1000], [2000, 1000]], dtype="uint16")),
+		"blue": (("y", "x"), np.array([[0, 500], [800, 300]], dtype="uint16")),
+	})
+
+
+def test_indices_are_evaluated_over_the_shared_bands():
+	engine = SpectralIndexEngine(["ndre", "savi"])
+	assert engine.required_bands == ["nir08", "rededge1", "red"]
+
+	indices = engine.evaluate(bands())
+
+	np.testing.assert_allclose(indices["ndre"].values, [[np.nan, 0.5], [1 / 3, 2 / 3]], rtol=1e-6)
+	np.testing.assert_allclose(indices["savi"].values, [[np.nan, 1.5 * 2000 / 9000], [1.5 * 2000 / 11000, 1.5 * 4000 / 11000]], rtol=1e-6)
+	assert indices["ndre"].dtype == np.float32
+	assert np.isnan(indices["ndre"].rio.nodata)
+
+
+def test_lazy_bands_are_evaluated_chunk_by_chunk():
+	engine = SpectralIndexEngine(["ndre", "evi"])
+
+	expected = engine.evaluate(bands())
+	indices = engine.evaluate(bands().chunk({"x": 1, "y": 1}))
+
+	for name in ("ndre", "evi"):
+		assert indices[name].chunks is not None
+		np.testing.assert_allclose(indices[name].values, expected[name].values, rtol=1e-6)
+
+
+def test_unknown_indices_are_rejected():
+	with pytest.raises(ValueError, match="ndwi"):
+		SpectralIndexEngine(["ndre", "ndwi"])
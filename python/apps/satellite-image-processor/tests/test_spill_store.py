@@ -0,0 +1,81 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+import dask.array
+import numpy as np
+import rasterio
+import rioxarray  # noqa: F401 registers the rio accessor
+import xarray as xr
+from shapely.geometry import box
+
+from processors.metadata_utils import MetadataUtils
+from spill_store import SpillStore
+
+
+def item_dataset(red: np.ndarray) -> xr.Dataset:
+	height, width = red.shape
+	red_band = xr.DataArray(
+		dask.array.from_array(red, chunks=2),
+		dims=("y", "x"),
+		coords={"y": 40 - 5 - np.arange(height) * 10, "x": 5 + np.arange(width) * 10},
+		attrs={"nodata": 0},
+	)
+	return xr.Dataset({"red": red_band}).rio.write_crs("epsg:32631")
+
+
+def test_spill_keeps_lazy_views_over_the_files(tmp_path):
+	store = SpillStore(str(tmp_path))
+	dataset = store.spill(item_dataset(np.arange(1, 17, dtype="uint16").reshape(4, 4)))
+
+	assert isinstance(dataset["red"].data, dask.array.Array)
+	assert len(list(tmp_path.glob("spill_*/*.dat"))) == 1
+
+	# layers derived from spilled variables are lazy until the next spill, spilled variables are not copied again
+	dataset["double"] = dataset["red"] * 2
+	assert isinstance(dataset["double"].data, dask.array.Array)
+	dataset = store.spill(dataset)
+	assert len(list(tmp_path.glob("spill_*/*.dat"))) == 2
+	np.testing.assert_array_equal(dataset["double"].values, np.arange(1, 17).reshape(4, 4) * 2)
+	store.close()
+
+
+def test_merge_takes_the_first_valid_pixel_and_clips_lazily(tmp_path):
+	store = SpillStore(str(tmp_path))
+	latest = store.spill(item_dataset(np.array([[1, 0, 0, 0]] * 4, dtype="uint16")))
+	older = store.spill(item_dataset(np.array([[2, 2, 0, 2]] * 4, dtype="uint16")))
+
+	merged = store.merge([latest, older])
+	assert isinstance(merged["red"].data, dask.array.Array)
+	np.testing.assert_array_equal(merged["red"].values, [[1, 2, 0, 2]] * 4)
+
+	# the polygon covers the two left columns
+	clipped = merged.rio.clip([box(0, 0, 20, 40)], crs="epsg:32631")
+	assert isinstance(clipped["red"].data, dask.array.Array)
+	np.testing.assert_array_equal(clipped["red"].values, [[1, 2]] * 4)
+	store.close()
+
+
+def test_write_cog_streams_lazy_bands(tmp_path):
+	values = np.arange(64, dtype="float32").reshape(8, 8)
+	band = xr.DataArray(
+		dask.array.from_array(values, chunks=4),
+		dims=("y", "x"),
+		coords={"y": 80 - 5 - np.arange(8) * 10, "x": 5 + np.arange(8) * 10},
+	).rio.write_crs("epsg:32631").rio.write_nodata(np.nan)
+
+	path = tmp_path / "ndvi.tif"
+	MetadataUtils.write_cog(band, str(path))
+
+	assert not (tmp_path / "ndvi.tif.staging.tif").exists()
+	with rasterio.open(path) as dataset:
+		assert dataset.driver == "GTiff"
+		assert dataset.tags(ns="IMAGE_STRUCTURE").get("LAYOUT") == "COG"
+		np.testing.assert_array_equal(dataset.read(1), values)
@@ -0,0 +1,62 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+from datetime import datetime, timezone
+
+import numpy as np
+import rioxarray  # noqa: F401 registers the rio accessor
+import xarray as xr
+from pystac import Item
+from pystac.extensions.projection import ProjectionExtension
+from shapely.geometry import box, mapping
+
+from processors.spectral_index_engine import SpectralIndexEngine
+from scene_preprocessor import ScenePreprocessor
+from stac_catalog_processor import STACCatalogProcessor
+
+# 4 x 4 pixels of 10 m in UTM 31N, around 3.0 E / 45.0 N
+X = 500005 + np.arange(4) * 10
+Y = 4983995 - np.arange(4) * 10
+
+
+def layers(names, dtype="uint16") -> xr.Dataset:
+	return xr.Dataset(
+		{name: (("time", "y", "x"), np.ones((1, 4, 4), dtype=dtype)) for name in names},
+		coords={"time": [np.datetime64("2024-06-01", "ns")], "y": Y, "x": X},
+	).rio.write_crs("epsg:32631")
+
+
+class FakeScenePreprocessor:
+	scene_band_ids = ScenePreprocessor.scene_band_ids
+
+	def load_scene_layers(self, item, like):
+		return layers(self.scene_band_ids, dtype="float32")
+
+
+def test_scene_layers_are_not_loaded_again_for_the_indices(monkeypatch):
+	monkeypatch.setattr(SpectralIndexEngine, "enabled", staticmethod(lambda: SpectralIndexEngine(["ndre"])))
+	loaded_bands = []
+
+	def load_bands(items, bands, bbox, output_crs, **kwargs):
+		loaded_bands.append(bands)
+		return layers(bands)
+
+	monkeypatch.setattr(STACCatalogProcessor, "_load_bands", staticmethod(load_bands))
+	footprint = box(2.99, 44.99, 3.01, 45.01)
+	item = Item("S2A_31TEJ_20240601_0_L2A", mapping(footprint), list(footprint.bounds), datetime(2024, 6, 1, tzinfo=timezone.utc), {"datetime": "2024-06-01T00:00:00Z"})
+	ProjectionExtension.add_to(item)
+	ProjectionExtension.ext(item).epsg = 32631
+
+	dataset = STACCatalogProcessor._filter_stac_assets([item], [footprint], np.array(footprint.bounds), FakeScenePreprocessor())
+
+	# nir08 comes with the scene layers, only the bands missing from them are read
+	assert loaded_bands == [("red", "green", "blue", "rededge1")]
+	assert {"nir08", "rededge1", "scl_surface"} <= set(dataset.data_vars)
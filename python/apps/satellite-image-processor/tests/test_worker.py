@@ -0,0 +1,41 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+import sys
+import time
+
+import worker
+from worker import LocalWorkQueue, Worker
+
+
+def test_messages_are_kept_hidden_while_they_are_processed(monkeypatch):
+	monkeypatch.setattr(worker, "start_task", lambda *args: time.sleep(0.2))
+	work_queue = LocalWorkQueue(wait_time_seconds=0.01, heartbeat_interval=0.03)
+	work_queue.send({"inputFilename": "input.json", "inputPrefix": "prefix"})
+
+	Worker(work_queue, "bucket", "bus", concurrency=1, idle_timeout=0.1).run()
+
+	assert [message.body["inputPrefix"] for message in work_queue.completed] == ["prefix"]
+	extensions = len(work_queue.extended)
+	assert extensions >= 3
+	# the heartbeat stops with the request
+	time.sleep(0.1)
+	assert len(work_queue.extended) == extensions
+
+
+def test_main_processes_the_inputs_of_a_job_array(monkeypatch):
+	processed = []
+	monkeypatch.setattr(worker, "start_task", lambda filename, prefix, index, *args: processed.append((prefix, index, filename)))
+	monkeypatch.setattr(sys, "argv", ["worker.py", "-o", "bucket", "-e", "bus", "-p", "region=1/result=2/input", "-f", "input.json", "-n", "3", "-t", "0.1"])
+
+	worker.main(worker.build_parser())
+
+	assert sorted(processed) == [("region=1/result=2/input", str(index), "input.json") for index in range(3)]
@@ -0,0 +1,56 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+import numpy as np
+import rioxarray  # noqa: F401 registers the rio accessor
+import xarray as xr
+
+from processors.xarray_utils import XarrayUtils
+
+
+def grid(values: np.ndarray, resolution: float) -> xr.DataArray:
+	height, width = values.shape
+	return xr.DataArray(
+		values,
+		dims=("y", "x"),
+		coords={
+			"y": 1000 - resolution / 2 - np.arange(height) * resolution,
+			"x": 500 + resolution / 2 + np.arange(width) * resolution,
+		},
+	)
+
+
+def test_upsample_by_index_is_a_lazy_gather():
+	scl = grid(np.array([[4, 8], [6, 9]], dtype="uint8"), 20)
+	fine = xr.Dataset({"red": grid(np.zeros((4, 4)), 10)})
+
+	upsampled = XarrayUtils.upsample_by_index(scl, fine)
+
+	# nothing is computed at the fine resolution until the layer is consumed
+	assert upsampled.chunks is not None
+	assert upsampled.dtype == np.uint8
+	np.testing.assert_array_equal(upsampled.values, [
+		[4, 4, 8, 8],
+		[4, 4, 8, 8],
+		[6, 6, 9, 9],
+		[6, 6, 9, 9],
+	])
+	np.testing.assert_array_equal(upsampled["x"], fine["x"])
+	np.testing.assert_array_equal(upsampled["y"], fine["y"])
+
+
+def test_fill_cloud_gap_without_gap_keeps_the_ndvi():
+	ndvi = grid(np.full((2, 2), 0.5), 10)
+	scl_surface = grid(np.array([[4.0, np.nan], [5.0, 6.0]]), 10).chunk()
+
+	filled = XarrayUtils.fill_cloud_gap(scl_surface, ndvi, np.full((1, 2, 2), 0.4))
+
+	np.testing.assert_array_equal(filled.values, ndvi.values)
@@ -0,0 +1,280 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+import argparse
+import json
+import os
+import queue
+import signal
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from aws_clients import get_client
+from initial_process import start_task
+from logger_utils import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class WorkMessage:
+    id: str
+    body: Dict[str, Any]
+    receipt: Any = None
+
+
+class WorkQueue(ABC):
+    """
+    Source of engine requests for the worker. Each message body references the engine request input the same way
+    the Batch job environment does: {"inputPrefix": ..., "inputFilename": ..., "jobArrayIndex": ...}.
+    """
+
+    # seconds between two extensions of the messages being processed, None when messages never become visible again
+    heartbeat_interval: Optional[float] = None
+
+    @abstractmethod
+    def receive(self, max_messages: int) -> List[WorkMessage]:
+        pass
+
+    @abstractmethod
+    def extend(self, message: WorkMessage):
+        """Keeps the message hidden from the other consumers while it is being processed."""
+        pass
+
+    @abstractmethod
+    def complete(self, message: WorkMessage):
+        pass
+
+
+class SqsWorkQueue(WorkQueue):
+    def __init__(self, queue_url: str, visibility_timeout: int, wait_time_seconds: int = 20):
+        self.queue_url = queue_url
+        self.visibility_timeout = visibility_timeout
+        self.wait_time_seconds = wait_time_seconds
+        # extended well before the timeout runs out, a missed heartbeat is caught up by the next one
+        self.heartbeat_interval = visibility_timeout / 3
+        self.sqs = get_client("sqs")
+
+    def receive(self, max_messages: int) -> List[WorkMessage]:
+        response = self.sqs.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=min(max_messages, 10),
+            WaitTimeSeconds=self.wait_time_seconds,
+            VisibilityTimeout=self.visibility_timeout,
+        )
+        return [
+            WorkMessage(
+                id=message["MessageId"],
+                body=json.loads(message["Body"]),
+                receipt=message["ReceiptHandle"],
+            )
+            for message in response.get("Messages", [])
+        ]
+
+    def extend(self, message: WorkMessage):
+        self.sqs.change_message_visibility(
+            QueueUrl=self.queue_url,
+            ReceiptHandle=message.receipt,
+            VisibilityTimeout=self.visibility_timeout,
+        )
+
+    def complete(self, message: WorkMessage):
+        self.sqs.delete_message(QueueUrl=self.queue_url, ReceiptHandle=message.receipt)
+
+
+class LocalWorkQueue(WorkQueue):
+    """
+    In memory stand-in for SQS, used to run the worker locally and in tests.
+    """
+
+    def __init__(self, wait_time_seconds: float = 1, heartbeat_interval: Optional[float] = None):
+        self.messages: "queue.Queue[WorkMessage]" = queue.Queue()
+        self.completed: List[WorkMessage] = []
+        self.extended: List[WorkMessage] = []
+        self.wait_time_seconds = wait_time_seconds
+        self.heartbeat_interval = heartbeat_interval
+
+    def send(self, body: Dict[str, Any]):
+        self.messages.put(WorkMessage(id=str(self.messages.qsize() + len(self.completed)), body=body))
+
+    def receive(self, max_messages: int) -> List[WorkMessage]:
+        received = []
+        try:
+            received.append(self.messages.get(timeout=self.wait_time_seconds))
+            while len(received) < max_messages:
+                received.append(self.messages.get_nowait())
+        except queue.Empty:
+            pass
+        return received
+
+    def extend(self, message: WorkMessage):
+        self.extended.append(message)
+
+    def complete(self, message: WorkMessage):
+        self.completed.append(message)
+
+
+class Worker:
+    """
+    Long-lived processor which pulls engine requests from a queue and processes up to `concurrency` of them at a
+    time, reusing the process wide clients, caches and imports instead of paying a container start per polygon.
+    On SIGTERM/SIGINT it stops pulling new requests and drains the ones in flight before returning.
+    """
+
+    def __init__(
+        self,
+        work_queue: WorkQueue,
+        output_bucket: str,
+        event_bus_name: str,
+        concurrency: int = 1,
+        idle_timeout: Optional[float] = None,
+    ):
+        self.work_queue = work_queue
+        self.output_bucket = output_bucket
+        self.event_bus_name = event_bus_name
+        self.concurrency = concurrency
+        self.idle_timeout = idle_timeout
+        self._draining = threading.Event()
+        self._slots = threading.Semaphore(concurrency)
+
+    def drain(self, *args: Any):
+        logger.info("Draining worker, no new requests will be pulled")
+        self._draining.set()
+
+    def run(self):
+        last_activity = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while not self._draining.is_set():
+                # only pull as many requests as there are free slots
+                self._slots.acquire()
+                free_slots = 1
+                while free_slots < self.concurrency and self._slots.acquire(blocking=False):
+                    free_slots += 1
+
+                messages = [] if self._draining.is_set() else self.work_queue.receive(free_slots)
+                for _ in range(free_slots - len(messages)):
+                    self._slots.release()
+
+                for message in messages:
+                    executor.submit(self._process, message)
+
+                if messages:
+                    last_activity = time.monotonic()
+                elif self.idle_timeout and time.monotonic() - last_activity > self.idle_timeout:
+                    logger.info(f"Worker idle for {self.idle_timeout} seconds, stopping")
+                    self._draining.set()
+        # leaving the executor context waits for the in flight requests
+        logger.info("Worker drained")
+
+    def _heartbeat(self, message: WorkMessage, done: threading.Event):
+        # requests can run longer than the visibility timeout, the message must not be handed to another worker meanwhile
+        while not done.wait(self.work_queue.heartbeat_interval):
+            try:
+                self.work_queue.extend(message)
+            except Exception:
+                logger.warning(f"Visibility of request {message.id} could not be extended.", exc_info=True)
+
+    def _process(self, message: WorkMessage):
+        done = threading.Event()
+        if self.work_queue.heartbeat_interval:
+            threading.Thread(target=self._heartbeat, args=(message, done), daemon=True).start()
+        try:
+            with tempfile.TemporaryDirectory() as work_dir:
+                start_task(
+                    message.body["inputFilename"],
+                    message.body["inputPrefix"],
+                    str(message.body.get("jobArrayIndex", 0)),
+                    self.output_bucket,
+                    self.event_bus_name,
+                    message.body.get("jobId", message.id),
+                    work_dir,
+                )
+            self.work_queue.complete(message)
+        except Exception:
+            # the message is left on the queue, it becomes visible again and is retried (or dead-lettered)
+            logger.error(f"Request {message.id} failed.", exc_info=True)
+        finally:
+            done.set()
+            self._slots.release()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output-bucket", type=str, required=True)
+    parser.add_argument("-e", "--event-bus-name", type=str, required=True)
+    parser.add_argument("-c", "--concurrency", type=int, default=1)
+    parser.add_argument("-t", "--idle-timeout", type=float)
+    # the inputs of a job array (as written by the executor: <input prefix>/<index>/<input filename>)
+    parser.add_argument("-p", "--input-prefix", type=str)
+    parser.add_argument("-f", "--input-filename", type=str)
+    parser.add_argument("-n", "--job-array-size", type=int, default=1)
+    # or a self-managed SQS queue whose messages reference the inputs the same way
+    parser.add_argument("-q", "--queue-url", type=str)
+    parser.add_argument("-v", "--visibility-timeout", type=int)
+    return parser
+
+
+def main(parser: argparse.ArgumentParser):
+    """
+    Runs the worker by hand. It is not part of the deployment, where the executor submits a Batch array job of
+    initial_process per result. Without a queue, the polygons of a job array are processed by a single warm process
+    and the worker stops once they are all done.
+    """
+    args = parser.parse_args()
+    if args.queue_url:
+        if args.visibility_timeout is None:
+            parser.error("--visibility-timeout is required with --queue-url")
+        work_queue = SqsWorkQueue(args.queue_url, args.visibility_timeout)
+        idle_timeout = args.idle_timeout
+    else:
+        if not args.input_prefix or not args.input_filename:
+            parser.error("--input-prefix and --input-filename are required without --queue-url")
+        work_queue = LocalWorkQueue()
+        for index in range(args.job_array_size):
+            work_queue.send(
+                {
+                    "inputPrefix": args.input_prefix,
+                    "inputFilename": args.input_filename,
+                    "jobArrayIndex": index,
+                }
+            )
+        idle_timeout = args.idle_timeout or work_queue.wait_time_seconds
+
+    if not os.getenv("AWS_DEFAULT_REGION") and os.getenv("AWS_REGION"):
+        os.environ["AWS_DEFAULT_REGION"] = os.getenv("AWS_REGION")
+
+    logger.info(
+        f"Starting worker with:\n"
+        f"queue_url {args.queue_url}\n"
+        f"output_bucket {args.output_bucket}\n"
+        f"event_bus_name {args.event_bus_name}\n"
+        f"concurrency {args.concurrency}"
+    )
+
+    worker = Worker(
+        work_queue,
+        args.output_bucket,
+        args.event_bus_name,
+        args.concurrency,
+        idle_timeout,
+    )
+    signal.signal(signal.SIGTERM, worker.drain)
+    signal.signal(signal.SIGINT, worker.drain)
+    worker.run()
+
+
+if __name__ == "__main__":
+    main(build_parser())
@@ -9,16 +9,26 @@
 #   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
 #   and limitations under the License.
 
+import copy
 import json
-from datetime import datetime
-from typing import Any, Dict, List, Optional, Tuple, Type
+import math
+import threading
+from datetime import datetime, timezone
+from inspect import isclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type, Union
 
 import attr
 import httpx
 import morecantile
+from cachetools import TTLCache
+from cachetools.keys import hashkey
+from shapely.geometry import box, shape
 
 from api.backend.agie_stac_reader import STACReader
+from api.backend.mosaic_index import load_mosaic_index
+from api.http_client import get_http_client
 from api.routers.models import CommonFilterQueryParams
+from api.settings import ApiSettings
 from cogeo_mosaic.backends.base import BaseBackend
 from cogeo_mosaic.backends.stac import default_stac_accessor, query_from_link
 from cogeo_mosaic.errors import _HTTP_EXCEPTIONS, MosaicError, NoAssetFoundError
@@ -26,11 +36,24 @@ from cogeo_mosaic.logger import logger
 from cogeo_mosaic.mosaic import MosaicJSON
 from rasterio.crs import CRS
 from rio_tiler.constants import WEB_MERCATOR_TMS, WGS84_CRS
+from rio_tiler.errors import EmptyMosaicError
 from rio_tiler.io import BaseReader
 from rio_tiler.models import ImageData
 from rio_tiler.mosaic import mosaic_reader
+from rio_tiler.mosaic.methods.base import MosaicMethodBase
+from rio_tiler.mosaic.methods.defaults import FirstMethod
 from httpx_auth_awssigv4 import SigV4Auth
 
+RGB_ASSETS = ["red", "green", "blue"]
+
+# 3-band pixel interleaved COG holding red, green and blue, written by the processor alongside the band assets
+VISUAL_ASSET = "visual"
+
+api_settings = ApiSettings()
+
+# Search results per parent quadkey, shared by all the tiles (and requests) falling into the same parent tile
+_search_cache: TTLCache = TTLCache(maxsize=api_settings.search_cache_size, ttl=api_settings.search_cache_ttl)
+_search_cache_lock = threading.Lock()
 
 
 @attr.s
@@ -57,9 +80,23 @@ class AgieSTACBackend(BaseBackend):
 	# max_items |  next_link_key | limit
 	stac_api_options: Dict = attr.ib(factory=dict)
 
+	# when set, the tile searches return the items with their assets and the mosaic entries are the items themselves,
+	# so the reader does not need to fetch every item again
+	embed_items: bool = attr.ib(default=api_settings.search_embed_items)
+
 	# The reader is read-only, we can't pass mosaic_def to the init method
 	mosaic_def: MosaicJSON = attr.ib(init=False)
 
+	# number of asset reads issued by the last `tile` call
+	tile_reads: int = attr.ib(init=False, default=0)
+
+	# features of a single search covering several tiles (see `prefetch_tiles`), used instead of the per tile searches
+	_prefetched_features: Optional[List[Dict]] = attr.ib(init=False, default=None)
+
+	# readers opened by this backend, reused by every tile (and asset) of the same item
+	_readers: Dict[str, BaseReader] = attr.ib(init=False, factory=dict)
+	_readers_lock: threading.Lock = attr.ib(init=False, factory=threading.Lock)
+
 	_backend_name = "Agie"
 
 	@minzoom.default
@@ -96,24 +133,106 @@ class AgieSTACBackend(BaseBackend):
 		"""This method is not used but is required by the abstract class."""
 		pass
 
-	def assets_for_tile(self, x: int, y: int, z: int) -> List[str]:
-		"""Retrieve assets for tile."""
-		bounds = self.tms.bounds(x, y, z)
-		geom = {
-			"type": "Polygon",
-			"coordinates": [
-				[
-					[bounds[0], bounds[3]],
-					[bounds[0], bounds[1]],
-					[bounds[2], bounds[1]],
-					[bounds[2], bounds[3]],
-					[bounds[0], bounds[3]],
-				]
-			],
-		}
-		assets = self.get_assets(geom)
+	def assets_for_tile(self, x: int, y: int, z: int) -> List[Union[str, Dict]]:
+		"""Retrieve assets for tile, the items themselves when they are embedded."""
+		features = self.features_for_tile(x, y, z)
+		if self.embed_items:
+			return features
+		return [default_stac_accessor(f) for f in features]
 
-		return assets
+	def features_for_tile(self, x: int, y: int, z: int) -> List[Dict]:
+		"""
+		Retrieve the features intersecting the tile, out of the quadkey index of the region when it is valid for the
+		request, otherwise out of the (cached) search of its parent tile `search_cache_zoom_offset` levels up, so the
+		tiles of a viewport share one search.
+		"""
+		timestamp = self._timestamp()
+		mosaic_index = load_mosaic_index(self.agie_filters.region_id) if self.agie_filters.region_id is not None else None
+		if self._prefetched_features is not None:
+			features = self._prefetched_features
+		elif mosaic_index is not None and mosaic_index.is_valid_for(timestamp):
+			features = mosaic_index.features_for_tile(self.tms, x, y, z)
+		else:
+			parent_zoom = max(z - api_settings.search_cache_zoom_offset, self.minzoom)
+			parent = self.tms.parent(morecantile.Tile(x, y, z), zoom=parent_zoom)[0] if parent_zoom < z else morecantile.Tile(x, y, z)
+			features = self._cached_search(self.tms.quadkey(parent), self.tms.bounds(parent), timestamp)
+			if features is None:
+				# too many features under the parent tile to share its search, the tile is searched on its own
+				features = self._search(_bounds_geometry(self.tms.bounds(x, y, z)), timestamp, self.stac_api_options, include_assets=self.embed_items)
+
+		if timestamp is not None:
+			features = [f for f in features if datetime.fromisoformat(f["properties"]["datetime"]) <= timestamp]
+
+		tile_box = box(*self.tms.bounds(x, y, z))
+		features = [f for f in self._latest_features(features) if shape(f["geometry"]).intersects(tile_box)]
+		max_items = self.stac_api_options.get("max_items")
+		return features[:max_items] if max_items else features
+
+	def prefetch_tiles(self, tiles: Sequence[Tuple[int, int, int]]):
+		"""Run a single search over the union bounds of the tiles, the features of each tile are then taken from it."""
+		tiles_bounds = [self.tms.bounds(x, y, z) for x, y, z in tiles]
+		bounds = (
+			min(b[0] for b in tiles_bounds),
+			min(b[1] for b in tiles_bounds),
+			max(b[2] for b in tiles_bounds),
+			max(b[3] for b in tiles_bounds),
+		)
+		timestamp = self._timestamp()
+		self._prefetched_features = self._search(
+			_bounds_geometry(bounds),
+			_timestamp_bucket_end(timestamp) if timestamp is not None else None,
+			{**self.stac_api_options, "max_items": None},
+			include_assets=self.embed_items,
+		)
+
+	def search_latest_items(self) -> List[Dict]:
+		"""Search the latest item (with its assets) of every polygon matching the filters, used to build the quadkey index."""
+		features = self._search(
+			_bounds_geometry(self.bounds),
+			self._timestamp(),
+			{**self.stac_api_options, "max_items": None},
+			include_assets=True,
+		)
+		return self._latest_features(features)
+
+	def _timestamp(self) -> Optional[datetime]:
+		timestamp = self.agie_filters.timestamp
+		if timestamp is not None and timestamp.tzinfo is None:
+			timestamp = timestamp.replace(tzinfo=timezone.utc)
+		return timestamp
+
+	def _cached_search(self, quadkey: str, bounds: Tuple[float, float, float, float], timestamp: Optional[datetime]) -> Optional[List[Dict]]:
+		"""
+		Search the features of the parent tile, None when it holds `search_cache_max_items` features or more (the
+		parent search is then skipped for its tiles until the entry expires).
+		"""
+		# the search covers the whole timestamp bucket, the features after the timestamp are filtered out by the caller
+		search_timestamp = _timestamp_bucket_end(timestamp) if timestamp is not None else None
+
+		key = hashkey(
+			self.input,
+			quadkey,
+			self.agie_filters.region_id,
+			search_timestamp.isoformat() if search_timestamp is not None else None,
+			self.embed_items,
+		)
+		with _search_cache_lock:
+			if key in _search_cache:
+				return _search_cache[key]
+
+		max_items = api_settings.search_cache_max_items
+		features = self._search(
+			_bounds_geometry(bounds),
+			search_timestamp,
+			# every feature of the parent tile is needed (max_items is applied per tile), up to the hard cap
+			{**self.stac_api_options, "max_items": max_items},
+			include_assets=self.embed_items,
+		)
+		if len(features) >= max_items:
+			features = None
+		with _search_cache_lock:
+			_search_cache[key] = features
+		return features
 
 	def features_for_bbox(self, bbox: List[float]) -> List[Dict]:
 		"""Retrieve assets for bbox."""
@@ -134,17 +253,23 @@ class AgieSTACBackend(BaseBackend):
 
 	def get_features(self, geom) -> List[Dict]:
 		"""Send query to the STAC-API and retrieve assets."""
+		features = self._search(geom, self.agie_filters.timestamp, self.stac_api_options)
+		return self._latest_features(features)
+
+	def _search(self, geom, timestamp: Optional[datetime], stac_api_options: Dict, include_assets: bool = False) -> List[Dict]:
 		query = self.query.copy()
 		query["intersects"] = geom
-		query["fields"] = {
-			"exclude": [
-				"assets",
-				"stac_version",
-			],
-		}
+		# full items are returned when they are to be read, pystac needs them as is (including the stac_version)
+		if not include_assets:
+			query["fields"] = {
+				"exclude": [
+					"assets",
+					"stac_version",
+				],
+			}
 		query["sortBy"] = [{"field": "properties.datetime", "direction": "desc"}]
-		if self.agie_filters.timestamp is not None:
-			query["datetime"] = f"/{self.agie_filters.timestamp.isoformat()}"
+		if timestamp is not None:
+			query["datetime"] = f"/{timestamp.isoformat()}"
 		if self.agie_filters.region_id is not None:
 			query["collections"] = ["agie-polygon"]
 			query["query"] = {
@@ -153,12 +278,16 @@ class AgieSTACBackend(BaseBackend):
 				}
 			}
 
-		features = _fetch(
+		return _fetch(
 			self.auth,
 			self.input,
 			query,
-			**self.stac_api_options,
+			**stac_api_options,
 		)
+
+	@staticmethod
+	def _latest_features(features: List[Dict]) -> List[Dict]:
+		"""Keep the latest feature of every polygon."""
 		latest_features = {}
 
 		for feature in features:
@@ -205,29 +334,121 @@ class AgieSTACBackend(BaseBackend):
 		if reverse:
 			mosaic_assets = list(reversed(mosaic_assets))
 
-		def _reader(asset: str, x: int, y: int, z: int, **kwargs: Any) -> ImageData:
-			with self.reader(
-				asset,
-				tms=self.tms,
-				fetch_options={
-					"headers": {
-						"Content-Type": "application/json",
-						"Accept-Encoding": "gzip",
-						"Accept": "application/geo+json"
+		def _reader(asset: Union[str, Dict], x: int, y: int, z: int, **kwargs: Any) -> ImageData:
+			src_dst = self._get_reader(asset)
+			if kwargs.get("assets") == RGB_ASSETS and VISUAL_ASSET in src_dst.assets:
+				# one dataset open and one set of range reads instead of three
+				kwargs = {**kwargs, "assets": [VISUAL_ASSET]}
+			return src_dst.tile(x, y, z, **kwargs)
+
+		# with threads, mosaic_reader reads the assets by batches of `threads` and stops issuing reads as soon as the
+		# pixel selection (first valid pixel by default) has filled the whole tile. A whole batch is read before that
+		# check though, so the latest mosaic_first_read_assets are read on their own first: they cover the tile most
+		# of the time and the remaining assets are only read when they do not
+		reads = 0
+		reads_lock = threading.Lock()
+
+		def _counted_reader(asset: Union[str, Dict], x: int, y: int, z: int, **kwargs: Any) -> ImageData:
+			nonlocal reads
+			with reads_lock:
+				reads += 1
+			return _reader(asset, x, y, z, **kwargs)
+
+		threads = kwargs.pop("threads", api_settings.mosaic_read_threads)
+		pixel_selection = kwargs.pop("pixel_selection", FirstMethod)
+		first_assets = mosaic_assets[:api_settings.mosaic_first_read_assets]
+		if threads <= 1 or not first_assets or len(first_assets) == len(mosaic_assets):
+			img, assets_used = mosaic_reader(
+				mosaic_assets, _counted_reader, x, y, z, pixel_selection=pixel_selection, threads=threads, **kwargs
+			)
+		else:
+			# the reads (or errors) of the first assets are kept, so they are not read again with the others
+			kept_reads: Dict[int, Union[ImageData, Exception]] = {}
+
+			def _kept_reader(asset: Union[str, Dict], x: int, y: int, z: int, **kwargs: Any) -> ImageData:
+				if id(asset) not in kept_reads:
+					try:
+						kept_reads[id(asset)] = _counted_reader(asset, x, y, z, **kwargs)
+					except Exception as e:
+						kept_reads[id(asset)] = e
+				result = kept_reads[id(asset)]
+				if isinstance(result, Exception):
+					raise result
+				return result
+
+			first_selection = _new_pixel_selection(pixel_selection)
+			try:
+				img, assets_used = mosaic_reader(
+					first_assets, _kept_reader, x, y, z,
+					pixel_selection=first_selection, threads=min(threads, len(first_assets)), **kwargs
+				)
+			except EmptyMosaicError:
+				img = None
+			if img is None or not first_selection.is_done:
+				img, assets_used = mosaic_reader(
+					mosaic_assets, _kept_reader, x, y, z,
+					pixel_selection=_new_pixel_selection(pixel_selection), threads=threads, **kwargs
+				)
+
+		self.tile_reads = reads
+		logger.debug(f"Tile {z}-{x}-{y}: {reads} reads for {len(mosaic_assets)} assets")
+		return img, assets_used
+
+	def _get_reader(self, asset: Union[str, Dict]) -> BaseReader:
+		"""Return the reader of the item, opened once per backend and shared by the tiles reading it."""
+		# an embedded item is handed to the reader as is, without fetching it again
+		item = asset if isinstance(asset, dict) else None
+		href = default_stac_accessor(asset) if item is not None else asset
+		with self._readers_lock:
+			if href not in self._readers:
+				self._readers[href] = self.reader(
+					href,
+					item=item,
+					tms=self.tms,
+					fetch_options={
+						"headers": {
+							"Content-Type": "application/json",
+							"Accept-Encoding": "gzip",
+							"Accept": "application/geo+json"
+						},
+						"auth": self.auth
 					},
-					"auth": self.auth
-				},
-				**self.reader_options,
-			) as src_dst:
-				return src_dst.tile(x, y, z, **kwargs)
+					**self.reader_options,
+				)
+			return self._readers[href]
+
+	def close(self):
+		"""Close the readers opened by the backend."""
+		for src_dst in self._readers.values():
+			src_dst.close()
+		self._readers.clear()
+
+
+def _new_pixel_selection(pixel_selection: Union[Type[MosaicMethodBase], MosaicMethodBase]) -> MosaicMethodBase:
+	"""Return an unfed pixel selection, mosaic_reader feeds the instance it is given."""
+	return pixel_selection() if isclass(pixel_selection) else copy.copy(pixel_selection)
+
+
+def _bounds_geometry(bounds: Tuple[float, float, float, float]) -> Dict:
+	return {
+		"type": "Polygon",
+		"coordinates": [
+			[
+				[bounds[0], bounds[3]],
+				[bounds[0], bounds[1]],
+				[bounds[2], bounds[1]],
+				[bounds[2], bounds[3]],
+				[bounds[0], bounds[3]],
+			]
+		],
+	}
+
 
-		return mosaic_reader(mosaic_assets, _reader, x, y, z, **kwargs)
+def _timestamp_bucket_end(timestamp: datetime) -> datetime:
+	bucket = api_settings.search_cache_timestamp_bucket
+	return datetime.fromtimestamp(math.ceil(timestamp.timestamp() / bucket) * bucket, tz=timezone.utc)
 
 
-# @cached(  # type: ignore
-#     TTLCache(maxsize=cache_config.maxsize, ttl=cache_config.ttl),
-#     key=lambda url, query, **kwargs: hashkey(url, json.dumps(query), **kwargs),
-# )
 def _fetch(  # noqa: C901
 	auth: SigV4Auth,
 	stac_url: str,
@@ -251,7 +472,7 @@ def _fetch(  # noqa: C901
 
 	def _stac_search(url: str, q: Dict):
 		try:
-			r = httpx.post(url, headers=headers, json=q, auth=auth)
+			r = get_http_client().post(url, headers=headers, json=q, auth=auth)
 			r.raise_for_status()
 		except httpx.HTTPStatusError as e:
 			# post-flight errors
@@ -328,7 +549,7 @@ def fetch_feature(auth: SigV4Auth, stac_url: str, collection_id: str = None, ite
 	if collection_id is None or item_id is None:
 		raise ValueError("Both collection_id and item_id must be provided.")
 	try:
-		r = httpx.get(url, headers=headers, auth=auth)
+		r = get_http_client().get(url, headers=headers, auth=auth)
 		r.raise_for_status()
 	except httpx.HTTPStatusError as e:
 		# post-flight errors
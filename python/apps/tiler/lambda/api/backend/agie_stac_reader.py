@@ -14,11 +14,10 @@
 import json
 import os
 import warnings
-from typing import Any, Dict, Iterator, Optional, Set, Type, Union
+from typing import Any, Dict, Iterator, Optional, Sequence, Set, Type, Union
 from urllib.parse import urlparse
 
 import attr
-import httpx
 import pystac
 import rasterio
 from cachetools import LRUCache, cached
@@ -29,8 +28,11 @@ from rio_tiler.constants import WEB_MERCATOR_TMS, WGS84_CRS
 from rio_tiler.errors import InvalidAssetName, MissingAssets
 from rio_tiler.io.base import BaseReader, MultiBaseReader
 from rio_tiler.io.rasterio import Reader
+from rio_tiler.models import ImageData
 from rio_tiler.types import AssetInfo
 
+from api.http_client import get_client, get_http_client
+
 try:
 	from boto3.session import Session as boto3_session
 
@@ -61,26 +63,6 @@ def aws_get_object(
 		raise AssertionError("'boto3' must be installed to use s3:// urls")
 
 	if not client:
-		if profile_name := os.environ.get("AWS_PROFILE", None):
-			session = boto3_session(profile_name=profile_name)
-
-		else:
-			access_key = os.environ.get("AWS_ACCESS_KEY_ID", None)
-			secret_access_key = os.environ.get("AWS_SECRET_ACCESS_KEY", None)
-			access_token = os.environ.get("AWS_SESSION_TOKEN", None)
-
-			# AWS_REGION is GDAL specific. Later overloaded by standard AWS_DEFAULT_REGION
-			region_name = os.environ.get(
-				"AWS_DEFAULT_REGION", os.environ.get("AWS_REGION", None)
-			)
-
-			session = boto3_session(
-				aws_access_key_id=access_key,
-				aws_secret_access_key=secret_access_key,
-				aws_session_token=access_token,
-				region_name=region_name or None,
-			)
-
 		# AWS_S3_ENDPOINT and AWS_HTTPS are GDAL config options of vsis3 driver
 		# https://gdal.org/user/virtual_file_systems.html#vsis3-aws-s3-files
 		endpoint_url = os.environ.get("AWS_S3_ENDPOINT", None)
@@ -92,7 +74,8 @@ def aws_get_object(
 			else:
 				endpoint_url = "http://" + endpoint_url
 
-		client = session.client("s3", endpoint_url=endpoint_url)
+		# the shared session resolves AWS_PROFILE and the AWS_* credentials variables itself
+		client = get_client("s3", endpoint_url)
 
 	params = {"Bucket": bucket, "Key": key}
 	if request_pays or os.environ.get("AWS_REQUEST_PAYER", "").lower() == "requester":
@@ -129,7 +112,7 @@ def fetch(filepath: str, **kwargs: Any) -> Dict:
 	elif parsed.scheme in ["https", "http", "ftp"]:
 		print(filepath)
 		print(kwargs)
-		resp = httpx.get(filepath, **kwargs)
+		resp = get_http_client().get(filepath, **kwargs)
 		resp.raise_for_status()
 		return resp.json()
 
@@ -326,9 +309,35 @@ class STACReader(MultiBaseReader):
 				and len(stats) == len(bands)
 			):
 				info["dataset_statistics"] = stats
-			else:
+			elif stats:
 				warnings.warn(
 					"Some statistics data in STAC are invalid, they will be ignored."
 				)
 
 		return info
+
+	def _is_scaled(self, asset: str) -> bool:
+		"""Check if the asset is stored as scaled values (e.g. NDVI encoded as scaled int16)."""
+		bands = self.item.assets[asset].extra_fields.get("raster:bands") or []
+		return any(
+			b.get("scale", 1) != 1 or b.get("offset", 0) != 0 for b in bands
+		)
+
+	def tile(
+		self,
+		tile_x: int,
+		tile_y: int,
+		tile_z: int,
+		assets: Union[Sequence[str], str] = None,
+		**kwargs: Any,
+	) -> ImageData:
+		"""Read tile from multiple assets, scaled assets are returned unscaled (in their physical values)."""
+		if isinstance(assets, str):
+			assets = (assets,)
+
+		if assets and "unscale" not in kwargs:
+			kwargs["unscale"] = any(
+				self._is_scaled(asset) for asset in assets if asset in self.assets
+			)
+
+		return super().tile(tile_x, tile_y, tile_z, assets=assets, **kwargs)
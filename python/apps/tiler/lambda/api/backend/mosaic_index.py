@@ -0,0 +1,173 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+import gzip
+import json
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import attr
+import morecantile
+from botocore.exceptions import ClientError
+from cachetools import TTLCache
+from cogeo_mosaic.mosaic import MosaicJSON
+from shapely.geometry import box, shape
+
+from api.http_client import get_client
+from api.settings import ApiSettings
+
+api_settings = ApiSettings()
+
+# Loaded indexes per region (None when the region has no index), reloaded every search_cache_ttl
+_index_cache: TTLCache = TTLCache(maxsize=64, ttl=api_settings.search_cache_ttl)
+_index_cache_lock = threading.Lock()
+
+
+def mosaic_index_key(region_id: str) -> str:
+	return f"{api_settings.mosaic_index_prefix}/{region_id}.json.gz"
+
+
+@attr.s
+class RegionMosaicIndex:
+	"""
+	MosaicJSON quadkey index of the latest result item of every polygon of a region. The tiles of the MosaicJSON list
+	the self links of the items, the items themselves (with their assets) are stored alongside.
+	"""
+
+	region_id: str = attr.ib()
+	mosaic: MosaicJSON = attr.ib()
+	items: Dict[str, Dict] = attr.ib()
+	created_at: datetime = attr.ib()
+	# datetime of the most recent item, the index does not describe the region as it was before that
+	latest_datetime: Optional[datetime] = attr.ib(default=None)
+
+	@classmethod
+	def from_items(cls, region_id: str, items: List[Dict], tms: morecantile.TileMatrixSet, quadkey_zoom: int) -> "RegionMosaicIndex":
+		tiles: Dict[str, List[str]] = {}
+		indexed_items: Dict[str, Dict] = {}
+		for item in items:
+			href = _self_link(item)
+			footprint = shape(item["geometry"])
+			for tile in tms.tiles(*footprint.bounds, zooms=[quadkey_zoom]):
+				if footprint.intersects(box(*tms.bounds(tile))):
+					tiles.setdefault(tms.quadkey(tile), []).append(href)
+			indexed_items[href] = item
+
+		datetimes = [datetime.fromisoformat(item["properties"]["datetime"]) for item in items]
+		bboxes = [shape(item["geometry"]).bounds for item in items]
+		bounds = (
+			[min(b[0] for b in bboxes), min(b[1] for b in bboxes), max(b[2] for b in bboxes), max(b[3] for b in bboxes)]
+			if bboxes else [-180, -90, 180, 90]
+		)
+		mosaic = MosaicJSON(
+			mosaicjson="0.0.3",
+			name=f"region {region_id}",
+			bounds=bounds,
+			minzoom=tms.minzoom,
+			maxzoom=tms.maxzoom,
+			quadkey_zoom=quadkey_zoom,
+			tiles=tiles,
+		)
+		return cls(
+			region_id=region_id,
+			mosaic=mosaic,
+			items=indexed_items,
+			created_at=datetime.now(timezone.utc),
+			latest_datetime=max(datetimes) if datetimes else None,
+		)
+
+	def features_for_tile(self, tms: morecantile.TileMatrixSet, x: int, y: int, z: int) -> List[Dict]:
+		"""Return the candidate items of the tile, their footprints are still to be intersected with the tile."""
+		quadkey_zoom = self.mosaic.quadkey_zoom
+		tile = morecantile.Tile(x, y, z)
+		if z > quadkey_zoom:
+			tiles = tms.parent(tile, zoom=quadkey_zoom)
+		elif z < quadkey_zoom:
+			tiles = tms.children(tile, zoom=quadkey_zoom)
+		else:
+			tiles = [tile]
+
+		# items are kept once, latest first as the searches return them
+		hrefs = dict.fromkeys(href for t in tiles for href in self.mosaic.tiles.get(tms.quadkey(t), []))
+		return sorted(
+			(self.items[href] for href in hrefs),
+			key=lambda item: datetime.fromisoformat(item["properties"]["datetime"]),
+			reverse=True,
+		)
+
+	@property
+	def version(self) -> str:
+		return self.created_at.isoformat()
+
+	def is_valid_for(self, timestamp: Optional[datetime]) -> bool:
+		if (datetime.now(timezone.utc) - self.created_at).total_seconds() > api_settings.mosaic_index_max_age:
+			return False
+		# the index only holds the latest results, a view of the region in the past is searched instead
+		if timestamp is not None and self.latest_datetime is not None and timestamp < self.latest_datetime:
+			return False
+		return True
+
+	def to_dict(self) -> Dict:
+		return {
+			"region_id": self.region_id,
+			"mosaic": self.mosaic.model_dump(exclude_none=True),
+			"items": self.items,
+			"created_at": self.created_at.isoformat(),
+			"latest_datetime": self.latest_datetime.isoformat() if self.latest_datetime is not None else None,
+		}
+
+	@classmethod
+	def from_dict(cls, content: Dict) -> "RegionMosaicIndex":
+		return cls(
+			region_id=content["region_id"],
+			mosaic=MosaicJSON(**content["mosaic"]),
+			items=content["items"],
+			created_at=datetime.fromisoformat(content["created_at"]),
+			latest_datetime=datetime.fromisoformat(content["latest_datetime"]) if content.get("latest_datetime") else None,
+		)
+
+	def save(self, bucket: str):
+		get_client("s3").put_object(
+			Bucket=bucket,
+			Key=mosaic_index_key(self.region_id),
+			Body=gzip.compress(json.dumps(self.to_dict()).encode()),
+			ContentType="application/json",
+			ContentEncoding="gzip",
+		)
+		with _index_cache_lock:
+			_index_cache.pop(self.region_id, None)
+
+
+def load_mosaic_index(region_id: str) -> Optional[RegionMosaicIndex]:
+	"""Return the index of the region, None when indexing is not configured or the region has not been indexed."""
+	if not api_settings.mosaic_index_bucket:
+		return None
+
+	with _index_cache_lock:
+		if region_id in _index_cache:
+			return _index_cache[region_id]
+
+	try:
+		response = get_client("s3").get_object(Bucket=api_settings.mosaic_index_bucket, Key=mosaic_index_key(region_id))
+		index = RegionMosaicIndex.from_dict(json.loads(gzip.decompress(response["Body"].read())))
+	except ClientError as e:
+		if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+			raise
+		index = None
+
+	with _index_cache_lock:
+		_index_cache[region_id] = index
+	return index
+
+
+def _self_link(item: Dict) -> str:
+	return next(link["href"] for link in item["links"] if link["rel"] == "self")
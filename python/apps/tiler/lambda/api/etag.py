@@ -0,0 +1,51 @@
+"""ETags and conditional requests."""
+
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+import hashlib
+from typing import Any, Dict, List, Optional
+
+from api.tile_cache import tile_cache_key
+
+
+def item_signature(item: Dict) -> Dict:
+    """
+    What identifies the rendering of an item: its id, datetime and the checksums of its assets (when the item carries
+    them). A reprocessed result gets new checksums, so the tiles it contributes to get a new ETag.
+    """
+    return {
+        "id": item["id"],
+        "datetime": item["properties"]["datetime"],
+        "checksums": {
+            name: asset["file:checksum"]
+            for name, asset in sorted(item.get("assets", {}).items())
+            if "file:checksum" in asset
+        },
+    }
+
+
+def items_etag(items: List[Dict], **params: Any) -> str:
+    """Strong ETag of a response rendered from the items with the given parameters, computed without any read."""
+    return f'"{tile_cache_key(items=[item_signature(item) for item in items], **params)}"'
+
+
+def content_etag(content: bytes) -> str:
+    return f'"{hashlib.sha256(content).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether the `If-None-Match` header of the request matches the ETag, weak comparison as per RFC 9110."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
@@ -0,0 +1,96 @@
+"""Process wide HTTP client and SigV4 credentials."""
+
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+import importlib.util
+import os
+import threading
+from functools import lru_cache
+from typing import Any, Optional
+
+import boto3
+import httpx
+from botocore.config import Config
+from botocore.credentials import ReadOnlyCredentials
+from httpx_auth_awssigv4 import SigV4Auth
+
+from api.settings import ApiSettings
+
+api_settings = ApiSettings()
+
+
+@lru_cache(maxsize=1)
+def get_http_client() -> httpx.Client:
+    """
+    Return the client shared by the backend, the reader and the routers, its connections to the STAC API are kept
+    alive across requests (and warm Lambda invocations). HTTP/2 is used when the h2 package is installed.
+    """
+    return httpx.Client(
+        http2=importlib.util.find_spec("h2") is not None,
+        limits=httpx.Limits(
+            max_connections=api_settings.http_max_connections,
+            max_keepalive_connections=api_settings.http_max_keepalive_connections,
+        ),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_session() -> boto3.Session:
+    """Return the boto3 session shared by the tiler, botocore refreshes its credentials when they near expiry."""
+    return boto3.Session()
+
+
+@lru_cache(maxsize=None)
+def get_client(service_name: str, endpoint_url: Optional[str] = None) -> Any:
+    """
+    Return the client of the service shared by the whole process, boto3 clients are thread safe so its connection pool
+    is kept across requests (and warm Lambda invocations) instead of a client being created per store or call.
+    """
+    return get_session().client(
+        service_name,
+        endpoint_url=endpoint_url,
+        config=Config(max_pool_connections=api_settings.http_max_connections),
+    )
+
+
+class SigV4AuthProvider:
+    """
+    Hands out a SigV4Auth built from the credentials of a single boto3 session. The session only refreshes its
+    credentials when they get close to their expiry, and the auth is only rebuilt when they changed.
+    """
+
+    def __init__(self, service: str, region: Optional[str]):
+        self.service = service
+        self.region = region
+        self.session = get_session()
+        self.lock = threading.Lock()
+        self._credentials: Optional[ReadOnlyCredentials] = None
+        self._auth: Optional[SigV4Auth] = None
+
+    def get_auth(self) -> SigV4Auth:
+        credentials = self.session.get_credentials().get_frozen_credentials()
+        with self.lock:
+            if credentials != self._credentials:
+                self._auth = SigV4Auth(
+                    access_key=credentials.access_key,
+                    secret_key=credentials.secret_key,
+                    token=credentials.token,
+                    service=self.service,
+                    region=self.region,
+                )
+                self._credentials = credentials
+            return self._auth
+
+
+@lru_cache(maxsize=1)
+def get_auth_provider() -> SigV4AuthProvider:
+    return SigV4AuthProvider(service="execute-api", region=os.getenv("AWS_REGION"))
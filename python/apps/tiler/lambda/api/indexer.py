@@ -0,0 +1,135 @@
+"""Quadkey index builder and tile pyramid seeding, triggered by the results published for a region."""
+
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+import time
+from typing import Any, Dict, List, Optional
+
+from cogeo_mosaic.errors import NoAssetFoundError
+from cogeo_mosaic.logger import logger
+from rio_tiler.errors import EmptyMosaicError, InvalidAssetName, MissingAssets
+
+from api.backend.agie_stac_backend import RGB_ASSETS, AgieSTACBackend
+from api.backend.mosaic_index import RegionMosaicIndex
+from api.http_client import get_auth_provider, get_client
+from api.routers.models import CommonFilterQueryParams, ImageType
+from api.routers.stac import render_tile, tile_backend
+from api.settings import ApiSettings
+from api.tile_seed import SeededTileStore
+
+api_settings = ApiSettings()
+
+
+class ResultNotIngestedError(Exception):
+    """The items of the result are not all searchable yet, the event is retried by the asynchronous invocation."""
+
+
+def build_region_index(region_id: str) -> RegionMosaicIndex:
+    """Search the latest result item of every polygon of the region and index them by quadkey."""
+    backend = AgieSTACBackend(
+        f"{api_settings.stac_url}search",
+        auth=get_auth_provider().get_auth(),
+        agie_filters=CommonFilterQueryParams(region_id=region_id, timestamp=None),
+    )
+    items = backend.search_latest_items()
+    return RegionMosaicIndex.from_items(region_id, items, backend.tms, api_settings.mosaic_index_zoom)
+
+
+def result_polygon_count(region_id: str, result_id: str) -> Optional[int]:
+    """
+    Return the number of polygons processed for the result, one processor input was written per polygon by the
+    executor. None when the input bucket is not configured.
+    """
+    if not api_settings.engine_input_bucket:
+        return None
+    paginator = get_client("s3").get_paginator("list_objects_v2")
+    pages = paginator.paginate(Bucket=api_settings.engine_input_bucket, Prefix=f"region={region_id}/result={result_id}/input/")
+    return sum(page.get("KeyCount", 0) for page in pages)
+
+
+def build_result_index(region_id: str, result_id: str) -> RegionMosaicIndex:
+    """
+    Build the index of the region once the items of every polygon of the result are searchable, an index missing some
+    of them would be served until it expires.
+    """
+    expected = result_polygon_count(region_id, result_id)
+    for attempt in range(api_settings.mosaic_index_retry_attempts + 1):
+        index = build_region_index(region_id)
+        # the item of a polygon is published as <result id>_<polygon id>
+        ingested = sum(1 for item in index.items.values() if item["id"].startswith(f"{result_id}_"))
+        if expected is None or ingested >= expected:
+            return index
+        if attempt < api_settings.mosaic_index_retry_attempts:
+            logger.info(f"{ingested} of the {expected} items of result {result_id} are searchable, searching again")
+            time.sleep(api_settings.mosaic_index_retry_delay)
+    raise ResultNotIngestedError(f"Only {ingested} of the {expected} items of result {result_id} are searchable")
+
+
+def seed_region_tiles(index: RegionMosaicIndex, store: SeededTileStore) -> int:
+    """
+    Render the tiles of every image type between `tile_seed_min_zoom` and `tile_seed_max_zoom` over the bounds of the
+    region out of its (saved) index, and return the number of tiles stored. The tiles without any asset are skipped.
+    """
+    filter_params = CommonFilterQueryParams(region_id=index.region_id, timestamp=None)
+    tilesize = api_settings.tile_seed_tilesize
+    image_types = seeded_image_types(index)
+    seeded = 0
+    with tile_backend(filter_params, get_auth_provider().get_auth()) as mosaic:
+        zooms = list(range(api_settings.tile_seed_min_zoom, api_settings.tile_seed_max_zoom + 1))
+        for tile in mosaic.tms.tiles(*index.mosaic.bounds, zooms=zooms):
+            for image_type in image_types:
+                try:
+                    content = render_tile(mosaic, tile.x, tile.y, tile.z, image_type, tilesize)
+                except (NoAssetFoundError, EmptyMosaicError):
+                    # no item over the tile
+                    continue
+                except (InvalidAssetName, MissingAssets) as e:
+                    # one of the items of the tile does not carry the asset (e.g. no ndvi_change on a first result),
+                    # the tile is left to the on the fly rendering
+                    logger.warning(f"Tile {tile.z}-{tile.x}-{tile.y} not seeded for {image_type.value}: {e}")
+                    continue
+                store.set(
+                    store.key(index.region_id, image_type.value, tilesize, tile.z, tile.x, tile.y),
+                    index.version,
+                    content,
+                    "image/png",
+                )
+                seeded += 1
+    return seeded
+
+
+def seeded_image_types(index: RegionMosaicIndex) -> List[ImageType]:
+    """The image types whose assets are carried by at least one indexed item."""
+    asset_names = {name for item in index.items.values() for name in item.get("assets", {})}
+    return [
+        image_type
+        for image_type in ImageType
+        if set(RGB_ASSETS if image_type == ImageType.rgb else [image_type.value]) <= asset_names
+    ]
+
+
+def handler(event: Dict[str, Any], context: Any):
+    """
+    Handle the `Result>updated` event of a succeeded result by rebuilding the index of its region, then seeding its
+    tile pyramid when a seed bucket is configured.
+    """
+    # the detail is a DomainEvent of the result: {resourceType, eventType, id, old, new}
+    result = event["detail"]["new"]
+    region_id = result["regionId"]
+    index = build_result_index(region_id, result["id"])
+    index.save(api_settings.mosaic_index_bucket)
+    logger.info(f"Indexed {len(index.items)} items of region {region_id} in {len(index.mosaic.tiles)} quadkeys")
+
+    store = SeededTileStore.from_settings(api_settings)
+    if store is not None:
+        seeded = seed_region_tiles(index, store)
+        logger.info(f"Seeded {seeded} tiles of region {region_id}")
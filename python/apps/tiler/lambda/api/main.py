@@ -42,6 +42,7 @@ if api_settings.cors_origins:
         allow_credentials=True,
         allow_methods=api_settings.cors_allow_methods,
         allow_headers=["*"],
+        expose_headers=["ETag"],
     )
 add_exception_handlers(app, DEFAULT_STATUS_CODES)
 add_exception_handlers(app, MOSAIC_STATUS_CODES)
@@ -54,4 +55,5 @@ if api_settings.cors_origins:
         allow_credentials=True,
         allow_methods=api_settings.cors_allow_methods,
         allow_headers=["*"],
+        expose_headers=["ETag"],
     )
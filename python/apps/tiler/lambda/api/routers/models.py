@@ -9,12 +9,15 @@
 #   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
 #   and limitations under the License.
 
+from dataclasses import dataclass
 from datetime import datetime, timezone
 from enum import Enum
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
 from pydantic import BaseModel
 
+from api.settings import ApiSettings
+
 
 class CommonFilterQueryParams(BaseModel):
     group_id: Optional[str] = None
@@ -39,13 +42,60 @@ class CommonFilterQueryParams(BaseModel):
         }
 
 
-class ImageType(str, Enum):
+@dataclass(frozen=True)
+class IndexStyle:
+    """Rendering of a single band index layer, its values are rescaled from `value_range` onto the colormap."""
+
+    value_range: Tuple[float, float] = (-1, 1)
+    colormap: str = "RdYlGn"
+
+
+# Index layers published by the processor. The spectral indices enabled through SPECTRAL_INDICES get the default style
+# unless they are declared here, so a new index of the processor needs no change to the tiler.
+INDEX_STYLES: Dict[str, IndexStyle] = {
+    "ndvi": IndexStyle(),
+    "ndvi_raw": IndexStyle(),
+    "ndvi_change": IndexStyle(),
+}
+for _index in ApiSettings().spectral_indices.split(","):
+    if _index.strip():
+        INDEX_STYLES.setdefault(_index.strip(), IndexStyle())
+
+# the layers of every result, then the enabled spectral indices (scl_surface, nitrogen_metadata and nir08 are not served)
+ImageType = Enum("ImageType", {name: name for name in ["rgb", "ndvi", "ndvi_raw", "ndvi_change", "scl", *INDEX_STYLES]}, type=str)
+
+
+class ThumbnailType(str, Enum):
     rgb = "rgb"
     ndvi = "ndvi"
-    ndvi_raw = "ndvi_raw"
     ndvi_change = "ndvi_change"
-    scl = "scl"
 
-    # scl_surface = "scl_surface"
-    # nitrogen_metadata = "nitrogen_metadata"
-    # nir08 = "nir08"
+
+class TileFormat(str, Enum):
+    png = "png"
+    webp = "webp"
+    jpeg = "jpeg"
+    # raw values and mask as a numpy array, styled by the client
+    npy = "npy"
+
+    @property
+    def media_type(self) -> str:
+        return {
+            TileFormat.png: "image/png",
+            TileFormat.webp: "image/webp",
+            TileFormat.jpeg: "image/jpeg",
+            TileFormat.npy: "application/x-binary",
+        }[self]
+
+
+class TileIndex(BaseModel):
+    z: int
+    x: int
+    y: int
+
+
+class BatchTilesRequest(BaseModel):
+    tiles: List[TileIndex]
+    image_type: ImageType = ImageType.rgb
+    tilesize: int = 512
+    tile_format: TileFormat = TileFormat.png
@@ -10,34 +10,66 @@
 #   and limitations under the License.
 
 import json
-import os
-from typing import Dict, List
+import zipfile
+from datetime import timezone
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
 
-import boto3
-from fastapi import APIRouter, Depends, Query, Response
+from fastapi import APIRouter, Depends, Header, Query, Response
 from httpx_auth_awssigv4 import SigV4Auth
+from cogeo_mosaic.errors import NoAssetFoundError
+from rasterio.io import MemoryFile
 from rio_tiler.colormap import cmap
+from rio_tiler.errors import EmptyMosaicError
+from rio_tiler.models import ImageData
 
-from api.backend.agie_stac_backend import AgieSTACBackend, fetch_feature
-from api.errors import BadRequestError
+from api.backend.agie_stac_backend import RGB_ASSETS, AgieSTACBackend, fetch_feature
+from api.backend.mosaic_index import load_mosaic_index
+from api.errors import BadRequestError, TileNotFoundError
+from api.etag import content_etag, etag_matches, items_etag
+from api.http_client import get_auth_provider, get_client
 from api.settings import ApiSettings
-from .models import CommonFilterQueryParams, ImageType
+from api.tile_cache import TILE_CACHE_HEADER, CachedTile, TileCache, tile_cache_key
+from api.tile_seed import SeededTileStore
+from .models import INDEX_STYLES, BatchTilesRequest, CommonFilterQueryParams, ImageType, ThumbnailType, TileFormat
 
 api_settings = ApiSettings()
+tile_cache = TileCache(api_settings)
+seeded_tile_store = SeededTileStore.from_settings(api_settings)
+
+TILE_READS_HEADER = "X-Tile-Reads"
+
+SCL_COLORMAP = {
+	0: (0, 0, 0, 255),  # No Data (Missing data)
+	1: (255, 0, 0, 255),  # Saturated or defective pixel
+	2: (47, 47, 47, 255),  # Topographic casted shadows
+	3: (100, 50, 0, 255),  # Cloud shadows
+	4: (0, 160, 0, 255),  # Vegetation
+	5: (255, 230, 90, 255),  # Not-vegetated
+	6: (0, 0, 255, 255),  # Water
+	7: (128, 128, 128, 255),  # Unclassified
+	8: (192, 192, 192, 255),  # Cloud medium probability
+	9: (255, 255, 255, 255),  # Cloud high probability
+	10: (100, 200, 255, 255),  # Thin cirrus
+	11: (255, 150, 255, 255),  # Snow or ice
+}
+
+# palette entry of the masked pixels of a palette PNG
+PALETTE_NODATA = 255
+
+# formats each image type can be rendered to, in order of preference; JPEG has no transparency, it is only offered for
+# the true color layer
+TILE_FORMATS = {
+	image_type: [TileFormat.png, TileFormat.webp, TileFormat.npy] for image_type in ImageType
+} | {ImageType.rgb: [TileFormat.png, TileFormat.webp, TileFormat.jpeg, TileFormat.npy]}
 
 router = APIRouter()
 agie_query: Dict = {}
 
 
 def get_auth() -> SigV4Auth:
-	credentials = boto3.Session().get_credentials()
-	return SigV4Auth(
-		access_key=credentials.access_key,
-		secret_key=credentials.secret_key,
-		token=credentials.token,
-		service="execute-api",
-		region=os.getenv("AWS_REGION"),
-	)
+	return get_auth_provider().get_auth()
 
 
 def parse_bounding_box(
@@ -59,6 +91,7 @@ def parse_bounding_box(
 def get_features(
 	bbox: List[float] = Depends(parse_bounding_box),
 	filter_params: CommonFilterQueryParams = Depends(),
+	if_none_match: Optional[str] = Header(None),
 	aws_auth: SigV4Auth = Depends(get_auth),
 ):
 	with AgieSTACBackend(
@@ -70,17 +103,171 @@ def get_features(
 		maxzoom=16,
 	) as mosaic:
 		features = mosaic.features_for_bbox(bbox)
-	return Response(content=json.dumps(features), media_type="application/json")
+	return conditional_response(json.dumps(features).encode(), "application/json", if_none_match)
 
 
 @router.get("/feature", response_class=Response)
 def get_feature(
 	collection_id: str = Query(...),
 	item_id: str = Query(...),
+	if_none_match: Optional[str] = Header(None),
 	aws_auth: SigV4Auth = Depends(get_auth),
 ):
 	feature = fetch_feature(stac_url=api_settings.stac_url, collection_id=collection_id, item_id=item_id, auth=aws_auth)
-	return Response(content=json.dumps(feature), media_type="application/json")
+	return conditional_response(json.dumps(feature).encode(), "application/json", if_none_match)
+
+
+def conditional_response(content: bytes, media_type: str, if_none_match: Optional[str]) -> Response:
+	"""Response with an ETag of its content, only the headers are returned when the client holds it already."""
+	headers = {"ETag": content_etag(content), "Cache-Control": api_settings.cache_control}
+	if etag_matches(if_none_match, headers["ETag"]):
+		return Response(status_code=304, headers=headers)
+	return Response(content, media_type=media_type, headers=headers)
+
+
+@router.get("/thumbnail", response_class=Response)
+def get_thumbnail(
+	collection_id: str = Query(...),
+	item_id: str = Query(...),
+	image_type: ThumbnailType = Query(ThumbnailType.rgb, description="The image type"),
+	if_none_match: Optional[str] = Header(None),
+	aws_auth: SigV4Auth = Depends(get_auth),
+):
+	# the quicklooks are rendered by the processor, they are returned as is without any raster read
+	feature = fetch_feature(stac_url=api_settings.stac_url, collection_id=collection_id, item_id=item_id, auth=aws_auth)
+	asset = feature.get("assets", {}).get(f"{image_type.value}_thumbnail")
+	if asset is None:
+		raise TileNotFoundError(f"No {image_type.value} thumbnail for item {item_id}")
+
+	href = urlparse(asset["href"])
+	response = get_client("s3").get_object(Bucket=href.netloc, Key=href.path.lstrip("/"))
+	return conditional_response(response["Body"].read(), asset.get("type", "image/png"), if_none_match)
+
+
+def tile_backend(filter_params: CommonFilterQueryParams, aws_auth: SigV4Auth) -> AgieSTACBackend:
+	return AgieSTACBackend(
+		f"{api_settings.stac_url}search",
+		auth=aws_auth,
+		agie_filters=filter_params,
+		stac_api_options={"max_items": 10},
+		minzoom=8,
+		maxzoom=16,
+	)
+
+
+def get_tile_cache_key(
+	z: int, x: int, y: int, image_type: ImageType, tilesize: int, tile_format: TileFormat, filter_params: CommonFilterQueryParams
+) -> str:
+	return tile_cache_key(
+		z=z, x=x, y=y, image_type=image_type.value, tilesize=tilesize, tile_format=tile_format.value, **filter_params.model_dump()
+	)
+
+
+def get_seeded_tile(
+	z: int, x: int, y: int, image_type: ImageType, tilesize: int, tile_format: TileFormat, filter_params: CommonFilterQueryParams
+) -> Optional[CachedTile]:
+	"""Return the seeded tile of the request, when it asks for the latest results of a whole region within the seeded pyramid."""
+	if (
+		seeded_tile_store is None
+		# the pyramid is seeded as PNG only
+		or tile_format != TileFormat.png
+		or filter_params.region_id is None
+		or filter_params.group_id is not None
+		or filter_params.polygon_id is not None
+		or tilesize != api_settings.tile_seed_tilesize
+		or not api_settings.tile_seed_min_zoom <= z <= api_settings.tile_seed_max_zoom
+	):
+		return None
+
+	index = load_mosaic_index(filter_params.region_id)
+	timestamp = filter_params.timestamp
+	if timestamp is not None and timestamp.tzinfo is None:
+		timestamp = timestamp.replace(tzinfo=timezone.utc)
+	if index is None or not index.is_valid_for(timestamp):
+		return None
+
+	key = seeded_tile_store.key(filter_params.region_id, image_type.value, tilesize, z, x, y)
+	return seeded_tile_store.get(key, index.version)
+
+
+def render_tile(
+	mosaic: AgieSTACBackend, x: int, y: int, z: int, image_type: ImageType, tilesize: int, tile_format: TileFormat = TileFormat.png
+) -> bytes:
+	match image_type:
+		case ImageType.rgb:
+			img, _ = mosaic.tile(
+				x, y, z, assets=RGB_ASSETS, tilesize=tilesize
+			)
+		# every other image type is the single band asset of the same name
+		case _:
+			img, _ = mosaic.tile(x, y, z, assets=image_type, tilesize=tilesize)
+
+	if tile_format == TileFormat.npy:
+		# the values are returned as read, the client applies its own styling
+		return img.render(img_format="NPY")
+
+	match image_type:
+		case ImageType.rgb:
+			img.apply_color_formula(
+				"Gamma RGB 3.5 Saturation 1.7 Sigmoidal RGB 15 0.35"
+			)
+			colormap = None
+		case ImageType.scl:
+			if tile_format == TileFormat.png:
+				return render_palette_png(img, SCL_COLORMAP)
+			colormap = SCL_COLORMAP
+		case _:
+			style = INDEX_STYLES[image_type.value]
+			img.rescale([style.value_range])
+			colormap = cmap.get(style.colormap)
+
+	return img.render(img_format=tile_format.value.upper(), colormap=colormap)
+
+
+def render_palette_png(img: ImageData, colormap: Dict[int, Tuple[int, int, int, int]]) -> bytes:
+	"""
+	Render a categorical band as a single band PNG with a color table, a fraction of the size of its RGBA rendering.
+	The masked pixels get a transparent palette entry of their own.
+	"""
+	data = img.data[0].astype("uint8")
+	data[img.mask == 0] = PALETTE_NODATA
+	with MemoryFile() as memfile:
+		with memfile.open(driver="PNG", width=img.width, height=img.height, count=1, dtype="uint8") as dst:
+			dst.write(data, 1)
+			dst.write_colormap(1, {**colormap, PALETTE_NODATA: (0, 0, 0, 0)})
+		return memfile.read()
+
+
+def negotiate_tile_format(image_type: ImageType, tile_format: Optional[TileFormat], accept: Optional[str]) -> TileFormat:
+	"""
+	Return the requested format when set, otherwise the first format of the Accept header (by quality) supported for the
+	image type, PNG when none is.
+	"""
+	supported = TILE_FORMATS[image_type]
+	if tile_format is not None:
+		if tile_format not in supported:
+			raise BadRequestError(f"{tile_format.value} tiles are not supported for {image_type.value}")
+		return tile_format
+
+	media_types = []
+	for position, entry in enumerate((accept or "").split(",")):
+		media_type, *params = [part.strip() for part in entry.split(";")]
+		quality = 1.0
+		for param in params:
+			name, _, value = param.partition("=")
+			if name.strip() == "q":
+				try:
+					quality = float(value)
+				except ValueError:
+					quality = 0.0
+		if quality > 0:
+			media_types.append((-quality, position, media_type.lower()))
+
+	for _, _, media_type in sorted(media_types):
+		for candidate in supported:
+			if candidate.media_type == media_type:
+				return candidate
+	return TileFormat.png
 
 
 @router.get("/tiles/{z}/{x}/{y}", response_class=Response)
@@ -91,58 +278,108 @@ def get_tile(
 	image_type: ImageType = Query(ImageType.rgb, description="The image type"),
 	filter_params: CommonFilterQueryParams = Depends(),
 	tilesize: int = Query(512, description="The tile size"),
+	tile_format: Optional[TileFormat] = Query(None, alias="format", description="The tile format, negotiated from the Accept header when not set"),
+	accept: Optional[str] = Header(None),
+	if_none_match: Optional[str] = Header(None),
 	aws_auth: SigV4Auth = Depends(get_auth),
 ):
-	with AgieSTACBackend(
-		f"{api_settings.stac_url}search",
-		auth=aws_auth,
-		agie_filters=filter_params,
-		stac_api_options={"max_items": 10},
-		minzoom=8,
-		maxzoom=16,
-	) as mosaic:
-		match image_type:
-			case ImageType.rgb:
-				img, _ = mosaic.tile(
-					x, y, z, assets=["red", "green", "blue"], tilesize=tilesize, threads=0
-				)
-				img.apply_color_formula(
-					"Gamma RGB 3.5 Saturation 1.7 Sigmoidal RGB 15 0.35"
-				)
-				content = img.render(img_format="PNG")
-			case ImageType.ndvi:
-				img, _ = mosaic.tile(x, y, z, assets=ImageType.ndvi, tilesize=tilesize, threads=0)
-				img.rescale([(-1, 1)])
-				cm = cmap.get("RdYlGn")
-				content = img.render(img_format="PNG", colormap=cm)
-			case ImageType.ndvi_raw:
-				img, _ = mosaic.tile(x, y, z, assets=ImageType.ndvi_raw, tilesize=tilesize, threads=0)
-				img.rescale([(-1, 1)])
-				cm = cmap.get("RdYlGn")
-				content = img.render(img_format="PNG", colormap=cm)
-			case ImageType.ndvi_change:
-				img, _ = mosaic.tile(x, y, z, assets=ImageType.ndvi_change, tilesize=tilesize, threads=0)
-				img.rescale([(-1, 1)])
-				cm = cmap.get("RdYlGn")
-				content = img.render(img_format="PNG", colormap=cm)
-			case ImageType.scl:
-				img, _ = mosaic.tile(x, y, z, assets=ImageType.scl, tilesize=tilesize, threads=0)
-				cm = {
-					0: (0, 0, 0, 255),  # No Data (Missing data)
-					1: (255, 0, 0, 255),  # Saturated or defective pixel
-					2: (47, 47, 47, 255),  # Topographic casted shadows
-					3: (100, 50, 0, 255),  # Cloud shadows
-					4: (0, 160, 0, 255),  # Vegetation
-					5: (255, 230, 90, 255),  # Not-vegetated
-					6: (0, 0, 255, 255),  # Water
-					7: (128, 128, 128, 255),  # Unclassified
-					8: (192, 192, 192, 255),  # Cloud medium probability
-					9: (255, 255, 255, 255),  # Cloud high probability
-					10: (100, 200, 255, 255),  # Thin cirrus
-					11: (255, 150, 255, 255),  # Snow or ice
-				}
-				content = img.render(img_format="PNG", colormap=cm)
-			case _:
-				raise BadRequestError(f"Invalid image type: {image_type}")
-
-	return Response(content, media_type="image/png")
+	tile_format = negotiate_tile_format(image_type, tile_format, accept)
+	headers = {
+		# the response depends on the Accept header, shared caches have to keep one entry per header value
+		"Vary": "Accept",
+		"Cache-Control": api_settings.cache_control,
+	}
+
+	# a cached tile is validated (or served) with the ETag stored alongside it, without searching its items
+	cache_key = get_tile_cache_key(z, x, y, image_type, tilesize, tile_format, filter_params)
+	cached_tile, cache_status = tile_cache.get(cache_key)
+	if cached_tile is not None and cached_tile.etag is not None:
+		headers["ETag"] = cached_tile.etag
+		if etag_matches(if_none_match, cached_tile.etag):
+			return Response(status_code=304, headers=headers)
+		return Response(cached_tile.content, media_type=cached_tile.media_type, headers={**headers, TILE_CACHE_HEADER: cache_status})
+
+	with tile_backend(filter_params, aws_auth) as mosaic:
+		# the contributing items come out of the cached search (or the region index), so a tile the client holds already
+		# is validated without any COG read
+		etag = get_tile_etag(mosaic, z, x, y, image_type, tilesize, tile_format)
+		headers["ETag"] = etag
+		if etag_matches(if_none_match, etag):
+			return Response(status_code=304, headers=headers)
+
+		if cached_tile is not None:
+			# cached without an ETag (e.g. by a previous version), it is stored again with it
+			tile_cache.set_memory(cache_key, cached_tile._replace(etag=etag))
+			return Response(cached_tile.content, media_type=cached_tile.media_type, headers={**headers, TILE_CACHE_HEADER: cache_status})
+
+		# the seeded tiles are kept in S3 already, they are only added to the in-process tier
+		seeded_tile = get_seeded_tile(z, x, y, image_type, tilesize, tile_format, filter_params)
+		if seeded_tile is not None:
+			tile_cache.set_memory(cache_key, seeded_tile._replace(etag=etag))
+			return Response(seeded_tile.content, media_type=seeded_tile.media_type, headers={**headers, TILE_CACHE_HEADER: "hit-seed"})
+
+		content = render_tile(mosaic, x, y, z, image_type, tilesize, tile_format)
+
+	tile_cache.set(cache_key, CachedTile(content, tile_format.media_type, etag))
+	return Response(
+		content,
+		media_type=tile_format.media_type,
+		headers={**headers, TILE_CACHE_HEADER: cache_status, TILE_READS_HEADER: str(mosaic.tile_reads)},
+	)
+
+
+def get_tile_etag(
+	mosaic: AgieSTACBackend, z: int, x: int, y: int, image_type: ImageType, tilesize: int, tile_format: TileFormat
+) -> str:
+	return items_etag(
+		mosaic.features_for_tile(x, y, z),
+		z=z, x=x, y=y, image_type=image_type.value, tilesize=tilesize, tile_format=tile_format.value,
+	)
+
+
+@router.post("/tiles/batch", response_class=Response)
+def get_tiles_batch(
+	batch: BatchTilesRequest,
+	filter_params: CommonFilterQueryParams = Depends(),
+	aws_auth: SigV4Auth = Depends(get_auth),
+):
+	"""
+	Render several tiles with a single search over their union bounds and shared readers. The tiles are returned in a
+	zip archive as `{z}/{x}/{y}.{format}`, the tiles without any asset are left out.
+	"""
+	if len(batch.tiles) > api_settings.batch_max_tiles:
+		raise BadRequestError(f"A batch is limited to {api_settings.batch_max_tiles} tiles")
+	tile_format = negotiate_tile_format(batch.image_type, batch.tile_format, None)
+
+	rendered_tiles: Dict[str, bytes] = {}
+	missing_tiles = []
+	for tile in batch.tiles:
+		cache_key = get_tile_cache_key(tile.z, tile.x, tile.y, batch.image_type, batch.tilesize, tile_format, filter_params)
+		cached_tile, _ = tile_cache.get(cache_key)
+		if cached_tile is None:
+			cached_tile = get_seeded_tile(tile.z, tile.x, tile.y, batch.image_type, batch.tilesize, tile_format, filter_params)
+		if cached_tile is not None:
+			rendered_tiles[f"{tile.z}/{tile.x}/{tile.y}.{tile_format.value}"] = cached_tile.content
+		else:
+			missing_tiles.append((tile, cache_key))
+
+	if missing_tiles:
+		with tile_backend(filter_params, aws_auth) as mosaic:
+			mosaic.prefetch_tiles([(tile.x, tile.y, tile.z) for tile, _ in missing_tiles])
+			for tile, cache_key in missing_tiles:
+				try:
+					content = render_tile(mosaic, tile.x, tile.y, tile.z, batch.image_type, batch.tilesize, tile_format)
+				except (NoAssetFoundError, EmptyMosaicError):
+					continue
+				# the features of the tile come out of the prefetched search, its ETag costs no request
+				etag = get_tile_etag(mosaic, tile.z, tile.x, tile.y, batch.image_type, batch.tilesize, tile_format)
+				tile_cache.set(cache_key, CachedTile(content, tile_format.media_type, etag))
+				rendered_tiles[f"{tile.z}/{tile.x}/{tile.y}.{tile_format.value}"] = content
+
+	archive = BytesIO()
+	# the images are already compressed, only the raw arrays are worth deflating
+	compression = zipfile.ZIP_DEFLATED if tile_format == TileFormat.npy else zipfile.ZIP_STORED
+	with zipfile.ZipFile(archive, "w", compression=compression) as zip_file:
+		for name, content in rendered_tiles.items():
+			zip_file.writestr(name, content)
+	return Response(archive.getvalue(), media_type="application/zip")
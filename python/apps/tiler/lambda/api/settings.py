@@ -11,6 +11,8 @@
 #   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
 #   and limitations under the License.
 
+from typing import Optional
+
 from pydantic import field_validator
 from pydantic_settings import BaseSettings
 
@@ -20,11 +22,68 @@ class ApiSettings(BaseSettings):
 
     name: str = "AgieTiler"
     cors_origins: str = "*"
-    cors_allow_methods: str = "GET"
+    cors_allow_methods: str = "GET,POST"
     root_path: str = ""
     debug: bool = False
     stac_url: str = None
 
+    # rendered tile cache, the shared tier is S3 when a bucket is set, else the local directory stand-in when set
+    tile_cache_size: int = 512
+    tile_cache_ttl: int = 300
+    tile_cache_bucket: Optional[str] = None
+    tile_cache_prefix: str = "tile-cache"
+    tile_cache_dir: Optional[str] = None
+
+    # STAC searches are cached per parent tile (search_cache_zoom_offset levels up) and timestamp bucket (in seconds)
+    search_cache_size: int = 256
+    search_cache_ttl: int = 60
+    search_cache_zoom_offset: int = 3
+    search_cache_timestamp_bucket: int = 300
+    # hard cap on the features of a parent tile search, above it the tiles are searched one by one
+    search_cache_max_items: int = 2000
+    # tile searches return full items which are handed to the reader, instead of links the reader fetches one by one
+    search_embed_items: bool = True
+
+    # quadkey index of the latest results of a region, rebuilt when a result is published and used by the tile
+    # lookups instead of the STAC searches while younger than mosaic_index_max_age (in seconds)
+    mosaic_index_bucket: Optional[str] = None
+    mosaic_index_prefix: str = "mosaic-index"
+    mosaic_index_zoom: int = 12
+    mosaic_index_max_age: int = 3600
+    # the index of a result is only saved once the items of all its polygons are searchable (the results module ingests
+    # them asynchronously), their number is read from the processor inputs of the result in engine_input_bucket. The
+    # search is retried every mosaic_index_retry_delay seconds, up to mosaic_index_retry_attempts times
+    engine_input_bucket: Optional[str] = None
+    mosaic_index_retry_attempts: int = 10
+    mosaic_index_retry_delay: int = 30
+
+    # tile pyramid rendered for every image type of a region once its index is rebuilt, served before rendering
+    tile_seed_bucket: Optional[str] = None
+    tile_seed_prefix: str = "tile-seed"
+    tile_seed_min_zoom: int = 8
+    tile_seed_max_zoom: int = 11
+    tile_seed_tilesize: int = 512
+
+    # spectral indices computed by the processor, in the format of its SPECTRAL_INDICES variable (e.g. "ndre,evi,savi"),
+    # each one is served as an image type of its own. Both sides are given the same value by the deployment and, like
+    # the processor, none is enabled by default
+    spectral_indices: str = ""
+
+    # Cache-Control of the tile and feature responses, the clients revalidate them with their ETag once stale
+    cache_control: str = "private, max-age=300"
+
+    # maximum number of tiles of a batch request
+    batch_max_tiles: int = 64
+
+    # concurrent asset reads per mosaic tile, after the latest mosaic_first_read_assets have been read on their own
+    # (0 reads all the assets by batches of mosaic_read_threads)
+    mosaic_read_threads: int = 8
+    mosaic_first_read_assets: int = 1
+
+    # connection pool of the process wide HTTP client
+    http_max_connections: int = 50
+    http_max_keepalive_connections: int = 20
+
     @field_validator("cors_origins")
     def parse_cors_origin(cls, v):
         """Parse CORS origins."""
@@ -0,0 +1,156 @@
+"""Rendered tile cache."""
+
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, NamedTuple, Optional, Tuple
+
+from botocore.exceptions import BotoCoreError, ClientError
+from cachetools import TTLCache
+from cogeo_mosaic.logger import logger
+
+from api.http_client import get_client
+from api.settings import ApiSettings
+
+TILE_CACHE_HEADER = "X-Tile-Cache"
+
+# S3 user metadata (and local header field) holding the ETag of a cached tile
+ETAG_METADATA = "etag"
+
+
+class CachedTile(NamedTuple):
+    content: bytes
+    media_type: str
+    # ETag of the tile, stored alongside it so a cached tile is validated without searching its items again
+    etag: Optional[str] = None
+
+
+def tile_cache_key(**params: Any) -> str:
+    """Build a deterministic key from the render parameters, unset parameters are left out."""
+    normalized = {
+        name: value.astimezone(timezone.utc).isoformat() if isinstance(value, datetime) else value
+        for name, value in params.items()
+        if value is not None
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class S3TileStore:
+    """Shared tier stored in S3, an object older than the TTL is a miss."""
+
+    def __init__(self, bucket: str, prefix: str, ttl: int):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.ttl = ttl
+        self.client = get_client("s3")
+
+    def get(self, key: str) -> Optional[CachedTile]:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=f"{self.prefix}/{key}")
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None
+            raise
+        if time.time() - response["LastModified"].timestamp() > self.ttl:
+            return None
+        return CachedTile(response["Body"].read(), response["ContentType"], response.get("Metadata", {}).get(ETAG_METADATA))
+
+    def set(self, key: str, tile: CachedTile):
+        try:
+            self.client.put_object(
+                Bucket=self.bucket,
+                Key=f"{self.prefix}/{key}",
+                Body=tile.content,
+                ContentType=tile.media_type,
+                Metadata={ETAG_METADATA: tile.etag} if tile.etag is not None else {},
+            )
+        except (BotoCoreError, ClientError) as e:
+            # the shared tier is an optimisation, the rendered tile is still served
+            logger.warning(f"Tile {key} not stored in the shared tile cache: {e}")
+
+
+class LocalTileStore:
+    """Shared tier stand-in on a local (or mounted) directory, used when no bucket is configured."""
+
+    def __init__(self, directory: str, ttl: int):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key: str) -> Optional[CachedTile]:
+        path = os.path.join(self.directory, key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path, "rb") as f:
+                header, content = f.read().split(b"\n", 1)
+            header = json.loads(header)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            # written in a previous layout, rendered again
+            return None
+        return CachedTile(content, header["media_type"], header.get(ETAG_METADATA))
+
+    def set(self, key: str, tile: CachedTile):
+        # written under a temporary name first so a concurrent reader never sees a partial tile
+        path = os.path.join(self.directory, key)
+        header = json.dumps({"media_type": tile.media_type, ETAG_METADATA: tile.etag})
+        with open(f"{path}.{threading.get_ident()}.tmp", "wb") as f:
+            f.write(header.encode() + b"\n" + tile.content)
+        os.replace(f"{path}.{threading.get_ident()}.tmp", path)
+
+
+class TileCache:
+    """
+    Two tier cache of rendered tiles: an in-process LRU (kept across warm Lambda invocations) in front of an
+    optional shared tier (S3, or a local directory stand-in) with a TTL.
+    """
+
+    def __init__(self, settings: ApiSettings):
+        self.memory: TTLCache = TTLCache(maxsize=settings.tile_cache_size, ttl=settings.tile_cache_ttl)
+        self.lock = threading.Lock()
+        self.shared = None
+        if settings.tile_cache_bucket:
+            self.shared = S3TileStore(settings.tile_cache_bucket, settings.tile_cache_prefix, settings.tile_cache_ttl)
+        elif settings.tile_cache_dir:
+            self.shared = LocalTileStore(settings.tile_cache_dir, settings.tile_cache_ttl)
+
+    def get(self, key: str) -> Tuple[Optional[CachedTile], str]:
+        """Return the cached tile (if any) and the cache status to report in the response headers."""
+        with self.lock:
+            tile = self.memory.get(key)
+        if tile is not None:
+            return tile, "hit-memory"
+
+        if self.shared is not None:
+            tile = self.shared.get(key)
+            if tile is not None:
+                with self.lock:
+                    self.memory[key] = tile
+                return tile, "hit-shared"
+
+        return None, "miss"
+
+    def set(self, key: str, tile: CachedTile):
+        self.set_memory(key, tile)
+        if self.shared is not None:
+            self.shared.set(key, tile)
+
+    def set_memory(self, key: str, tile: CachedTile):
+        with self.lock:
+            self.memory[key] = tile
@@ -0,0 +1,64 @@
+"""Seeded tile pyramid of the latest results of a region."""
+
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+from typing import Optional
+
+from botocore.exceptions import ClientError
+
+from api.http_client import get_client
+from api.settings import ApiSettings
+from api.tile_cache import CachedTile
+
+# S3 object metadata holding the creation time of the index the tile was rendered from
+INDEX_VERSION_METADATA = "index-version"
+
+
+class SeededTileStore:
+    """
+    Tiles rendered ahead of the requests by the seeding job, overwritten in place on every run. A tile is only served
+    while it was rendered from the current index of its region, so a tile left over by a previous run is never served.
+    """
+
+    def __init__(self, bucket: str, prefix: str):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.client = get_client("s3")
+
+    @classmethod
+    def from_settings(cls, settings: ApiSettings) -> Optional["SeededTileStore"]:
+        if not settings.tile_seed_bucket:
+            return None
+        return cls(settings.tile_seed_bucket, settings.tile_seed_prefix)
+
+    def key(self, region_id: str, image_type: str, tilesize: int, z: int, x: int, y: int) -> str:
+        return f"{self.prefix}/{region_id}/{image_type}/{tilesize}/{z}/{x}/{y}"
+
+    def get(self, key: str, index_version: str) -> Optional[CachedTile]:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None
+            raise
+        if response.get("Metadata", {}).get(INDEX_VERSION_METADATA) != index_version:
+            return None
+        return CachedTile(response["Body"].read(), response["ContentType"])
+
+    def set(self, key: str, index_version: str, content: bytes, media_type: str):
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=key,
+            Body=content,
+            ContentType=media_type,
+            Metadata={INDEX_VERSION_METADATA: index_version},
+        )
@@ -0,0 +1,88 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+import os
+from typing import Dict, List, Optional
+
+import pytest
+
+# the settings are read when the api modules are imported
+os.environ.setdefault("STAC_URL", "https://stac.example.com/")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+
+
+def make_item(
+	result_id: str,
+	polygon_id: str,
+	bbox: List[float],
+	datetime: str = "2024-06-01T00:00:00+00:00",
+	assets: Optional[Dict[str, Dict]] = None,
+) -> Dict:
+	"""Result item as published by the processor, with a footprint covering the bbox."""
+	minx, miny, maxx, maxy = bbox
+	item_id = f"{result_id}_{polygon_id}"
+	return {
+		"type": "Feature",
+		"stac_version": "1.0.0",
+		"id": item_id,
+		"collection": "agie-polygon",
+		"bbox": bbox,
+		"geometry": {
+			"type": "Polygon",
+			"coordinates": [[[minx, miny], [maxx, miny], [maxx, maxy], [minx, maxy], [minx, miny]]],
+		},
+		"properties": {"datetime": datetime},
+		"links": [
+			{"rel": "self", "href": f"https://stac.example.com/collections/agie-polygon/items/{item_id}"},
+		],
+		"assets": assets if assets is not None else {
+			"ndvi": {"href": f"s3://bucket/{item_id}/ndvi.tif", "file:checksum": f"{item_id}-ndvi"},
+		},
+	}
+
+
+@pytest.fixture
+def item_factory():
+	return make_item
+
+
+@pytest.fixture
+def result_updated_event():
+	"""`Result>updated` event as published by the results module on the event bus."""
+
+	def _event(region_id: str = "01j0regionid", status: str = "succeeded") -> Dict:
+		result = {
+			"regionId": region_id,
+			"id": "01j0resultid",
+			"createdAt": "2024-06-01T00:00:00.000Z",
+			"startDateTime": "2024-05-31T00:00:00.000Z",
+			"endDateTime": "2024-06-01T00:00:00.000Z",
+			"engineType": "aws-batch",
+		}
+		return {
+			"version": "0",
+			"id": "4b1f4d3c-6d4f-4c54-8d31-1f5a0d8a9a10",
+			"detail-type": "com.aws.agie.results>Result>updated",
+			"source": "com.aws.agie.results",
+			"account": "123456789012",
+			"time": "2024-06-01T00:10:00Z",
+			"region": "us-west-2",
+			"resources": [],
+			"detail": {
+				"resourceType": "Result",
+				"eventType": "updated",
+				"id": "01j0resultid",
+				"old": {**result, "status": "inProgress"},
+				"new": {**result, "status": status, "updatedAt": "2024-06-01T00:10:00.000Z"},
+			},
+		}
+
+	return _event
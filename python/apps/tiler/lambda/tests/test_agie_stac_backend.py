@@ -0,0 +1,109 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+import numpy
+import pytest
+from rio_tiler.constants import WEB_MERCATOR_TMS
+from rio_tiler.models import ImageData
+
+from api.backend import agie_stac_backend
+from api.backend.agie_stac_backend import AgieSTACBackend
+from api.routers.models import CommonFilterQueryParams
+
+
+@pytest.fixture
+def backend(monkeypatch):
+	monkeypatch.setattr(agie_stac_backend, "_search_cache", {})
+	return AgieSTACBackend(
+		"https://stac.example.com/search",
+		agie_filters=CommonFilterQueryParams(timestamp=None),
+		stac_api_options={"max_items": 10},
+		minzoom=8,
+		maxzoom=16,
+	)
+
+
+def record_searches(monkeypatch, backend, features):
+	searches = []
+
+	def _search(geom, timestamp, stac_api_options, include_assets=False):
+		searches.append((tuple(geom["coordinates"][0][0]), stac_api_options["max_items"]))
+		return features[:stac_api_options["max_items"]] if stac_api_options["max_items"] else features
+
+	monkeypatch.setattr(backend, "_search", _search)
+	return searches
+
+
+def test_parent_search_is_clamped_to_the_backend_minzoom(monkeypatch, backend, item_factory):
+	searches = record_searches(monkeypatch, backend, [item_factory("01j0resultid", "polygon1", [10.0, 45.0, 10.01, 45.01])])
+	tile = WEB_MERCATOR_TMS.tile(10.005, 45.005, 9)
+
+	assert len(backend.features_for_tile(tile.x, tile.y, tile.z)) == 1
+
+	# the parent is searched at the backend minzoom (8), not at the minzoom of the tile matrix set
+	parent = WEB_MERCATOR_TMS.parent(tile, zoom=8)[0]
+	west, _, _, north = WEB_MERCATOR_TMS.bounds(parent)
+	assert searches == [((west, north), agie_stac_backend.api_settings.search_cache_max_items)]
+
+
+def test_tiles_are_searched_directly_when_the_parent_search_is_capped(monkeypatch, backend, item_factory):
+	monkeypatch.setattr(agie_stac_backend.api_settings, "search_cache_max_items", 2)
+	features = [item_factory("01j0resultid", f"polygon{i}", [10.0, 45.0, 10.01, 45.01]) for i in range(3)]
+	searches = record_searches(monkeypatch, backend, features)
+	tile = WEB_MERCATOR_TMS.tile(10.005, 45.005, 14)
+
+	assert len(backend.features_for_tile(tile.x, tile.y, tile.z)) == 3
+	assert len(backend.features_for_tile(tile.x, tile.y, tile.z)) == 3
+
+	# the capped parent search is remembered, the following tiles go straight to their own search
+	west, _, _, north = WEB_MERCATOR_TMS.bounds(tile)
+	assert [max_items for _, max_items in searches] == [2, 10, 10]
+	assert searches[1][0] == (west, north)
+
+
+class FakeReader:
+	assets = ["ndvi"]
+
+	def __init__(self, coverage):
+		self.coverage = coverage
+
+	def tile(self, x, y, z, **kwargs):
+		data = numpy.ma.MaskedArray(numpy.ones((1, 4, 4), dtype="float32"), mask=numpy.ones((1, 4, 4), dtype=bool))
+		data.mask[:, :self.coverage] = False
+		return ImageData(data, crs=WEB_MERCATOR_TMS.rasterio_crs, bounds=(0, 0, 1, 1))
+
+
+def fake_readers(monkeypatch, backend, coverages):
+	hrefs = [f"https://stac.example.com/items/{i}" for i in range(len(coverages))]
+	readers = dict(zip(hrefs, (FakeReader(coverage) for coverage in coverages)))
+	monkeypatch.setattr(backend, "assets_for_tile", lambda x, y, z: hrefs)
+	monkeypatch.setattr(backend, "_get_reader", lambda asset: readers[asset])
+
+
+def test_tile_covered_by_the_latest_item_reads_it_only(monkeypatch, backend):
+	fake_readers(monkeypatch, backend, [4, 4, 4, 4, 4, 4, 4, 4, 4, 4])
+
+	img, assets_used = backend.tile(0, 0, 10, assets=["ndvi"])
+
+	assert backend.tile_reads == 1
+	assert len(assets_used) == 1
+	assert not img.array.mask.any()
+
+
+def test_tile_not_covered_by_the_latest_item_reads_the_others_once(monkeypatch, backend):
+	fake_readers(monkeypatch, backend, [2, 4, 4])
+
+	img, assets_used = backend.tile(0, 0, 10, assets=["ndvi"])
+
+	# the first item is not read again with the others
+	assert backend.tile_reads == 3
+	assert len(assets_used) >= 2
+	assert not img.array.mask.any()
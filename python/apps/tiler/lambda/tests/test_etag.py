@@ -0,0 +1,35 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+from api.etag import content_etag, etag_matches, items_etag
+
+
+def test_items_etag_changes_with_the_items_and_the_parameters(item_factory):
+	item = item_factory("01j0resultid", "polygon1", [10.0, 45.0, 10.1, 45.1])
+	etag = items_etag([item], z=12, x=1, y=2, image_type="ndvi")
+
+	assert etag.startswith('"') and etag.endswith('"')
+	assert items_etag([item], z=12, x=1, y=2, image_type="ndvi") == etag
+	assert items_etag([item], z=12, x=1, y=2, image_type="rgb") != etag
+
+	# a reprocessed result has new asset checksums
+	item["assets"]["ndvi"]["file:checksum"] = "1220" + "b" * 64
+	assert items_etag([item], z=12, x=1, y=2, image_type="ndvi") != etag
+
+
+def test_etag_matches():
+	etag = content_etag(b"tile")
+
+	assert etag_matches(etag, etag)
+	assert etag_matches(f'"other", W/{etag}', etag)
+	assert etag_matches("*", etag)
+	assert not etag_matches('"other"', etag)
+	assert not etag_matches(None, etag)
@@ -0,0 +1,26 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+from api.http_client import get_auth_provider, get_client, get_session
+from api.settings import ApiSettings
+from api.tile_cache import S3TileStore
+from api.tile_seed import SeededTileStore
+
+
+def test_s3_stores_share_one_client():
+	settings = ApiSettings(tile_seed_bucket="bucket")
+
+	client = get_client("s3")
+	assert S3TileStore("bucket", "tile-cache", 300).client is client
+	assert SeededTileStore.from_settings(settings).client is client
+	assert get_auth_provider().session is get_session()
+	# a custom endpoint gets a client of its own, out of the same session
+	assert get_client("s3", "http://localhost:9000") is not client
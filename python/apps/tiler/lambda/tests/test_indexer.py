@@ -0,0 +1,145 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+from types import SimpleNamespace
+
+import pytest
+from rio_tiler.constants import WEB_MERCATOR_TMS
+from rio_tiler.errors import InvalidAssetName
+
+from api import indexer
+from api.backend.mosaic_index import RegionMosaicIndex
+from api.routers.models import ImageType
+from api.tile_seed import SeededTileStore
+
+
+def test_handler_indexes_the_region_of_the_result(monkeypatch, result_updated_event, item_factory):
+	indexed_regions = []
+	saved_indexes = []
+
+	def build_region_index(region_id):
+		indexed_regions.append(region_id)
+		items = [item_factory("01j0resultid", "polygon1", [10.0, 45.0, 10.1, 45.1])]
+		return RegionMosaicIndex.from_items(region_id, items, WEB_MERCATOR_TMS, 12)
+
+	monkeypatch.setattr(indexer, "build_region_index", build_region_index)
+	monkeypatch.setattr(indexer.api_settings, "mosaic_index_bucket", "bucket")
+	monkeypatch.setattr(indexer.api_settings, "tile_seed_bucket", None)
+	monkeypatch.setattr(RegionMosaicIndex, "save", lambda index, bucket: saved_indexes.append((index.region_id, bucket)))
+
+	indexer.handler(result_updated_event(region_id="01j0regionid"), None)
+
+	assert indexed_regions == ["01j0regionid"]
+	assert saved_indexes == [("01j0regionid", "bucket")]
+
+
+class RecordingS3Client:
+	def __init__(self):
+		self.objects = {}
+
+	def put_object(self, Bucket, Key, Body, ContentType, Metadata):
+		self.objects[Key] = (Body, Metadata)
+
+
+def test_seed_region_tiles_skips_the_assets_missing_from_an_item(monkeypatch, item_factory):
+	items = [
+		item_factory("01j0resultid", "polygon1", [10.0, 45.0, 10.01, 45.01], assets={
+			"ndvi": {"href": "s3://bucket/ndvi.tif"},
+			"ndvi_change": {"href": "s3://bucket/ndvi_change.tif"},
+		}),
+	]
+	index = RegionMosaicIndex.from_items("01j0regionid", items, WEB_MERCATOR_TMS, 12)
+
+	def render_tile(mosaic, x, y, z, image_type, tilesize):
+		if image_type == ImageType.ndvi_change and z == 10:
+			raise InvalidAssetName("ndvi_change is not valid")
+		return f"{image_type.value}-{z}".encode()
+
+	monkeypatch.setattr(indexer, "render_tile", render_tile)
+	monkeypatch.setattr(indexer, "get_auth_provider", lambda: SimpleNamespace(get_auth=lambda: None))
+	monkeypatch.setattr(indexer.api_settings, "tile_seed_min_zoom", 9)
+	monkeypatch.setattr(indexer.api_settings, "tile_seed_max_zoom", 10)
+	store = SeededTileStore("bucket", "tile-seed")
+	store.client = RecordingS3Client()
+
+	seeded = indexer.seed_region_tiles(index, store)
+
+	# only the image types carried by the items are rendered, the failing tile does not stop the job
+	assert seeded == 3
+	z9 = WEB_MERCATOR_TMS.tile(10.005, 45.005, 9)
+	z10 = WEB_MERCATOR_TMS.tile(10.005, 45.005, 10)
+	assert sorted(store.client.objects) == [
+		f"tile-seed/01j0regionid/ndvi/512/10/{z10.x}/{z10.y}",
+		f"tile-seed/01j0regionid/ndvi/512/9/{z9.x}/{z9.y}",
+		f"tile-seed/01j0regionid/ndvi_change/512/9/{z9.x}/{z9.y}",
+	]
+	assert all(metadata == {"index-version": index.version} for _, metadata in store.client.objects.values())
+
+
+def test_seeded_image_types(item_factory):
+	items = [
+		item_factory("01j0resultid", "polygon1", [10.0, 45.0, 10.01, 45.01], assets={
+			name: {"href": f"s3://bucket/{name}.tif"} for name in ("red", "green", "blue", "scl", "ndvi")
+		}),
+	]
+	index = RegionMosaicIndex.from_items("01j0regionid", items, WEB_MERCATOR_TMS, 12)
+	assert indexer.seeded_image_types(index) == [ImageType.rgb, ImageType.ndvi, ImageType.scl]
+
+
+class InputListingS3Client:
+	def __init__(self, input_count):
+		self.input_count = input_count
+		self.prefixes = []
+
+	def get_paginator(self, operation_name):
+		return self
+
+	def paginate(self, Bucket, Prefix):
+		self.prefixes.append((Bucket, Prefix))
+		return [{"KeyCount": self.input_count}]
+
+
+def index_searches(monkeypatch, item_factory, ingested_counts):
+	"""Index builds returning, search after search, the given number of items of the result (then one older item)."""
+	searches = iter(ingested_counts)
+
+	def build_region_index(region_id):
+		items = [item_factory("01j0resultid", f"polygon{i}", [10.0, 45.0, 10.1, 45.1]) for i in range(next(searches))]
+		items.append(item_factory("01j0olderresultid", "polygon9", [10.0, 45.0, 10.1, 45.1]))
+		return RegionMosaicIndex.from_items(region_id, items, WEB_MERCATOR_TMS, 12)
+
+	monkeypatch.setattr(indexer, "build_region_index", build_region_index)
+	monkeypatch.setattr(indexer.api_settings, "engine_input_bucket", "bucket")
+	monkeypatch.setattr(indexer.api_settings, "mosaic_index_retry_attempts", 2)
+	monkeypatch.setattr(indexer.api_settings, "mosaic_index_retry_delay", 0)
+	s3 = InputListingS3Client(input_count=2)
+	monkeypatch.setattr(indexer, "get_client", lambda service_name: s3)
+	return s3
+
+
+def test_index_waits_for_the_items_of_every_polygon_of_the_result(monkeypatch, item_factory):
+	s3 = index_searches(monkeypatch, item_factory, [1, 2])
+
+	index = indexer.build_result_index("01j0regionid", "01j0resultid")
+
+	assert len(index.items) == 3
+	assert s3.prefixes == [("bucket", "region=01j0regionid/result=01j0resultid/input/")]
+
+
+def test_index_missing_items_of_the_result_is_not_saved(monkeypatch, result_updated_event, item_factory):
+	index_searches(monkeypatch, item_factory, [1, 1, 1])
+	saved_indexes = []
+	monkeypatch.setattr(RegionMosaicIndex, "save", lambda index, bucket: saved_indexes.append(index.region_id))
+
+	with pytest.raises(indexer.ResultNotIngestedError):
+		indexer.handler(result_updated_event(), None)
+
+	assert saved_indexes == []
@@ -0,0 +1,30 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+import importlib
+
+from api.routers import models
+
+
+def test_enabled_spectral_indices_are_image_types(monkeypatch):
+	monkeypatch.setenv("SPECTRAL_INDICES", "ndre, ndwi")
+	try:
+		reloaded = importlib.reload(models)
+		assert [image_type.value for image_type in reloaded.ImageType] == ["rgb", "ndvi", "ndvi_raw", "ndvi_change", "scl", "ndre", "ndwi"]
+		# every image type but rgb and scl is rendered as an index
+		assert reloaded.INDEX_STYLES["ndwi"] == reloaded.IndexStyle()
+	finally:
+		monkeypatch.delenv("SPECTRAL_INDICES")
+		importlib.reload(models)
+
+
+def test_no_spectral_index_is_served_by_default():
+	assert [image_type.value for image_type in models.ImageType] == ["rgb", "ndvi", "ndvi_raw", "ndvi_change", "scl"]
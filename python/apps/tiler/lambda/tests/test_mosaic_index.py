@@ -0,0 +1,69 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from rio_tiler.constants import WEB_MERCATOR_TMS as tms
+
+from api.backend.mosaic_index import RegionMosaicIndex
+
+
+@pytest.fixture
+def index(item_factory):
+	items = [
+		item_factory("01j0result2", "polygon1", [10.5, 45.0, 10.55, 45.05], datetime="2024-06-02T00:00:00+00:00"),
+		item_factory("01j0result1", "polygon2", [10.0, 45.0, 10.05, 45.05], datetime="2024-06-01T00:00:00+00:00"),
+	]
+	return RegionMosaicIndex.from_items("01j0regionid", items, tms, 12)
+
+
+def ids(features):
+	return [f["id"] for f in features]
+
+
+def test_features_for_tile_at_the_quadkey_zoom(index):
+	tile = tms.tile(10.52, 45.02, 12)
+	assert ids(index.features_for_tile(tms, tile.x, tile.y, 12)) == ["01j0result2_polygon1"]
+
+
+def test_features_for_tile_above_the_quadkey_zoom_uses_the_children(index):
+	tile = tms.tile(10.3, 45.02, 8)
+	# latest first, whatever the order of the child quadkeys
+	assert ids(index.features_for_tile(tms, tile.x, tile.y, 8)) == ["01j0result2_polygon1", "01j0result1_polygon2"]
+
+
+def test_features_for_tile_below_the_quadkey_zoom_uses_the_parent(index):
+	tile = tms.tile(10.02, 45.02, 15)
+	assert ids(index.features_for_tile(tms, tile.x, tile.y, 15)) == ["01j0result1_polygon2"]
+
+
+def test_features_for_tile_outside_the_region(index):
+	tile = tms.tile(-70.0, -30.0, 10)
+	assert index.features_for_tile(tms, tile.x, tile.y, 10) == []
+
+
+def test_round_trip(index):
+	loaded = RegionMosaicIndex.from_dict(index.to_dict())
+	assert loaded.version == index.version
+	assert loaded.latest_datetime == datetime(2024, 6, 2, tzinfo=timezone.utc)
+	assert loaded.mosaic.tiles == index.mosaic.tiles
+	assert loaded.items == index.items
+
+
+def test_is_valid_for(index, monkeypatch):
+	assert index.is_valid_for(None)
+	assert index.is_valid_for(datetime(2024, 6, 3, tzinfo=timezone.utc))
+	# a view of the region before the latest result is not what the index holds
+	assert not index.is_valid_for(datetime(2024, 6, 1, 12, tzinfo=timezone.utc))
+
+	index.created_at = datetime.now(timezone.utc) - timedelta(days=2)
+	assert not index.is_valid_for(None)
@@ -0,0 +1,79 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+from api.routers import stac
+from api.routers.models import CommonFilterQueryParams, ImageType, ThumbnailType, TileFormat
+from api.tile_cache import TileCache
+
+
+@pytest.fixture
+def backend(monkeypatch, item_factory):
+	backend = SimpleNamespace(searches=0, tile_reads=1)
+
+	def features_for_tile(x, y, z):
+		backend.searches += 1
+		return [item_factory("01j0resultid", "polygon1", [10.0, 45.0, 10.1, 45.1])]
+
+	backend.features_for_tile = features_for_tile
+
+	@contextmanager
+	def tile_backend(filter_params, aws_auth):
+		yield backend
+
+	monkeypatch.setattr(stac, "tile_backend", tile_backend)
+	monkeypatch.setattr(stac, "tile_cache", TileCache(stac.api_settings))
+	monkeypatch.setattr(stac, "render_tile", lambda mosaic, x, y, z, image_type, tilesize, tile_format: b"png")
+	return backend
+
+
+def get_tile(if_none_match=None):
+	return stac.get_tile(
+		12, 2150, 1460, image_type=ImageType.ndvi, filter_params=CommonFilterQueryParams(timestamp=None), tilesize=512,
+		tile_format=TileFormat.png, accept=None, if_none_match=if_none_match, aws_auth=None,
+	)
+
+
+def test_cached_tiles_are_validated_without_a_search(backend):
+	rendered = get_tile()
+	assert rendered.status_code == 200
+	assert backend.searches == 1
+
+	etag = rendered.headers["ETag"]
+	assert get_tile(if_none_match=etag).status_code == 304
+	cached = get_tile()
+	assert cached.headers["ETag"] == etag
+	assert cached.headers[stac.TILE_CACHE_HEADER] == "hit-memory"
+	assert backend.searches == 1
+
+
+def test_thumbnails_are_revalidated(monkeypatch):
+	feature = {"assets": {"rgb_thumbnail": {"href": "s3://bucket/thumbnail.png", "type": "image/png"}}}
+	monkeypatch.setattr(stac, "fetch_feature", lambda **kwargs: feature)
+	s3 = SimpleNamespace(get_object=lambda Bucket, Key: {"Body": SimpleNamespace(read=lambda: b"png")})
+	monkeypatch.setattr(stac, "get_client", lambda service: s3)
+
+	def get_thumbnail(if_none_match=None):
+		return stac.get_thumbnail(
+			collection_id="agie-polygon", item_id="item", image_type=ThumbnailType.rgb, if_none_match=if_none_match, aws_auth=None
+		)
+
+	thumbnail = get_thumbnail()
+	assert thumbnail.status_code == 200
+	assert thumbnail.body == b"png"
+	assert thumbnail.headers["Cache-Control"] == stac.api_settings.cache_control
+	revalidated = get_thumbnail(if_none_match=thumbnail.headers["ETag"])
+	assert revalidated.status_code == 304
+	assert revalidated.body == b""
@@ -0,0 +1,59 @@
+#   Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance
+#   with the License. A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES
+#   OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions
+#   and limitations under the License.
+
+from datetime import datetime, timedelta, timezone
+
+from botocore.exceptions import ClientError
+
+from api import tile_cache
+from api.settings import ApiSettings
+from api.tile_cache import CachedTile, TileCache, tile_cache_key
+
+
+def test_tile_cache_key_is_deterministic():
+	timestamp = datetime(2024, 6, 1, 12, tzinfo=timezone.utc)
+
+	assert tile_cache_key(z=1, x=2, y=3, timestamp=timestamp) == tile_cache_key(y=3, x=2, z=1, timestamp=timestamp)
+	# the same instant in another timezone is the same tile, unset parameters are left out
+	assert tile_cache_key(timestamp=timestamp) == tile_cache_key(timestamp=timestamp.astimezone(timezone(timedelta(hours=2))), region_id=None)
+	assert tile_cache_key(z=1) != tile_cache_key(z=2)
+
+
+def test_shared_tier_keeps_the_etag_of_the_tile(tmp_path):
+	settings = ApiSettings(tile_cache_dir=str(tmp_path))
+	TileCache(settings).set("key", CachedTile(b"png", "image/png", '"etag"'))
+
+	# a new process only finds the tile in the shared tier, it is then kept in memory
+	cache = TileCache(settings)
+	assert cache.get("key") == (CachedTile(b"png", "image/png", '"etag"'), "hit-shared")
+	assert cache.get("key") == (CachedTile(b"png", "image/png", '"etag"'), "hit-memory")
+	assert cache.get("other") == (None, "miss")
+
+
+def test_shared_tier_entries_expire(tmp_path):
+	settings = ApiSettings(tile_cache_dir=str(tmp_path), tile_cache_ttl=-1)
+	TileCache(settings).set("key", CachedTile(b"png", "image/png"))
+
+	assert TileCache(settings).shared.get("key") is None
+
+
+class FailingS3Client:
+	def put_object(self, **kwargs):
+		raise ClientError({"Error": {"Code": "AccessDenied", "Message": "Access Denied"}}, "PutObject")
+
+
+def test_shared_tier_failures_do_not_fail_the_tile(monkeypatch):
+	monkeypatch.setattr(tile_cache, "get_client", lambda service_name: FailingS3Client())
+	cache = TileCache(ApiSettings(tile_cache_bucket="bucket"))
+
+	cache.set("key", CachedTile(b"png", "image/png"))
+
+	assert cache.get("key") == (CachedTile(b"png", "image/png"), "hit-memory")
@@ -66,6 +66,7 @@ export class StacUtil {
 				startDateTime: ow.string.nonEmpty,
 				endDateTime: ow.string.nonEmpty,
 				engineOutputLocation: ow.string.nonEmpty,
+				summary: ow.optional.object,
 			})
 		);
 		const stacItem = new DefaultStacRecords().defaultStacItem;
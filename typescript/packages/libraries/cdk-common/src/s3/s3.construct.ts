@@ -24,6 +24,10 @@ export interface S3ConstructProperties {
 	bucketName: string;
 	cdkResourceNamePrefix: string;
 	deleteBucket: boolean;
+	/**
+	 * Expiration rules of the prefixes holding short lived objects (e.g. caches)
+	 */
+	lifecycleRules?: s3.LifecycleRule[];
 }
 export class S3 extends Construct {
 	public readonly bucketName: string;
@@ -48,6 +52,7 @@ export class S3 extends Construct {
 			versioned: !props.deleteBucket,
 			serverAccessLogsPrefix: 'access-logs/',
 			removalPolicy: props.deleteBucket ? RemovalPolicy.DESTROY : RemovalPolicy.RETAIN,
+			lifecycleRules: props.lifecycleRules,
 		});
 
 		this.bucketArn = bucket.bucketArn;
@@ -401,6 +401,47 @@ export interface polygonProcessingDetails {
      * The S3 key of the metadata output of the job
      */
     engineOutputLocation?: string;
+    /**
+     * Summary of the metadata output, lets consumers skip fetching the metadata output for the common fields
+     */
+    summary?: polygonProcessingSummary;
+}
+
+export interface polygonProcessingBandStatistics {
+    minimum: number;
+    maximum: number;
+    mean: number;
+    stddev: number;
+    validPercent?: number;
+}
+
+export interface polygonProcessingSummary {
+    /**
+     * The version of the summary schema
+     */
+    version: number;
+    areaSize: number;
+    areaUnitOfMeasure: string;
+    /**
+     * The ids of the satellite scenes the result is derived from
+     */
+    sceneIds?: string[];
+    /**
+     * Statistics keyed by band (e.g. ndvi, ndvi_change)
+     */
+    bands?: Record<string, polygonProcessingBandStatistics>;
+    ndviHistogram?: {
+        buckets: number[];
+        bucketCount: number[];
+    };
+    /**
+     * Duration of each processing step in seconds
+     */
+    timings?: Record<string, number>;
+    /**
+     * Set when optional sections were dropped to keep the event within the size limit
+     */
+    truncated?: boolean;
 }
 
 export interface catalogDetails {